@@ -0,0 +1,346 @@
+"""
+This script runs several election prediction configurations in one invocation. Each run is keyed by election year,
+poll set and model variant, and writes its outputs into its own namespace: <output_dir>/<year>/<poll_set>/<variant>/.
+
+Stages shared between runs (the post-stratification table, reference election results, the hex map and the cell
+estimates of each model) go through a cache keyed by the stage name, the signatures of its input files and its
+parameters. A stage is computed once per invocation and reused from disk by later invocations until one of its inputs
+changes.
+
+Example configuration (see run_config.json):
+{
+    "output_dir": "../output/runs",
+    "cache_dir": "../output/cache",
+    "shared": {"post_strat": ..., "ecollege": ..., "turnout": ..., "hex_map": ..., "feeds_dir": ...,
+               "history_dir": ...},
+    "runs": [{"year": "2020", "poll_set": "harvard", "variant": "mrp", "prop_scores": ...}, ...]
+}
+"""
+
+import argparse
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+import eval as ev
+import helper as utl
+import history_store as hs
+import post_strat as ps
+
+VARIANTS = ["mrp", "ml", "blend"]
+
+
+def new_cache(cache_dir=None):
+    """
+    Creates an empty stage cache.
+    :param cache_dir: Optional directory used to persist stage results between invocations (default: None).
+    :type cache_dir: str | None
+    :return: Cache with in-memory results and hit/miss counters.
+    :rtype: dict
+    """
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+    return {"dir": cache_dir, "memory": {}, "hits": 0, "misses": 0}
+
+
+def file_signature(filepath):
+    """
+    Identifies a version of an input file by its absolute path, size and modification time.
+    :param filepath: Path to the file.
+    :type filepath: str
+    :return: File signature.
+    :rtype: list
+    """
+    stat = os.stat(filepath)
+    return [os.path.abspath(filepath), stat.st_size, stat.st_mtime_ns]
+
+
+def stage_key(stage, files=(), params=None, deps=()):
+    """
+    Builds the cache key for a stage from its input files, parameters and the keys of upstream stages.
+    :param stage: Name of the stage.
+    :type stage: str
+    :param files: Paths to input files read by the stage.
+    :type files: list | tuple
+    :param params: JSON-serializable stage parameters (default: None).
+    :type params: dict | None
+    :param deps: Cache keys of upstream stages.
+    :type deps: list | tuple
+    :return: Cache key.
+    :rtype: str
+    """
+    payload = json.dumps(
+        {
+            "files": [file_signature(filepath) for filepath in files],
+            "params": params,
+            "deps": list(deps),
+        },
+        sort_keys=True,
+        default=str,
+    )
+    return f"{stage}-{hashlib.sha1(payload.encode('utf-8')).hexdigest()[:16]}"
+
+
+def run_stage(cache, stage, func, files=(), params=None, deps=(), persist=True):
+    """
+    Returns a cached stage result, computing and storing it on a miss.
+    :param cache: Stage cache from new_cache.
+    :type cache: dict
+    :param stage: Name of the stage.
+    :type stage: str
+    :param func: Zero-argument callable that computes the stage result.
+    :type func: callable
+    :param files: Paths to input files read by the stage.
+    :type files: list | tuple
+    :param params: JSON-serializable stage parameters (default: None).
+    :type params: dict | None
+    :param deps: Cache keys of upstream stages.
+    :type deps: list | tuple
+    :param persist: Whether to write the result to the cache directory (default: True).
+    :type persist: bool
+    :return: Cache key and stage result.
+    :rtype: tuple
+    """
+    key = stage_key(stage, files, params, deps)
+    if key in cache["memory"]:
+        cache["hits"] += 1
+        return key, cache["memory"][key]
+    cache_path = None
+    if cache["dir"] is not None and persist:
+        cache_path = os.path.join(cache["dir"], f"{key}.pkl")
+        if os.path.exists(cache_path):
+            cache["hits"] += 1
+            cache["memory"][key] = pd.read_pickle(cache_path)
+            return key, cache["memory"][key]
+    cache["misses"] += 1
+    result = func()
+    if cache_path is not None:
+        pd.to_pickle(result, cache_path)
+    cache["memory"][key] = result
+    return key, result
+
+
+def run_name(run):
+    """
+    Builds the namespace of a run from its election year, poll set and model variant.
+    :param run: Run configuration.
+    :type run: dict
+    :return: Relative output path of the run.
+    :rtype: str
+    """
+    return os.path.join(str(run["year"]), run["poll_set"], run["variant"])
+
+
+def build_cell_estimates(run):
+    """
+    Loads the cell estimates of a run and combines them according to its model variant.
+    :param run: Run configuration.
+    :type run: dict
+    :return: Cell estimates with the probability of voting for Trump in an "estimate" column.
+    :rtype: pandas dataframe
+    """
+    estimates = ps.read_cells(run["prop_scores"])
+    if run["variant"] == "mrp":
+        estimates["estimate"] = estimates["mrp_subgroup_estimate"]
+        return estimates
+
+    # Machine learning predictions are made per demographic cell, without state
+    ml_preds = ps.read_cells(run["ml_preds"])
+    cell_cols = [col for col in ps.CELL_COLS if col in ml_preds.columns]
+    estimates = pd.merge(
+        estimates,
+        ml_preds[cell_cols + [run.get("ml_col", "predicted_vote")]],
+        on=cell_cols,
+        how="left",
+    )
+    ml_pred = ps.fill_ml_estimates(
+        estimates,
+        run.get("ml_col", "predicted_vote"),
+        "mrp_subgroup_estimate",
+        zero_divisor=run.get("zero_divisor", 10),
+        one_divisor=run.get("one_divisor", 4),
+    )
+    if run["variant"] == "ml":
+        estimates["estimate"] = ml_pred
+    else:
+        mrp_weight = run.get("mrp_weight", 0.6)
+        estimates["estimate"] = (
+            mrp_weight * estimates["mrp_subgroup_estimate"] + (1 - mrp_weight) * ml_pred
+        )
+    return estimates
+
+
+def evaluate_run(cache, run, state_pred):
+    """
+    Scores a run's state predictions against actual results when the run configuration provides them.
+    :param cache: Stage cache from new_cache.
+    :type cache: dict
+    :param run: Run configuration.
+    :type run: dict
+    :param state_pred: State predictions from predict_states.
+    :type state_pred: pandas dataframe
+    :return: Output tables keyed by file name.
+    :rtype: dict
+    """
+    outputs = {}
+    if run.get("actual_results"):
+        _, actual_results = run_stage(
+            cache,
+            "actual_results",
+            lambda: pd.read_csv(run["actual_results"]),
+            files=[run["actual_results"]],
+        )
+        actual_results = actual_results[
+            actual_results["State"].isin(state_pred["state"])
+        ].reset_index(drop=True)
+        aligned = (
+            state_pred.set_index("state")
+            .reindex(actual_results["State"])
+            .reset_index(drop=True)
+        )
+        outcomes, accuracy_matrix = ev.evaluate_accuracy(
+            actual_results, {run["variant"]: aligned}
+        )
+        outputs["accuracy_outcomes.csv"] = outcomes
+        outputs["accuracy_matrix.csv"] = accuracy_matrix
+    if run.get("actual_margins"):
+        _, actual_margin = run_stage(
+            cache,
+            "actual_margins",
+            lambda: ev.load_actual_margins(run["actual_margins"]),
+            files=[run["actual_margins"]],
+        )
+        outputs["model_eval.csv"] = ev.evaluate_margins(
+            actual_margin,
+            {run["variant"]: state_pred.rename(columns={"state": "State"})},
+        )
+    return outputs
+
+
+def execute_run(cache, shared, run, output_dir):
+    """
+    Executes a single run configuration, reusing cached shared stages, and writes its outputs.
+    :param cache: Stage cache from new_cache.
+    :type cache: dict
+    :param shared: Paths to reference data shared by every run.
+    :type shared: dict
+    :param run: Run configuration.
+    :type run: dict
+    :param output_dir: Root directory for run outputs.
+    :type output_dir: str
+    :return: Summary of the run.
+    :rtype: dict
+    """
+    if run["variant"] not in VARIANTS:
+        raise ValueError(f"Unknown model variant: {run['variant']}")
+    run_dir = os.path.join(output_dir, run_name(run))
+    os.makedirs(run_dir, exist_ok=True)
+
+    strat_files = [shared["post_strat"], shared["ecollege"], shared["turnout"]]
+    strat_key, strat = run_stage(
+        cache, "strat_table", lambda: ps.build_strat_table(*strat_files), strat_files
+    )
+    estimate_files = [run["prop_scores"]] + (
+        [run["ml_preds"]] if run["variant"] != "mrp" else []
+    )
+    estimate_params = {
+        k: run.get(k)
+        for k in ["variant", "ml_col", "zero_divisor", "one_divisor", "mrp_weight"]
+    }
+    estimate_key, estimates = run_stage(
+        cache,
+        "cell_estimates",
+        lambda: build_cell_estimates(run),
+        estimate_files,
+        estimate_params,
+    )
+    turnout = run.get("turnout", "sex")
+    _, state_pred = run_stage(
+        cache,
+        "state_pred",
+        lambda: ps.predict_states(strat, estimates, "estimate", turnout=turnout),
+        params={"turnout": turnout},
+        deps=[strat_key, estimate_key],
+    )
+    state_pred.to_csv(os.path.join(run_dir, "final_pred_elec.csv"), index=False)
+
+    for filename, table in evaluate_run(cache, run, state_pred).items():
+        table.to_csv(os.path.join(run_dir, filename))
+
+    if run.get("render_map"):
+        # Map rendering pulls in geopandas and matplotlib, so it is only imported when a run asks for it
+        import map_viz_gen as mp
+
+        _, us_hex_map = run_stage(
+            cache,
+            "hex_map",
+            lambda: mp.prep_map_data(shared["hex_map"]),
+            files=[shared["hex_map"]],
+            persist=False,
+        )
+        us_hex_map = mp.merge_and_encode_wins(
+            us_hex_map, state_pred.set_index("state"), pred=True
+        )
+        mp.build_plot(us_hex_map, os.path.join(run_dir, "hexbin.svg"), show=False)
+
+    if run.get("publish_feed") and shared.get("feeds_dir"):
+        import map_viz_gen as mp
+
+        mp.build_results_feed(
+            state_pred.set_index("state"),
+            os.path.join(shared["feeds_dir"], f"{run_name(run)}.json"),
+            run_name(run).replace(os.sep, "/"),
+            pred=True,
+        )
+
+    if shared.get("history_dir"):
+        hs.append_run(
+            state_pred,
+            run_name(run).replace(os.sep, "/"),
+            run,
+            store_dir=shared["history_dir"],
+        )
+
+    utl.write_json(os.path.join(run_dir, "run_config.json"), run)
+    summary = {"run": run_name(run), **ps.electoral_votes(state_pred)}
+    print(f"Finished {summary['run']}: {summary}")
+    return summary
+
+
+def run_batch(config):
+    """
+    Executes every run in a batch configuration with a shared stage cache.
+    :param config: Batch configuration with output_dir, optional cache_dir, shared paths and a list of runs.
+    :type config: dict
+    :return: Summary of every run.
+    :rtype: pandas dataframe
+    """
+    cache = new_cache(config.get("cache_dir"))
+    output_dir = config.get("output_dir", "../output/runs")
+    summaries = [
+        execute_run(cache, config["shared"], run, output_dir) for run in config["runs"]
+    ]
+    summary = pd.DataFrame(summaries)
+    summary.to_csv(os.path.join(output_dir, "runs_summary.csv"), index=False)
+    print(f"Cache hits: {cache['hits']}, misses: {cache['misses']}")
+    return summary
+
+
+def main():
+    """
+    Entry point for the script.
+    :return: None.
+    :rtype: None.
+    """
+    parser = argparse.ArgumentParser(
+        description="Run several prediction configurations."
+    )
+    parser.add_argument("config", nargs="?", default="run_config.json")
+    args = parser.parse_args()
+    run_batch(utl.read_json(args.config))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+"""
+This script searches for the best blend of cell-level estimates from several models, e.g. MRP and machine learning
+predictions from different poll waves. The notebook blends them by hand (bothScores as a fixed weighted mean of
+mrp_subgroup_estimate and the ML wave predictions, with MRP filling missing and exact 0 or 1 ML predictions).
+
+Cell estimates are aligned once and summed into expected Trump votes per state, demographic group and source model.
+Because a blend is linear in the cell estimates, the state outcome of every candidate weighting is then a single
+tensor contraction of these sums with the candidate weight matrix, so thousands of candidates are scored without
+re-merging or re-aggregating cells. Weights can be global (one weight per source) or vary by demographic group.
+
+Candidates are chosen on a set of fit states and their scores on the remaining, held-out states are reported.
+"""
+
+import itertools
+import os
+
+import numpy as np
+import pandas as pd
+
+import post_strat as ps
+import state_keys as sk
+
+
+def align_estimates(strat, sources, estimate_col="mrp_subgroup_estimate"):
+    """
+    Joins the estimates of each source model onto the post-stratification table.
+    :param strat: Post-stratification table from post_strat.build_strat_table.
+    :type strat: pandas dataframe
+    :param sources: Cell estimates keyed by source name. Each table is keyed by the post_strat.CELL_COLS it contains,
+        so national estimates without STATEFIP apply to every state.
+    :type sources: dict of pandas dataframes
+    :param estimate_col: Column holding each source's estimate, or a dict of columns keyed by source name (default:
+        mrp_subgroup_estimate).
+    :type estimate_col: str | dict
+    :return: Post-stratification table with one estimate column per source, named after the source.
+    :rtype: pandas dataframe
+    """
+    cells = strat
+    for name, estimates in sources.items():
+        col = estimate_col[name] if isinstance(estimate_col, dict) else estimate_col
+        keys = [c for c in ps.CELL_COLS if c in estimates.columns]
+        cells = pd.merge(
+            cells,
+            estimates[keys + [col]].rename(columns={col: name}),
+            on=keys,
+            how="left",
+        )
+    return cells
+
+
+def fill_sources(cells, source_cols, zero_divisor=10, one_divisor=4):
+    """
+    Fills and rescales the estimates of every source after the first with the first source, following the notebook's
+    edge-case handling (see post_strat.fill_ml_estimates).
+    :param cells: Aligned estimates from align_estimates.
+    :type cells: pandas dataframe
+    :param source_cols: Source columns; the first one (usually MRP) is used as the fallback.
+    :type source_cols: list
+    :param zero_divisor: Estimates of exactly 0 become the fallback divided by this value (default: 10).
+    :type zero_divisor: float
+    :param one_divisor: Estimates of exactly 1 become 1 minus the fallback divided by this value (default: 4).
+    :type one_divisor: float
+    :return: Estimates, one row per cell and one column per source.
+    :rtype: numpy array
+    """
+    base = source_cols[0]
+    filled = [cells[base].to_numpy(dtype=np.float64)]
+    for col in source_cols[1:]:
+        filled.append(
+            ps.fill_ml_estimates(cells, col, base, zero_divisor, one_divisor).to_numpy(
+                dtype=np.float64
+            )
+        )
+    return np.column_stack(filled)
+
+
+def aggregate(cells, source_cols, group_col=None, turnout="sex"):
+    """
+    Sums expected Trump votes by state, demographic group and source.
+    :param cells: Aligned estimates from align_estimates.
+    :type cells: pandas dataframe
+    :param source_cols: Source columns to blend.
+    :type source_cols: list
+    :param group_col: Column whose levels get their own blend weights, e.g. age_recoded (default: one global group).
+    :type group_col: str | None
+    :param turnout: Turnout assumption passed to post_strat.turnout_weights (default: sex).
+    :type turnout: str
+    :return: Trump votes by state, group and source (states x groups x sources), expected voters by state and the
+        group levels.
+    :rtype: tuple
+    """
+    cells = cells.dropna(subset=[source_cols[0]])
+    estimates = fill_sources(cells, source_cols)
+    voters = ps.turnout_weights(cells, turnout)
+    state = sk.state_index(cells["STATEFIP"])
+    if group_col is None:
+        group, levels = np.zeros(len(cells), dtype=np.int64), ["all"]
+    else:
+        group, levels = pd.factorize(cells[group_col], sort=True)
+        levels = list(levels)
+    n_states, n_groups = len(sk.STATES), len(levels)
+
+    flat = state * n_groups + group
+    trump = np.column_stack(
+        [
+            np.bincount(
+                flat, weights=voters * estimates[:, k], minlength=n_states * n_groups
+            )
+            for k in range(len(source_cols))
+        ]
+    ).reshape(n_states, n_groups, len(source_cols))
+    total = np.bincount(state, weights=voters, minlength=n_states)
+    return trump, total, levels
+
+
+def simplex_grid(n_sources, step=0.05):
+    """
+    Lists every weighting of the sources on a regular grid, with non-negative weights summing to 1.
+    :param n_sources: Number of sources.
+    :type n_sources: int
+    :param step: Grid resolution (default: 0.05).
+    :type step: float
+    :return: One row of weights per candidate.
+    :rtype: numpy array
+    """
+    if n_sources == 1:
+        return np.ones((1, 1))
+    units = int(round(1 / step))
+    # Stars and bars: each choice of n_sources - 1 bar positions splits the units among the sources
+    bars = np.array(
+        list(itertools.combinations(range(units + n_sources - 1), n_sources - 1)),
+        dtype=np.int64,
+    ).reshape(-1, n_sources - 1)
+    edges = np.column_stack(
+        [np.full(len(bars), -1), bars, np.full(len(bars), units + n_sources - 1)]
+    )
+    return (np.diff(edges, axis=1) - 1) / units
+
+
+def random_candidates(n_sources, n_candidates, n_groups=1, seed=13):
+    """
+    Draws random weightings of the sources, separately for each group, uniformly over the simplex.
+    :param n_sources: Number of sources.
+    :type n_sources: int
+    :param n_candidates: Number of candidates.
+    :type n_candidates: int
+    :param n_groups: Number of groups with their own weights (default: 1).
+    :type n_groups: int
+    :param seed: Random seed (default: 13).
+    :type seed: int
+    :return: Weights of shape candidates x groups x sources.
+    :rtype: numpy array
+    """
+    rng = np.random.default_rng(seed)
+    return rng.dirichlet(np.ones(n_sources), size=(n_candidates, n_groups))
+
+
+def blend_shares(trump, total, weights):
+    """
+    Computes Trump's two-party share in every state under every candidate weighting.
+    :param trump: Trump votes by state, group and source from aggregate.
+    :type trump: numpy array
+    :param total: Expected voters by state from aggregate.
+    :type total: numpy array
+    :param weights: Candidate weights, either candidates x sources (shared by all groups) or candidates x groups x
+        sources.
+    :type weights: numpy array
+    :return: Trump's share, one row per state and one column per candidate.
+    :rtype: numpy array
+    """
+    if weights.ndim == 2:
+        votes = np.einsum("sgk,nk->sn", trump, weights)
+    else:
+        votes = np.einsum("sgk,ngk->sn", trump, weights)
+    safe_total = np.where(total > 0, total, 1.0)[:, None]
+    return np.where(total[:, None] > 0, votes / safe_total, np.nan)
+
+
+def score_candidates(shares, trump_won, e_votes, mask, actual_margin=None):
+    """
+    Scores every candidate on a subset of states.
+    :param shares: Trump's share by state and candidate from blend_shares.
+    :type shares: numpy array
+    :param trump_won: Whether Trump won each state, in state_keys order.
+    :type trump_won: numpy array
+    :param e_votes: Electoral votes of each state, in state_keys order.
+    :type e_votes: numpy array
+    :param mask: States to score.
+    :type mask: numpy array of bool
+    :param actual_margin: Actual (Biden - Trump) / total margins in state_keys order (default: None).
+    :type actual_margin: numpy array | None
+    :return: One row per candidate with states called correctly, accuracy, Trump's electoral votes, electoral vote
+        error, the total distance from 50% of wrong calls and, with actual margins, the margin MSE.
+    :rtype: pandas dataframe
+    """
+    shares, trump_won, e_votes = shares[mask], trump_won[mask], e_votes[mask]
+    call = shares > 0.5
+    correct = call == trump_won[:, None]
+    scores = pd.DataFrame(
+        {
+            "states_correct": correct.sum(axis=0),
+            "accuracy": correct.mean(axis=0),
+            "trump_ev": (call * e_votes[:, None]).sum(axis=0).astype(int),
+            "ev_error": np.abs(
+                (call * e_votes[:, None]).sum(axis=0) - (trump_won * e_votes).sum()
+            ).astype(int),
+            "wrong_call_distance": np.where(correct, 0, np.abs(shares - 0.5)).sum(
+                axis=0
+            ),
+        }
+    )
+    if actual_margin is not None:
+        margin = 1 - 2 * shares
+        scores["margin_mse"] = ((margin - actual_margin[mask][:, None]) ** 2).mean(
+            axis=0
+        )
+    return scores
+
+
+def optimize_blend(
+    trump, total, weights, trump_won, e_votes, fit_mask, actual_margin=None
+):
+    """
+    Picks the candidate weighting that scores best on the fit states and reports it on the held-out states. Candidates
+    are ranked by margin MSE when actual margins are given, and otherwise by states called correctly, then by how
+    narrowly the wrong calls were missed.
+    :param trump: Trump votes by state, group and source from aggregate.
+    :type trump: numpy array
+    :param total: Expected voters by state from aggregate.
+    :type total: numpy array
+    :param weights: Candidate weights for blend_shares.
+    :type weights: numpy array
+    :param trump_won: Whether Trump won each state, in state_keys order.
+    :type trump_won: numpy array
+    :param e_votes: Electoral votes of each state, in state_keys order.
+    :type e_votes: numpy array
+    :param fit_mask: States used to choose the blend; the others are held out.
+    :type fit_mask: numpy array of bool
+    :param actual_margin: Actual margins in state_keys order (default: None).
+    :type actual_margin: numpy array | None
+    :return: Index of the best candidate, and fit and held-out scores of every candidate.
+    :rtype: tuple
+    """
+    shares = blend_shares(trump, total, weights)
+    covered = ~np.isnan(shares[:, 0])
+    fit_mask, held_out = fit_mask & covered, ~fit_mask & covered
+    fit = score_candidates(shares, trump_won, e_votes, fit_mask, actual_margin)
+    held = score_candidates(shares, trump_won, e_votes, held_out, actual_margin)
+    if actual_margin is not None:
+        order = np.argsort(fit["margin_mse"].to_numpy(), kind="stable")
+    else:
+        order = np.lexsort(
+            (fit["wrong_call_distance"].to_numpy(), -fit["states_correct"].to_numpy())
+        )
+    return int(order[0]), fit, held
+
+
+def state_outputs(trump, total, weights, e_votes=None):
+    """
+    Calls every state under one weighting, in the format of post_strat.predict_states.
+    :param trump: Trump votes by state, group and source from aggregate.
+    :type trump: numpy array
+    :param total: Expected voters by state from aggregate.
+    :type total: numpy array
+    :param weights: Weights of one candidate (sources, or groups x sources).
+    :type weights: numpy array
+    :param e_votes: Electoral votes of each state, in state_keys order, added as state_votes (default: None).
+    :type e_votes: numpy array | None
+    :return: One row per state with predicted votes, state call (1 = Trump) and margin.
+    :rtype: pandas dataframe
+    """
+    share = blend_shares(trump, total, weights[None])[:, 0]
+    state_pred = sk.state_table().rename(
+        columns={"STATE_NAME": "state", "STATEFP": "STATEFIP"}
+    )
+    state_pred["trump_votes_states"] = share * total
+    state_pred["biden_votes_states"] = (1 - share) * total
+    state_pred["state_pred"] = np.where(share > 0.5, 1, 0)
+    state_pred["margin_trump"] = 1 - 2 * share
+    if e_votes is not None:
+        state_pred["state_votes"] = np.asarray(e_votes).astype(int)
+    return state_pred[total > 0].reset_index(drop=True)
+
+
+def main():
+    """
+    Entry point for the script.
+    :return: None.
+    :rtype: None.
+    """
+    strat = ps.build_strat_table(
+        "../data/post_stratification_data_by_state.csv",
+        "../data/2020_ecollege_rep.csv",
+        "../data/turnout_by_state.csv",
+    )
+    sources = {
+        "mrp_harvard": ps.read_cells(
+            "../data/new_prop_scores_include_harvard_FINAL.csv"
+        ),
+        "mrp_all": ps.read_cells("../data/new_prop_scores_all.csv"),
+        "mrp_no_comet": ps.read_cells("../data/prop_scores_2020_no_comet.csv"),
+    }
+    estimate_col = {name: "mrp_subgroup_estimate" for name in sources}
+    # Bootstrapped ML cell predictions from ml_bootstrap.py join the blend when they have been computed
+    if os.path.exists("../data/ml_cell_estimates_aug_2020.csv"):
+        sources["ml_aug"] = ps.read_cells("../data/ml_cell_estimates_aug_2020.csv")
+        estimate_col["ml_aug"] = "ml_subgroup_estimate"
+    cells = align_estimates(strat, sources, estimate_col)
+
+    actual = pd.read_csv("../data/2020_electoral_results.csv", nrows=51)
+    index = sk.state_index(actual["State"])
+    trump_won = np.zeros(len(sk.STATES), dtype=bool)
+    trump_won[index] = actual["trump"] > actual["biden"]
+    e_votes = np.zeros(len(sk.STATES))
+    e_votes[index] = actual["state_votes"]
+    # Hold out a third of the states to check that the chosen blend generalizes
+    fit_mask = np.random.default_rng(13).random(len(sk.STATES)) > 1 / 3
+
+    source_cols = list(sources)
+    runs = {
+        "global": (None, simplex_grid(len(source_cols), step=0.02)),
+        "by_age": (
+            "age_recoded",
+            random_candidates(len(source_cols), 5000, n_groups=3),
+        ),
+    }
+    os.makedirs("../output", exist_ok=True)
+    for name, (group_col, weights) in runs.items():
+        trump, total, levels = aggregate(cells, source_cols, group_col)
+        best, fit, held = optimize_blend(
+            trump, total, weights, trump_won, e_votes, fit_mask
+        )
+        scores = fit.join(held, lsuffix="_fit", rsuffix="_held_out")
+        flat = weights.reshape(len(weights), -1)
+        weight_cols = [
+            f"w_{level}_{source}" for level in levels for source in source_cols
+        ]
+        if weights.ndim == 2:
+            weight_cols = [f"w_{source}" for source in source_cols]
+        scores = pd.concat([pd.DataFrame(flat, columns=weight_cols), scores], axis=1)
+        scores.to_csv(f"../output/blend_candidates_{name}.csv", index=False)
+        state_pred = state_outputs(trump, total, weights[best], e_votes)
+        state_pred.to_csv(f"../output/blend_state_pred_{name}.csv", index=False)
+        print(f"{name}: evaluated {len(weights)} candidates")
+        print(scores.iloc[best])
+        print(ps.electoral_votes(state_pred))
+
+
+if __name__ == "__main__":
+    main()
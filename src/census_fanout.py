@@ -0,0 +1,476 @@
+"""
+This script fans Census API requests out over child geographies (counties or tracts within every state) so
+post-stratification tables can be built below the state level.
+
+Requests are split into chunks of one parent geography and one batch of variables. Chunks are fetched concurrently with
+asyncio, bounded by a maximum number of requests in flight and a maximum request rate. Every completed chunk is written
+straight to its own Parquet file and recorded in a manifest, so an interrupted run picks up where it stopped without
+refetching finished chunks. The endpoint is a parameter, so the fan-out can be run against a local mock server.
+
+This product uses the Census Bureau Data API but is not endorsed or certified by the Census Bureau.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+
+import pandas as pd
+import requests
+
+from census_getter import CENSUS_ENDPOINT
+
+# The Census API accepts at most 50 variables per request
+VAR_BATCH_SIZE = 49
+
+# HTTP status codes worth retrying after a pause
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+MANIFEST_NAME = "manifest.jsonl"
+
+
+def batch_variables(variables, batch_size=VAR_BATCH_SIZE):
+    """
+    Splits a list of Census variables into batches small enough for a single request.
+    :param variables: Census variable codes.
+    :type variables: list
+    :param batch_size: Maximum number of variables per request (default: VAR_BATCH_SIZE).
+    :type batch_size: int
+    :return: Batches of variable codes.
+    :rtype: list of lists
+    """
+    return [variables[i : i + batch_size] for i in range(0, len(variables), batch_size)]
+
+
+def chunk_id(level, parent, batch_index):
+    """
+    Names a chunk after its geography level, parent geography and variable batch.
+    :param level: Child geography level, e.g. "county".
+    :type level: str
+    :param parent: Parent geography as {geography: code}, e.g. {"state": "01"}.
+    :type parent: dict
+    :param batch_index: Index of the variable batch.
+    :type batch_index: int
+    :return: Chunk identifier usable as a file name.
+    :rtype: str
+    """
+    parent_part = "_".join(f"{geo}-{code}" for geo, code in parent.items())
+    return f"{level}_{parent_part}_b{batch_index:03d}"
+
+
+def build_query(endpoint, year, dataset, variables, level, parent, key=None):
+    """
+    Builds the URL and query parameters for one chunk.
+    :param endpoint: Base URL of the Census API.
+    :type endpoint: str
+    :param year: Year of interest.
+    :type year: str
+    :param dataset: Census dataset to query (acronym).
+    :type dataset: str
+    :param variables: Census variable codes.
+    :type variables: list
+    :param level: Child geography level, e.g. "county" or "tract".
+    :type level: str
+    :param parent: Parent geography as {geography: code}.
+    :type parent: dict
+    :param key: Census API key (default: None).
+    :type key: str | None
+    :return: Request URL and query parameters.
+    :rtype: tuple
+    """
+    params = {
+        "get": ",".join(variables),
+        "for": f"{level}:*",
+        "in": " ".join(f"{geo}:{code}" for geo, code in parent.items()),
+    }
+    if not params["in"]:
+        del params["in"]
+    if key:
+        params["key"] = key
+    return f"{endpoint}/{year}/{dataset}", params
+
+
+def response_to_frame(data, variables):
+    """
+    Converts a Census API response to a dataframe with numeric variable columns.
+    :param data: Census data with headers.
+    :type data: list of lists
+    :param variables: Census variable codes requested.
+    :type variables: list
+    :return: One row per geography.
+    :rtype: pandas dataframe
+    """
+    frame = pd.DataFrame(data[1:], columns=data[0])
+    for var in variables:
+        if var in frame.columns and var != "NAME":
+            frame[var] = pd.to_numeric(frame[var], errors="coerce")
+    return frame
+
+
+def new_limiter(max_concurrency, max_per_second):
+    """
+    Creates the shared state used to bound concurrency and request rate.
+    :param max_concurrency: Maximum number of requests in flight.
+    :type max_concurrency: int
+    :param max_per_second: Maximum number of requests started per second.
+    :type max_per_second: float
+    :return: Limiter state.
+    :rtype: dict
+    """
+    return {
+        "semaphore": asyncio.Semaphore(max_concurrency),
+        "lock": asyncio.Lock(),
+        "interval": 1 / max_per_second if max_per_second else 0.0,
+        "next_start": 0.0,
+    }
+
+
+async def wait_turn(limiter):
+    """
+    Waits until the rate limit allows another request to start.
+    :param limiter: Limiter state from new_limiter.
+    :type limiter: dict
+    :return: None.
+    :rtype: None.
+    """
+    async with limiter["lock"]:
+        now = time.monotonic()
+        delay = limiter["next_start"] - now
+        limiter["next_start"] = max(now, limiter["next_start"]) + limiter["interval"]
+    if delay > 0:
+        await asyncio.sleep(delay)
+
+
+async def fetch_json(limiter, url, params, retries=3, timeout=60):
+    """
+    Requests one chunk, retrying rate-limited and server errors with exponential backoff.
+    :param limiter: Limiter state from new_limiter.
+    :type limiter: dict
+    :param url: Request URL.
+    :type url: str
+    :param params: Query parameters.
+    :type params: dict
+    :param retries: Number of retries after the first attempt (default: 3).
+    :type retries: int
+    :param timeout: Request timeout in seconds (default: 60).
+    :type timeout: float
+    :return: Census data with headers, or None when the geography has no data.
+    :rtype: list of lists | None
+    """
+    for attempt in range(retries + 1):
+        async with limiter["semaphore"]:
+            await wait_turn(limiter)
+            try:
+                response = await asyncio.to_thread(
+                    requests.get, url, params=params, timeout=timeout
+                )
+            except requests.RequestException as e:
+                if attempt == retries:
+                    raise
+                print(f"Request failed ({e}), retrying...")
+                response = None
+        if response is not None:
+            if response.status_code == 200:
+                return response.json()
+            if response.status_code == 204:
+                return None
+            if response.status_code not in RETRY_STATUS or attempt == retries:
+                raise requests.HTTPError(
+                    f"Error {response.status_code}: {response.text[:200]}",
+                    response=response,
+                )
+        await asyncio.sleep(2**attempt)
+    return None
+
+
+def read_manifest(out_dir):
+    """
+    Reads the identifiers of chunks completed by earlier runs.
+    :param out_dir: Output directory of the fan-out.
+    :type out_dir: str
+    :return: Manifest entries keyed by chunk identifier.
+    :rtype: dict
+    """
+    manifest_path = os.path.join(out_dir, MANIFEST_NAME)
+    done = {}
+    if not os.path.exists(manifest_path):
+        return done
+    with open(manifest_path, "r", encoding="utf-8") as file_obj:
+        for line in file_obj:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # A run killed mid-write can leave a partial last line
+                continue
+            if entry.get("file") is None or os.path.exists(
+                os.path.join(out_dir, entry["file"])
+            ):
+                done[entry["chunk"]] = entry
+    return done
+
+
+def record_chunk(out_dir, entry):
+    """
+    Appends a completed chunk to the manifest.
+    :param out_dir: Output directory of the fan-out.
+    :type out_dir: str
+    :param entry: Manifest entry with at least "chunk" and "file" keys.
+    :type entry: dict
+    :return: None.
+    :rtype: None.
+    """
+    with open(os.path.join(out_dir, MANIFEST_NAME), "a", encoding="utf-8") as file_obj:
+        file_obj.write(json.dumps(entry) + "\n")
+
+
+def write_chunk(out_dir, chunk, frame):
+    """
+    Writes a chunk to Parquet, renaming it into place so a partial file is never mistaken for a finished one.
+    :param out_dir: Output directory of the fan-out.
+    :type out_dir: str
+    :param chunk: Chunk identifier.
+    :type chunk: str
+    :param frame: Chunk data.
+    :type frame: pandas dataframe
+    :return: File name of the chunk, relative to out_dir.
+    :rtype: str
+    """
+    filename = f"{chunk}.parquet"
+    tmp_path = os.path.join(out_dir, f".{filename}.tmp")
+    frame.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, os.path.join(out_dir, filename))
+    return filename
+
+
+async def fetch_chunk(limiter, out_dir, chunk, url, params, variables):
+    """
+    Fetches one chunk, writes it to disk and records it in the manifest.
+    :param limiter: Limiter state from new_limiter.
+    :type limiter: dict
+    :param out_dir: Output directory of the fan-out.
+    :type out_dir: str
+    :param chunk: Chunk identifier.
+    :type chunk: str
+    :param url: Request URL.
+    :type url: str
+    :param params: Query parameters.
+    :type params: dict
+    :param variables: Census variable codes requested.
+    :type variables: list
+    :return: Manifest entry of the chunk.
+    :rtype: dict
+    """
+    data = await fetch_json(limiter, url, params)
+    entry = {"chunk": chunk, "file": None, "rows": 0}
+    if data:
+        frame = response_to_frame(data, variables)
+        entry["file"] = await asyncio.to_thread(write_chunk, out_dir, chunk, frame)
+        entry["rows"] = len(frame)
+    record_chunk(out_dir, entry)
+    return entry
+
+
+async def list_geographies(limiter, endpoint, year, dataset, level, parent, key):
+    """
+    Enumerates the codes of every geography at a level within a parent geography.
+    :param limiter: Limiter state from new_limiter.
+    :type limiter: dict
+    :param endpoint: Base URL of the Census API.
+    :type endpoint: str
+    :param year: Year of interest.
+    :type year: str
+    :param dataset: Census dataset to query (acronym).
+    :type dataset: str
+    :param level: Geography level to enumerate, e.g. "state" or "county".
+    :type level: str
+    :param parent: Parent geography as {geography: code}.
+    :type parent: dict
+    :param key: Census API key.
+    :type key: str | None
+    :return: Geography codes.
+    :rtype: list
+    """
+    url, params = build_query(endpoint, year, dataset, ["NAME"], level, parent, key)
+    data = await fetch_json(limiter, url, params)
+    if not data:
+        return []
+    col = data[0].index(level)
+    return sorted(row[col] for row in data[1:])
+
+
+async def plan_chunks(limiter, endpoint, year, dataset, level, states, key):
+    """
+    Enumerates the parent geographies of every chunk. Counties are requested per state, and tracts per county.
+    :param limiter: Limiter state from new_limiter.
+    :type limiter: dict
+    :param endpoint: Base URL of the Census API.
+    :type endpoint: str
+    :param year: Year of interest.
+    :type year: str
+    :param dataset: Census dataset to query (acronym).
+    :type dataset: str
+    :param level: Child geography level, "county" or "tract".
+    :type level: str
+    :param states: State FIPS codes to fan out over, or None for every state.
+    :type states: list | None
+    :param key: Census API key.
+    :type key: str | None
+    :return: Parent geographies.
+    :rtype: list of dicts
+    """
+    if states is None:
+        states = await list_geographies(
+            limiter, endpoint, year, dataset, "state", {}, key
+        )
+    parents = [{"state": f"{int(state):02d}"} for state in states]
+    if level == "county":
+        return parents
+    if level != "tract":
+        raise ValueError(f"Unsupported geography level: {level}")
+    counties = await asyncio.gather(
+        *[
+            list_geographies(limiter, endpoint, year, dataset, "county", parent, key)
+            for parent in parents
+        ]
+    )
+    return [
+        {**parent, "county": county}
+        for parent, codes in zip(parents, counties)
+        for county in codes
+    ]
+
+
+async def fan_out(
+    year,
+    dataset,
+    variables,
+    out_dir,
+    level="county",
+    states=None,
+    api_key="CENSUS_API_KEY",
+    endpoint=CENSUS_ENDPOINT,
+    max_concurrency=8,
+    max_per_second=10,
+):
+    """
+    Fetches variables for every child geography, skipping chunks already recorded in the manifest.
+    :param year: Year of interest.
+    :type year: str
+    :param dataset: Census dataset to query (acronym).
+    :type dataset: str
+    :param variables: Census variable codes.
+    :type variables: list
+    :param out_dir: Directory for chunk files and the manifest.
+    :type out_dir: str
+    :param level: Child geography level, "county" or "tract" (default: county).
+    :type level: str
+    :param states: State FIPS codes to fan out over (default: every state).
+    :type states: list | None
+    :param api_key: Name of the environment variable holding the Census API key (default: CENSUS_API_KEY).
+    :type api_key: str
+    :param endpoint: Base URL of the Census API, e.g. a local mock server (default: CENSUS_ENDPOINT).
+    :type endpoint: str
+    :param max_concurrency: Maximum number of requests in flight (default: 8).
+    :type max_concurrency: int
+    :param max_per_second: Maximum number of requests started per second (default: 10).
+    :type max_per_second: float
+    :return: Counts of planned, skipped, fetched and failed chunks.
+    :rtype: dict
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    key = os.getenv(api_key) if api_key else None
+    limiter = new_limiter(max_concurrency, max_per_second)
+    done = read_manifest(out_dir)
+
+    parents = await plan_chunks(limiter, endpoint, year, dataset, level, states, key)
+    tasks = []
+    for parent in parents:
+        for batch_index, batch in enumerate(batch_variables(variables)):
+            chunk = chunk_id(level, parent, batch_index)
+            if chunk in done:
+                continue
+            url, params = build_query(
+                endpoint, year, dataset, batch, level, parent, key
+            )
+            tasks.append(fetch_chunk(limiter, out_dir, chunk, url, params, batch))
+
+    planned = len(parents) * len(batch_variables(variables))
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    failed = [result for result in results if isinstance(result, BaseException)]
+    for error in failed[:5]:
+        print(f"Chunk failed: {error}")
+    return {
+        "planned": planned,
+        "skipped": planned - len(tasks),
+        "fetched": len(tasks) - len(failed),
+        "failed": len(failed),
+    }
+
+
+def load_fan_out(out_dir):
+    """
+    Combines the chunk files of a completed fan-out into one table with a row per geography.
+    :param out_dir: Output directory of the fan-out.
+    :type out_dir: str
+    :return: Census data with one column per variable.
+    :rtype: pandas dataframe
+    """
+    by_batch = {}
+    for entry in read_manifest(out_dir).values():
+        if entry["file"] is not None:
+            batch = entry["chunk"].rsplit("_", 1)[1]
+            by_batch.setdefault(batch, []).append(os.path.join(out_dir, entry["file"]))
+    combined = None
+    for batch in sorted(by_batch):
+        frame = pd.concat(
+            [pd.read_parquet(path) for path in sorted(by_batch[batch])],
+            ignore_index=True,
+        )
+        if combined is None:
+            combined = frame
+        else:
+            geo_cols = [col for col in ("state", "county", "tract") if col in frame]
+            combined = pd.merge(combined, frame, on=geo_cols, how="outer")
+    return combined
+
+
+def main():
+    """
+    Entry point for the script.
+    :return: None.
+    :rtype: None.
+    """
+    parser = argparse.ArgumentParser(
+        description="Fetch Census variables for every county or tract."
+    )
+    parser.add_argument("--year", default="2020")
+    parser.add_argument("--dataset", default="acs/acs5")
+    parser.add_argument("--level", choices=["county", "tract"], default="county")
+    parser.add_argument("--variables", default="B01001_001E")
+    parser.add_argument("--states", default=None, help="Comma-separated state FIPS")
+    parser.add_argument("--out-dir", default=None)
+    parser.add_argument("--endpoint", default=CENSUS_ENDPOINT)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=10)
+    args = parser.parse_args()
+
+    out_dir = args.out_dir or f"../data/census_{args.year}_{args.level}"
+    summary = asyncio.run(
+        fan_out(
+            args.year,
+            args.dataset,
+            args.variables.split(","),
+            out_dir,
+            level=args.level,
+            states=args.states.split(",") if args.states else None,
+            endpoint=args.endpoint,
+            max_concurrency=args.concurrency,
+            max_per_second=args.rate,
+        )
+    )
+    print(f"Census fan-out: {summary}")
+
+
+if __name__ == "__main__":
+    main()
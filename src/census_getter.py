@@ -14,7 +14,7 @@ from tqdm import tqdm
 CENSUS_ENDPOINT = "https://api.census.gov/data"
 
 
-def get_data(year, dataset, geo, variables, api_key):
+def get_data(year, dataset, geo, variables, api_key, endpoint=CENSUS_ENDPOINT):
     """
     Given search parameters, retrieves the requested data from the Census API.
     See https://www.census.gov/content/dam/Census/data/developers/api-user-guide/api-guide.pdf
@@ -28,16 +28,18 @@ def get_data(year, dataset, geo, variables, api_key):
     :type variables: str
     :param api_key: Personal key for the Census API
     :type api_key: str
+    :param endpoint: Base URL of the Census API (default: CENSUS_ENDPOINT)
+    :type endpoint: str
     :return: Census data with headers
     :rtype: list of lists
     """
     key = os.getenv(api_key)
-    query = f"{CENSUS_ENDPOINT}/{year}/{dataset}?get={variables}&for={geo}&key={key}"
+    query = f"{endpoint}/{year}/{dataset}?get={variables}&for={geo}&key={key}"
     response = requests.get(query)
     if response.status_code == 200:
         try:
             data = response.json()
-            var_table = get_var_table(year, dataset)[0]
+            var_table = get_var_table(year, dataset, endpoint)[0]
             headers = map_vars_to_names(data, var_table)
             data[0] = headers
             return data
@@ -50,18 +52,20 @@ def get_data(year, dataset, geo, variables, api_key):
     return response
 
 
-def get_var_table(year, dataset):
+def get_var_table(year, dataset, endpoint=CENSUS_ENDPOINT):
     """
     Retrieves a Census variables table for a specific year from the Census website.
     :param year: Year of Census data requested
     :type year: str
     :param dataset: Dataset to retrieve data from
     :type dataset: str
+    :param endpoint: Base URL of the Census API (default: CENSUS_ENDPOINT)
+    :type endpoint: str
     :return: Dataframes created from HTML tables on the Census website
     :rtype: list of dataframes
     """
     try:
-        var_table = pd.read_html(f"{CENSUS_ENDPOINT}/{year}/{dataset}/variables.html")
+        var_table = pd.read_html(f"{endpoint}/{year}/{dataset}/variables.html")
         return var_table
     except ValueError as e:
         print(f"{e}, no table found.")
@@ -0,0 +1,285 @@
+"""
+This script provides a single command line entry point for the project's pipeline steps. Run it from src/ with
+`python -m cli <command>`, or from anywhere with `python src/cli.py <command>`.
+
+Commands:
+    fetch-census    Retrieve ACS data for every state, or fan out over counties or tracts.
+    clean-reuters   Recode the Reuters/Ipsos poll.
+    clean-comet     Recode the COMETrends poll.
+    render-maps     Build the website's hex map geometry and results feeds, optionally rendering SVG maps.
+    evaluate        Score state predictions against actual results.
+
+Only argparse is imported at startup. Each command imports the scripts it needs (and with them pandas, geopandas,
+matplotlib or scikit-learn) when it runs, so `--help` and argument errors return immediately. Default paths are
+resolved against the repository root, so commands can be run from any directory.
+"""
+
+import argparse
+import os
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(REPO_DIR, "data")
+OUTPUT_DIR = os.path.join(REPO_DIR, "output")
+SITE_DIR = os.path.join(REPO_DIR, "website_699", "ppredict")
+
+
+def fetch_census(args):
+    """
+    Retrieves ACS data for every state, or for every county or tract with the resumable fan-out.
+    :param args: Parsed command line arguments.
+    :type args: argparse.Namespace
+    :return: None.
+    :rtype: None.
+    """
+    if args.level != "state":
+        import asyncio
+
+        import census_fanout as cf
+
+        out_dir = args.out or os.path.join(DATA_DIR, f"census_{args.year}_{args.level}")
+        summary = asyncio.run(
+            cf.fan_out(
+                args.year,
+                args.dataset,
+                args.variables.split(","),
+                out_dir,
+                level=args.level,
+                endpoint=args.endpoint,
+            )
+        )
+        print(f"Census fan-out: {summary}")
+        return
+
+    import census_getter as cg
+
+    census_data = cg.get_data(
+        year=args.year,
+        dataset=args.dataset,
+        geo="state:*",
+        variables=args.variables,
+        api_key="CENSUS_API_KEY",
+        endpoint=args.endpoint,
+    )
+    census_df = cg.create_df(census_data, [args.year])
+    out = args.out or os.path.join(DATA_DIR, f"{args.year}_state_pop.csv")
+    census_df.to_csv(out)
+    print(f"Wrote {out}")
+
+
+def clean_poll(args):
+    """
+    Recodes a raw poll through the feature store and writes the full and coded-only outputs.
+    :param args: Parsed command line arguments.
+    :type args: argparse.Namespace
+    :return: None.
+    :rtype: None.
+    """
+    import feature_store as fs
+
+    features = fs.get_features(
+        args.source, args.input, store_dir=os.path.join(DATA_DIR, "feature_store")
+    )
+    _, _, module = fs.get_recoder(args.source)
+    os.makedirs(args.out_dir, exist_ok=True)
+    all_path = os.path.join(args.out_dir, args.all_name)
+    coded_path = os.path.join(args.out_dir, args.coded_name)
+    features.to_csv(all_path, index=False)
+    features[module.coded_columns(features)].to_csv(coded_path, index=False)
+    print(f"Wrote {all_path} and {coded_path}")
+
+
+def render_maps(args):
+    """
+    Builds the hex map geometry and results feeds used by the website, and optionally renders static SVG maps.
+    :param args: Parsed command line arguments.
+    :type args: argparse.Namespace
+    :return: None.
+    :rtype: None.
+    """
+    import pandas as pd
+
+    import map_viz_gen as mp
+
+    mp.build_hex_geometry(
+        args.hex_map, os.path.join(SITE_DIR, "static", "ppredict", "hex_geometry.json")
+    )
+    feeds = [(args.actual, "2020/actual", "State", False)]
+    for feed in args.feed:
+        run_id, filepath = feed.split("=", 1)
+        feeds.append((filepath, run_id, "state", True))
+    for filepath, run_id, index_col, pred in feeds:
+        state_results = pd.read_csv(filepath)
+        if index_col not in state_results.columns:
+            index_col = "State" if index_col == "state" else "state"
+        state_results = state_results[state_results[index_col].notna()]
+        state_results = state_results[
+            ~state_results[index_col].isin(["total", "notes"])
+        ].set_index(index_col)
+        mp.build_results_feed(
+            state_results,
+            os.path.join(SITE_DIR, "feeds", f"{run_id}.json"),
+            run_id,
+            pred=pred,
+        )
+        if args.svg:
+            us_hex_map = mp.merge_and_encode_wins(
+                mp.prep_map_data(args.hex_map), state_results, pred=pred
+            )
+            svg_name = f"{run_id.replace('/', '_')}_hexbin.svg"
+            mp.build_plot(
+                us_hex_map,
+                os.path.join(SITE_DIR, "static", "ppredict", svg_name),
+                show=False,
+            )
+        print(f"Published feed {run_id}")
+
+
+def evaluate(args):
+    """
+    Scores state predictions against actual results and writes accuracy (and optionally margin MSE) tables.
+    :param args: Parsed command line arguments.
+    :type args: argparse.Namespace
+    :return: None.
+    :rtype: None.
+    """
+    import pandas as pd
+
+    import eval as ev
+
+    actual_results = pd.read_csv(args.actual)
+    actual_results = actual_results[
+        ~actual_results["State"].isin(["total", "notes"])
+    ].reset_index(drop=True)
+    preds = {}
+    for pred in args.pred:
+        name, filepath = pred.split("=", 1)
+        state_pred = pd.read_csv(filepath)
+        state_col = "State" if "State" in state_pred.columns else "state"
+        preds[name] = state_pred.rename(columns={state_col: "State"})
+
+    aligned = {
+        name: pred.set_index("State")
+        .reindex(actual_results["State"])
+        .reset_index(drop=True)
+        for name, pred in preds.items()
+    }
+    outcomes, accuracy_matrix = ev.evaluate_accuracy(actual_results, aligned)
+    os.makedirs(args.out_dir, exist_ok=True)
+    outcomes.to_csv(os.path.join(args.out_dir, "accuracy_outcomes.csv"))
+    accuracy_matrix.to_csv(os.path.join(args.out_dir, "accuracy_matrix.csv"))
+    print(accuracy_matrix)
+
+    if args.margins:
+        model_eval = ev.evaluate_margins(ev.load_actual_margins(args.margins), preds)
+        model_eval.to_csv(os.path.join(args.out_dir, "model_eval.csv"), index=False)
+        print(model_eval)
+
+
+def build_parser():
+    """
+    Builds the argument parser with one subcommand per pipeline step.
+    :return: Argument parser.
+    :rtype: argparse.ArgumentParser
+    """
+    parser = argparse.ArgumentParser(
+        prog="python -m cli", description="Election prediction pipeline."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    census = commands.add_parser("fetch-census", help="Retrieve ACS data.")
+    census.add_argument("--year", default="2020")
+    census.add_argument("--dataset", default="acs/acs5")
+    census.add_argument("--variables", default="NAME,B01001_001E")
+    census.add_argument(
+        "--level", choices=["state", "county", "tract"], default="state"
+    )
+    census.add_argument("--endpoint", default="https://api.census.gov/data")
+    census.add_argument("--out", default=None, help="Output file or directory")
+    census.set_defaults(func=fetch_census)
+
+    reuters = commands.add_parser("clean-reuters", help="Recode the Reuters poll.")
+    reuters.add_argument(
+        "--input", default=os.path.join(DATA_DIR, "reuters_poll", "2024_reuters.csv")
+    )
+    reuters.add_argument("--out-dir", default=os.path.join(DATA_DIR, "reuters_poll"))
+    reuters.set_defaults(
+        func=clean_poll,
+        source="reuters",
+        all_name="2024_clean_reuters_all.csv",
+        coded_name="2024_clean_reuters_coded.csv",
+    )
+
+    comet = commands.add_parser("clean-comet", help="Recode the COMETrends poll.")
+    comet.add_argument(
+        "--input", default=os.path.join(DATA_DIR, "comet_polls", "prenov20.zip")
+    )
+    comet.add_argument("--out-dir", default=os.path.join(DATA_DIR, "comet_polls"))
+    comet.set_defaults(
+        func=clean_poll,
+        source="comet",
+        all_name="clean_comet.csv",
+        coded_name="comet_recoded.csv",
+    )
+
+    maps = commands.add_parser("render-maps", help="Build map geometry and feeds.")
+    maps.add_argument(
+        "--hex-map", default=os.path.join(DATA_DIR, "us_states_hexgrid.geojson")
+    )
+    maps.add_argument(
+        "--actual", default=os.path.join(DATA_DIR, "2020_electoral_results.csv")
+    )
+    maps.add_argument(
+        "--feed",
+        action="append",
+        default=[],
+        help="Prediction feed as run_id=path, e.g. 2024/reuters/ml=data/final_pred_elec_2024.csv",
+    )
+    maps.add_argument("--svg", action="store_true", help="Also render SVG maps")
+    maps.set_defaults(func=render_maps)
+
+    evaluation = commands.add_parser("evaluate", help="Score state predictions.")
+    evaluation.add_argument(
+        "--actual", default=os.path.join(DATA_DIR, "2020_electoral_results.csv")
+    )
+    evaluation.add_argument(
+        "--pred",
+        action="append",
+        default=None,
+        help="Predictions as name=path (default: the 2020 ML and MRP predictions)",
+    )
+    evaluation.add_argument(
+        "--margins", default=None, help="Path to actual_margin_result.csv"
+    )
+    evaluation.add_argument("--out-dir", default=OUTPUT_DIR)
+    evaluation.set_defaults(func=evaluate)
+    return parser
+
+
+def main(argv=None):
+    """
+    Entry point for the script.
+    :param argv: Command line arguments (default: sys.argv[1:]).
+    :type argv: list | None
+    :return: None.
+    :rtype: None.
+    """
+    args = build_parser().parse_args(argv)
+    if args.command == "evaluate" and args.pred is None:
+        args.pred = [
+            f"ml={os.path.join(DATA_DIR, 'final_pred_elec_ML_2020.csv')}",
+            f"mrp={os.path.join(DATA_DIR, 'final_pred_elec_2020_MRP.csv')}",
+        ]
+    if args.command == "render-maps" and not args.feed:
+        args.feed = [
+            f"2024/reuters/ml={os.path.join(DATA_DIR, 'final_pred_elec_2024.csv')}"
+        ]
+    # The pipeline scripts import each other by module name from src/
+    src_dir = os.path.dirname(os.path.abspath(__file__))
+    if src_dir not in sys.path:
+        sys.path.insert(0, src_dir)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,475 @@
+"""
+This script preprocesses county boundaries (e.g. the Census cartographic boundary file cb_2020_us_county_500k.zip) into
+compact TopoJSON files for the website's client-side county maps, so no geometry work is done when a map is drawn.
+
+Geometry is built once, in three steps:
+
+- Shared borders between counties are split into arcs that are stored once and referenced by both counties, so
+  simplifying an arc changes both neighbors the same way and never opens gaps between them.
+- Arcs are simplified (Douglas-Peucker) once for each zoom level in ZOOM_WIDTHS. The tolerance is a fixed share of a
+  pixel at that level's width, and coordinates are quantized to whole pixels and delta-encoded as in the TopoJSON spec.
+- Label positions are chosen inside each county. At each zoom level a greedy pass places labels from the largest
+  county down, and uses an STRtree of the label boxes to skip labels that would overlap one already placed.
+
+Alaska and Hawaii are drawn as insets in the lower left of the map. Each is projected with its own equal-area
+projection, since the lower-48 projection badly distorts them, then scaled and moved into place (see INSETS).
+
+Each zoom level is written as its own file with a "counties" object (id: GEOID), a "state_borders" object drawn over the
+counties, and a "labels" object. Results are published separately as a small per-run feed (build_county_feed), in the
+same way as the state hex maps.
+"""
+
+import json
+import os
+
+import geopandas
+import numpy as np
+import pandas as pd
+import shapely
+
+import state_keys as sk
+
+# Equal-area projection for the lower 48 states
+CRS = "EPSG:5070"
+
+# States drawn as insets, keyed by FIPS code: each is projected with its own equal-area projection, scaled, and moved
+# so its lower-left corner sits at position, given as shares of the lower-48 map's width and height from its
+# lower-left corner
+INSETS = {
+    2: {"crs": "EPSG:3338", "scale": 0.35, "position": (0.0, 0.0)},
+    15: {"crs": "ESRI:102007", "scale": 1.0, "position": (0.27, 0.0)},
+}
+
+# Width in pixels of the SVG view box at each zoom level
+ZOOM_WIDTHS = [960, 1920, 3840]
+
+# Simplification tolerance, in pixels at the zoom level's width
+SIMPLIFY_PIXELS = 0.5
+
+# Size of label text in pixels; a character is about LABEL_CHAR_WIDTH of the font size wide
+LABEL_FONT_PIXELS = 11
+LABEL_CHAR_WIDTH = 0.6
+
+
+def read_counties(filepath, crs=CRS, insets=None):
+    """
+    Reads county boundaries and projects them, keeping counties of the 50 states and DC.
+    :param filepath: Path to a county boundary file readable by geopandas, e.g. a zipped shapefile.
+    :type filepath: str
+    :param crs: Projection of the lower 48 states (default: CRS).
+    :type crs: str
+    :param insets: States drawn as insets, as in INSETS (default: INSETS).
+    :type insets: dict | None
+    :return: One row per county with GEOID, NAME, STATEFP and geometry.
+    :rtype: geopandas.GeoDataFrame object
+    """
+    if insets is None:
+        insets = INSETS
+    counties = geopandas.read_file(filepath)
+    counties["STATEFP"] = sk.to_fips(counties["STATEFP"])
+    counties = counties[counties["STATEFP"].notna()]
+    counties = counties[["GEOID", "NAME", "STATEFP", "geometry"]]
+    is_inset = counties["STATEFP"].isin(list(insets))
+    mainland = counties[~is_inset].to_crs(crs)
+    bounds = mainland.total_bounds
+    parts = [mainland]
+    for fips, inset in insets.items():
+        state = counties[counties["STATEFP"] == fips].to_crs(inset["crs"])
+        if state.empty:
+            continue
+        state_bounds = state.total_bounds
+        geometry = state.geometry.scale(
+            inset["scale"], inset["scale"], origin=(state_bounds[0], state_bounds[1])
+        )
+        geometry = geometry.translate(
+            bounds[0]
+            + inset["position"][0] * (bounds[2] - bounds[0])
+            - state_bounds[0],
+            bounds[1]
+            + inset["position"][1] * (bounds[3] - bounds[1])
+            - state_bounds[1],
+        )
+        parts.append(state.set_geometry(geometry.set_crs(crs, allow_override=True)))
+    counties = pd.concat(parts)
+    return counties.sort_values("GEOID").reset_index(drop=True)
+
+
+def extract_rings(geometries):
+    """
+    Splits polygons into their rings on an integer grid of projection units.
+    :param geometries: Polygon or multipolygon geometries.
+    :type geometries: geopandas.GeoSeries object
+    :return: Integer points of every ring without the closing point, and for each ring its feature, polygon and start
+        offset into the points (with the total number of points appended).
+    :rtype: tuple
+    """
+    parts, feature = shapely.get_parts(np.asarray(geometries), return_index=True)
+    rings, polygon = shapely.get_rings(parts, return_index=True)
+    coords, ring = shapely.get_coordinates(rings, return_index=True)
+    points = np.rint(coords).astype(np.int64)
+
+    # Drop the closing point of each ring and points repeated after rounding
+    last = np.r_[ring[1:] != ring[:-1], True]
+    repeat = np.r_[
+        False, (ring[1:] == ring[:-1]) & (points[1:] == points[:-1]).all(axis=1)
+    ]
+    keep = ~last & ~repeat
+    points, ring = points[keep], ring[keep]
+    counts = np.bincount(ring, minlength=len(rings))
+    valid = counts >= 3
+    points, ring = points[valid[ring]], ring[valid[ring]]
+    offsets = np.r_[0, np.cumsum(counts[valid])]
+    return points, feature[polygon[valid]], polygon[valid], offsets
+
+
+def point_keys(points):
+    """
+    Packs integer points into single integer keys.
+    :param points: Integer points, non-negative and below 2 ** 31.
+    :type points: numpy array
+    :return: One key per point.
+    :rtype: numpy array
+    """
+    return (points[:, 0] << 32) | points[:, 1]
+
+
+def find_junctions(keys, offsets):
+    """
+    Finds the points where borders meet, i.e. points whose neighbors differ between the rings passing through them.
+    :param keys: Point keys of every ring.
+    :type keys: numpy array
+    :param offsets: Start offset of each ring, with the total number of points appended.
+    :type offsets: numpy array
+    :return: Whether each point is a junction.
+    :rtype: numpy array
+    """
+    index = np.arange(len(keys))
+    ring = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    start, length = offsets[ring], np.diff(offsets)[ring]
+    prev_keys = keys[start + (index - start - 1) % length]
+    next_keys = keys[start + (index - start + 1) % length]
+    sides = np.column_stack(
+        [keys, np.minimum(prev_keys, next_keys), np.maximum(prev_keys, next_keys)]
+    )
+    distinct = np.unique(sides, axis=0)
+    junction_keys, neighbor_sets = np.unique(distinct[:, 0], return_counts=True)
+    return np.isin(keys, junction_keys[neighbor_sets > 1])
+
+
+def build_arcs(points, offsets):
+    """
+    Splits rings into arcs at junctions, storing each shared border once.
+    :param points: Integer points of every ring.
+    :type points: numpy array
+    :param offsets: Start offset of each ring, with the total number of points appended.
+    :type offsets: numpy array
+    :return: Arcs as arrays of points, and for each ring its arc references (~i for arc i reversed).
+    :rtype: tuple
+    """
+    keys = point_keys(points)
+    junction = find_junctions(keys, offsets)
+    arcs, arc_ids, ring_arcs = [], {}, []
+
+    def add_arc(segment):
+        forward = point_keys(segment).tobytes()
+        if forward in arc_ids:
+            return arc_ids[forward]
+        backward = point_keys(segment[::-1]).tobytes()
+        if backward in arc_ids:
+            return ~arc_ids[backward]
+        arc_ids[forward] = len(arcs)
+        arcs.append(segment)
+        return arc_ids[forward]
+
+    for start, end in zip(offsets[:-1], offsets[1:]):
+        ring_points, ring_keys = points[start:end], keys[start:end]
+        cuts = np.flatnonzero(junction[start:end])
+        if len(cuts) == 0:
+            # A ring without junctions, e.g. an island, is one closed arc starting at its smallest point, so a
+            # neighbor using the same ring as a hole finds it in either direction
+            ring_points = np.roll(ring_points, -int(np.argmin(ring_keys)), axis=0)
+            ring_arcs.append([add_arc(np.r_[ring_points, ring_points[:1]])])
+            continue
+        ring_points = np.roll(ring_points, -cuts[0], axis=0)
+        cuts = np.r_[cuts - cuts[0], len(ring_points)]
+        closed = np.r_[ring_points, ring_points[:1]]
+        ring_arcs.append(
+            [add_arc(closed[a : b + 1]) for a, b in zip(cuts[:-1], cuts[1:])]
+        )
+    return arcs, ring_arcs
+
+
+def simplify_arcs(arcs, tolerance):
+    """
+    Simplifies every arc once with the Douglas-Peucker algorithm, keeping its end points.
+    :param arcs: Arcs as arrays of points.
+    :type arcs: list
+    :param tolerance: Largest distance a simplified arc may move from the original, in projection units.
+    :type tolerance: float
+    :return: Simplified arcs.
+    :rtype: list
+    """
+    lines = shapely.linestrings(
+        np.vstack(arcs), indices=np.repeat(np.arange(len(arcs)), [len(a) for a in arcs])
+    )
+    simplified = shapely.simplify(lines, tolerance, preserve_topology=False)
+    result = []
+    for arc, line in zip(arcs, simplified):
+        coords = shapely.get_coordinates(line)
+        # Closed arcs must keep enough points to enclose an area
+        if (arc[0] == arc[-1]).all() and len(coords) < 4:
+            coords = arc
+        result.append(coords)
+    return result
+
+
+def quantize_arcs(arcs, origin, scale, height):
+    """
+    Moves arcs onto the integer pixel grid of a zoom level, with north up, and delta-encodes them.
+    :param arcs: Arcs as arrays of projected points.
+    :type arcs: list
+    :param origin: Minimum x and maximum y of the map, in projection units.
+    :type origin: tuple
+    :param scale: Pixels per projection unit.
+    :type scale: float
+    :param height: Height of the view box in pixels.
+    :type height: int
+    :return: Delta-encoded arcs as lists of [dx, dy] pairs.
+    :rtype: list
+    """
+    encoded = []
+    for arc in arcs:
+        pixels = to_pixels(arc, origin, scale, height)
+        moved = np.r_[True, (pixels[1:] != pixels[:-1]).any(axis=1)]
+        pixels = pixels[moved]
+        if len(pixels) == 1:
+            # Arcs that shrink to one pixel are kept so the rings using them stay closed
+            pixels = np.r_[pixels, pixels]
+        deltas = np.r_[pixels[:1], np.diff(pixels, axis=0)]
+        encoded.append(deltas.tolist())
+    return encoded
+
+
+def to_pixels(points, origin, scale, height):
+    """
+    Converts projected points to whole pixels of a zoom level, flipping the y axis so north is up in SVG coordinates.
+    :param points: Projected points.
+    :type points: numpy array
+    :param origin: Minimum x and maximum y of the map, in projection units.
+    :type origin: tuple
+    :param scale: Pixels per projection unit.
+    :type scale: float
+    :param height: Height of the view box in pixels.
+    :type height: int
+    :return: Integer pixel coordinates.
+    :rtype: numpy array
+    """
+    pixels = np.column_stack(
+        [(points[:, 0] - origin[0]) * scale, (origin[1] - points[:, 1]) * scale]
+    )
+    return np.rint(pixels).astype(int)
+
+
+def place_labels(counties, label_points, scale):
+    """
+    Chooses which counties are labeled at a zoom level, largest first, without overlapping labels.
+    :param counties: Counties from read_counties.
+    :type counties: geopandas.GeoDataFrame object
+    :param label_points: Label position of each county, in projection units.
+    :type label_points: numpy array
+    :param scale: Pixels per projection unit.
+    :type scale: float
+    :return: Positions in counties of the labeled counties.
+    :rtype: numpy array
+    """
+    half_width = counties["NAME"].str.len().to_numpy() * (
+        LABEL_FONT_PIXELS * LABEL_CHAR_WIDTH / 2 / scale
+    )
+    half_height = LABEL_FONT_PIXELS / 2 / scale
+    boxes = shapely.box(
+        label_points[:, 0] - half_width,
+        label_points[:, 1] - half_height,
+        label_points[:, 0] + half_width,
+        label_points[:, 1] + half_height,
+    )
+    # Only counties that can hold their label are candidates
+    fits = shapely.contains(counties.geometry.to_numpy(), boxes)
+    candidates = np.flatnonzero(fits)
+    tree = shapely.STRtree(boxes[candidates])
+    box_index, other = tree.query(boxes[candidates], predicate="intersects")
+    neighbors = pd.Series(candidates[other]).groupby(candidates[box_index]).agg(list)
+
+    placed = np.zeros(len(counties), dtype=bool)
+    areas = counties.geometry.area.to_numpy()
+    for i in candidates[np.argsort(-areas[candidates], kind="stable")]:
+        if not placed[neighbors.get(i, [])].any():
+            placed[i] = True
+    return np.flatnonzero(placed)
+
+
+def build_level(counties, arcs, ring_arcs, ring_meta, label_points, bounds, width):
+    """
+    Builds the TopoJSON topology of one zoom level.
+    :param counties: Counties from read_counties.
+    :type counties: geopandas.GeoDataFrame object
+    :param arcs: Arcs from build_arcs.
+    :type arcs: list
+    :param ring_arcs: Arc references of each ring from build_arcs.
+    :type ring_arcs: list
+    :param ring_meta: Feature and polygon of each ring from extract_rings.
+    :type ring_meta: tuple
+    :param label_points: Label position of each county, in projection units.
+    :type label_points: numpy array
+    :param bounds: Bounds of the map (min x, min y, max x, max y), in projection units.
+    :type bounds: numpy array
+    :param width: Width of the view box in pixels.
+    :type width: int
+    :return: Topology.
+    :rtype: dict
+    """
+    scale = width / (bounds[2] - bounds[0])
+    height = int(np.ceil((bounds[3] - bounds[1]) * scale))
+    origin = (bounds[0], bounds[3])
+    simplified = simplify_arcs(arcs, SIMPLIFY_PIXELS / scale)
+
+    ring_feature, ring_polygon = ring_meta
+    polygons = {}
+    for feature, polygon, refs in zip(ring_feature, ring_polygon, ring_arcs):
+        polygons.setdefault(feature, {}).setdefault(polygon, []).append(refs)
+    geometries = []
+    for i, county in enumerate(counties.itertuples()):
+        parts = list(polygons.get(i, {}).values())
+        if not parts:
+            geometry = {"type": None}
+        elif len(parts) == 1:
+            geometry = {"type": "Polygon", "arcs": parts[0]}
+        else:
+            geometry = {"type": "MultiPolygon", "arcs": parts}
+        geometry["id"] = county.GEOID
+        geometry["properties"] = {"name": county.NAME, "state": int(county.STATEFP)}
+        geometries.append(geometry)
+
+    # Arcs used by one county (coasts and borders) or by counties of two states are state borders
+    arc_states = {}
+    state_of = counties["STATEFP"].astype(int).to_numpy()
+    for feature, refs in zip(ring_feature, ring_arcs):
+        for ref in refs:
+            arc_states.setdefault(ref if ref >= 0 else ~ref, []).append(
+                state_of[feature]
+            )
+    borders = [
+        [arc]
+        for arc, states in sorted(arc_states.items())
+        if len(states) == 1 or len(set(states)) > 1
+    ]
+
+    labeled = place_labels(counties, label_points, scale)
+    label_pixels = to_pixels(label_points[labeled], origin, scale, height)
+    labels = [
+        {
+            "type": "Point",
+            "id": counties["GEOID"].iloc[i],
+            "coordinates": point.tolist(),
+            "properties": {"name": counties["NAME"].iloc[i]},
+        }
+        for i, point in zip(labeled, label_pixels)
+    ]
+    return {
+        "type": "Topology",
+        "bbox": [0, 0, width, height],
+        "transform": {"scale": [1, 1], "translate": [0, 0]},
+        "objects": {
+            "counties": {"type": "GeometryCollection", "geometries": geometries},
+            "state_borders": {"type": "MultiLineString", "arcs": borders},
+            "labels": {"type": "GeometryCollection", "geometries": labels},
+        },
+        "arcs": quantize_arcs(simplified, origin, scale, height),
+    }
+
+
+def build_county_topology(counties, output_dir, zoom_widths=None):
+    """
+    Writes one TopoJSON file per zoom level for the client-side county maps.
+    :param counties: Counties from read_counties.
+    :type counties: geopandas.GeoDataFrame object
+    :param output_dir: Destination directory of the counties_<width>.json files.
+    :type output_dir: str
+    :param zoom_widths: Width in pixels of each zoom level (default: ZOOM_WIDTHS).
+    :type zoom_widths: list | None
+    :return: Paths of the files written.
+    :rtype: list
+    """
+    if zoom_widths is None:
+        zoom_widths = ZOOM_WIDTHS
+    bounds = counties.total_bounds
+    # Shift coordinates to non-negative values so points pack into integer keys
+    shifted = counties.geometry.translate(-np.floor(bounds[0]), -np.floor(bounds[1]))
+    points, ring_feature, ring_polygon, offsets = extract_rings(shifted)
+    arcs, ring_arcs = build_arcs(points, offsets)
+    arcs = [arc + [np.floor(bounds[0]), np.floor(bounds[1])] for arc in arcs]
+    label_points = shapely.get_coordinates(
+        shapely.point_on_surface(counties.geometry.to_numpy())
+    )
+
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for width in zoom_widths:
+        topology = build_level(
+            counties,
+            arcs,
+            ring_arcs,
+            (ring_feature, ring_polygon),
+            label_points,
+            bounds,
+            width,
+        )
+        filepath = os.path.join(output_dir, f"counties_{width}.json")
+        with open(filepath, "w", encoding="utf-8") as file_obj:
+            json.dump(topology, file_obj, separators=(",", ":"))
+        paths.append(filepath)
+    return paths
+
+
+def build_county_feed(county_results, filepath, run_id):
+    """
+    Writes a compact per-run JSON feed of county outcomes for the client-side county maps.
+    :param county_results: Results or predictions indexed by county GEOID, with a margin_trump column.
+    :type county_results: pandas.DataFrame
+    :param filepath: Destination filepath for the feed.
+    :type filepath: str
+    :param run_id: Identifier of the run, e.g. "2024/reuters/mrp".
+    :type run_id: str
+    :return: Feed written to disk.
+    :rtype: dict
+    """
+    margins = county_results["margin_trump"].round(4)
+    feed = {
+        "run": run_id,
+        "fields": ["biden_win", "margin"],
+        "counties": {
+            str(geoid): [int(margin > 0), float(margin)]
+            for geoid, margin in margins.dropna().items()
+        },
+    }
+    os.makedirs(os.path.dirname(filepath) or ".", exist_ok=True)
+    with open(filepath, "w", encoding="utf-8") as file_obj:
+        json.dump(feed, file_obj, separators=(",", ":"))
+    return feed
+
+
+def main():
+    """
+    Entry point for the script.
+    :return: None.
+    :rtype: None.
+    """
+    counties = read_counties("../data/cb_2020_us_county_500k.zip")
+    paths = build_county_topology(
+        counties, "../website_699/ppredict/static/ppredict/counties"
+    )
+    for filepath in paths:
+        print(f"Wrote {filepath} ({os.path.getsize(filepath)} bytes)")
+
+
+if __name__ == "__main__":
+    main()
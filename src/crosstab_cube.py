@@ -0,0 +1,223 @@
+"""
+This script precomputes a cube of weighted respondent counts over every combination of the coded poll dimensions (wave,
+age, race, sex, education, region, party and vote choice). Any marginal or crosstab is then answered by summing cube
+cells instead of grouping respondent-level data, which is fast enough to back the website's breakdown charts.
+
+Each dimension is stored with its levels plus a final "missing" level, so polls that did not ask a question (e.g.
+Harvard has no party identification) still contribute to every other breakdown. The cube is saved as a compressed
+.npz file with the dimension levels as JSON metadata.
+"""
+
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+# The cube is read and summed by the website's app (website_699/ppredict/cube.py), which only has numpy, so the site
+# and query cannot disagree
+sys.path.insert(
+    0,
+    os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "website_699"
+    ),
+)
+from ppredict.cube import load_cube, share_within, sum_cube  # noqa: E402,F401
+
+CUBE_DIMS = [
+    "wave",
+    "age_recoded",
+    "race_recoded",
+    "male",
+    "education_recoded",
+    "region",
+    "party",
+    "vote",
+]
+
+# Column names of each poll's recoded output, mapped onto the cube dimensions
+POLL_COLUMNS = {
+    "monmouth": {
+        "vote_choice_recoded": "vote",
+        "party_recoded": "party",
+        "FINALWGT": "weight",
+    },
+    "harvard": {"vote_choice_recoded": "vote"},
+    "reuters": {
+        "age_group_coded": "age_recoded",
+        "gender_coded": "male",
+        "education_coded": "education_recoded",
+        "race_coded": "race_recoded",
+        "region_coded": "region",
+        "party_id_coded": "party",
+        "vote_choice_coded": "vote",
+    },
+}
+
+# Party codes follow Monmouth's party_recoded (1 = Republican, 2 = Democrat, 3 = independent or other)
+REUTERS_PARTY = {0: 2, 1: 1, 2: 3, 3: 3}
+
+
+def prepare_poll(poll_data, source, wave):
+    """
+    Renames a recoded poll's columns onto the cube dimensions and harmonizes codes across polls.
+    :param poll_data: Recoded poll data for a single wave.
+    :type poll_data: pandas dataframe
+    :param source: Poll vendor, "monmouth", "harvard" or "reuters".
+    :type source: str
+    :param wave: Identifier of the wave, e.g. "monmouth_june_2020".
+    :type wave: str
+    :return: Poll data with one column per cube dimension and a weight column.
+    :rtype: pandas dataframe
+    """
+    col_map = POLL_COLUMNS[source]
+    # Raw columns that share a name with a cube dimension (e.g. Monmouth's unrecoded party) are replaced
+    replaced = [col for col in col_map.values() if col in poll_data.columns]
+    poll = poll_data.drop(columns=replaced).rename(columns=col_map)
+    poll = poll.assign(wave=wave)
+    if "weight" not in poll.columns:
+        poll["weight"] = 1.0
+    for dim in CUBE_DIMS[1:]:
+        if dim in poll.columns:
+            poll[dim] = pd.to_numeric(poll[dim], errors="coerce")
+        else:
+            poll[dim] = np.nan
+    if source == "reuters":
+        # Reuters codes college degrees as 2; the other polls and the ACS use 3
+        poll["education_recoded"] = poll["education_recoded"].replace(2, 3)
+        poll["party"] = poll["party"].map(REUTERS_PARTY)
+    return poll[CUBE_DIMS + ["weight"]]
+
+
+def level_value(value):
+    """
+    Converts a dimension level to a JSON-friendly value, using integers for whole-number codes.
+    :param value: Dimension level.
+    :type value: object
+    :return: Level as int, float or str.
+    :rtype: int | float | str
+    """
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        return int(value) if float(value).is_integer() else float(value)
+    return str(value)
+
+
+def build_cube(polls, dims=None):
+    """
+    Counts weighted and unweighted respondents in every combination of the cube dimensions.
+    :param polls: Stacked poll data from prepare_poll.
+    :type polls: pandas dataframe
+    :param dims: Dimensions of the cube (default: CUBE_DIMS).
+    :type dims: list | None
+    :return: Cube with dims, levels (the last level of each dimension is None for missing values), weighted sums and
+        counts.
+    :rtype: dict
+    """
+    if dims is None:
+        dims = CUBE_DIMS
+    codes, levels = [], {}
+    for dim in dims:
+        categorical = pd.Categorical(polls[dim])
+        dim_codes = categorical.codes.astype(np.int64)
+        dim_codes[dim_codes < 0] = len(categorical.categories)
+        codes.append(dim_codes)
+        levels[dim] = [level_value(level) for level in categorical.categories] + [None]
+    shape = tuple(len(levels[dim]) for dim in dims)
+    flat = np.ravel_multi_index(codes, shape)
+    size = int(np.prod(shape))
+    weights = polls["weight"].to_numpy(dtype=np.float64)
+    return {
+        "dims": list(dims),
+        "levels": levels,
+        "weighted": np.bincount(flat, weights=weights, minlength=size).reshape(shape),
+        "counts": np.bincount(flat, minlength=size).reshape(shape).astype(np.int32),
+    }
+
+
+def save_cube(cube, filepath):
+    """
+    Writes a cube to a compressed .npz file.
+    :param cube: Cube from build_cube.
+    :type cube: dict
+    :param filepath: Path to the output file.
+    :type filepath: str
+    :return: None.
+    :rtype: None.
+    """
+    meta = json.dumps({"dims": cube["dims"], "levels": cube["levels"]})
+    np.savez_compressed(
+        filepath, weighted=cube["weighted"], counts=cube["counts"], meta=np.array(meta)
+    )
+
+
+def query(cube, by, filters=None, share_of=None, include_missing=False):
+    """
+    Answers a marginal or crosstab query by summing cube cells.
+    :param cube: Cube from build_cube or load_cube.
+    :type cube: dict
+    :param by: Dimensions to break down by, e.g. ["age_recoded", "vote"].
+    :type by: list
+    :param filters: Levels to keep for any dimension, e.g. {"wave": ["monmouth_aug_2020"]} (default: None).
+    :type filters: dict | None
+    :param share_of: Optional dimension in by whose weighted shares are computed within each group of the other by
+        dimensions, e.g. "vote" (default: None).
+    :type share_of: str | None
+    :param include_missing: Whether to keep rows for missing levels of the by dimensions (default: False).
+    :type include_missing: bool
+    :return: One row per combination of by levels with weighted total (weight) and respondent count (n), plus a share
+        column when share_of is given.
+    :rtype: pandas dataframe
+    """
+    if share_of is not None and share_of not in by:
+        raise ValueError("share_of must be one of the by dimensions.")
+    by_levels, weighted, counts = sum_cube(cube, by, filters, include_missing)
+    result = pd.MultiIndex.from_product(by_levels, names=by).to_frame(index=False)
+    result["weight"] = weighted.ravel()
+    result["n"] = counts.ravel()
+    if share_of is not None:
+        result["share"] = share_within(weighted, by.index(share_of)).ravel()
+    return result[result["n"] > 0].reset_index(drop=True)
+
+
+def main():
+    """
+    Entry point for the script.
+    :return: None.
+    :rtype: None.
+    """
+    polls = pd.concat(
+        [
+            prepare_poll(
+                pd.read_csv("../data/nat_2020_cleaned_no_dummies2.csv"),
+                "monmouth",
+                "monmouth_march_2020",
+            ),
+            prepare_poll(
+                pd.read_csv("../data/nat_2020_june_cleaned.csv"),
+                "monmouth",
+                "monmouth_june_2020",
+            ),
+            prepare_poll(
+                pd.read_csv("../data/nat_2020_aug_cleaned.csv"),
+                "monmouth",
+                "monmouth_aug_2020",
+            ),
+            prepare_poll(
+                pd.read_csv("../data/harvard_poll.csv"), "harvard", "harvard_oct_2020"
+            ),
+            prepare_poll(
+                pd.read_csv("../data/2024_clean_reuters_coded.csv"),
+                "reuters",
+                "reuters_jan_2024",
+            ),
+        ],
+        ignore_index=True,
+    )
+    cube = build_cube(polls)
+    save_cube(cube, "../data/poll_cube.npz")
+    print(query(cube, ["wave", "vote"], share_of="vote"))
+
+
+if __name__ == "__main__":
+    main()
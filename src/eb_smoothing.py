@@ -0,0 +1,270 @@
+"""
+This script repairs sparse demographic cells by partial pooling, without refitting the Stan model. Raw cell estimates
+from poll respondents are shrunk toward a prior built from their state and demographic margins using closed-form
+empirical-Bayes (beta-binomial) updates.
+
+Respondents are counted onto a dense cube over every combination of the cell levels in the post-stratification table,
+so cells with no respondents (the NaN rows left by the all_combinations merge) get an estimate too. Each level of each
+dimension first gets a share smoothed toward the overall share. The prior of a cell adds the log odds of its levels'
+shares (a main-effects model), and each cell's Trump share is then shrunk toward its prior:
+
+    estimate = (kappa * prior + trump_votes) / (kappa + respondents)
+
+The prior strength kappa is estimated in closed form by the method of moments, from how much more the raw cell
+shares vary around their priors than binomial sampling alone explains. All steps are vectorized over the cube.
+"""
+
+import numpy as np
+import pandas as pd
+
+import post_strat as ps
+import raking as rk
+
+CELL_DIMS = ["age_recoded", "race_recoded", "male", "education_recoded", "STATEFIP"]
+
+# Bounds on the intra-cell correlation 1 / (kappa + 1), which keep kappa finite and positive
+MIN_RHO = 1e-4
+MAX_RHO = 1 - 1e-4
+
+
+def cube_levels(strat, dims=None):
+    """
+    Lists the levels of each cell dimension found in the post-stratification table.
+    :param strat: Post-stratification table with one row per demographic cell.
+    :type strat: pandas dataframe
+    :param dims: Cell dimensions (default: CELL_DIMS).
+    :type dims: list | None
+    :return: Sorted levels keyed by dimension.
+    :rtype: dict
+    """
+    if dims is None:
+        dims = CELL_DIMS
+    return {dim: np.sort(strat[dim].unique()) for dim in dims}
+
+
+def count_cells(poll_data, outcome_col, levels, weight_col=None):
+    """
+    Counts respondents and Trump votes in every cell of the cube.
+    :param poll_data: Recoded poll data with a column for each cell dimension.
+    :type poll_data: pandas dataframe
+    :param outcome_col: Column coding a vote for Trump as 1 and for Biden as 0.
+    :type outcome_col: str
+    :param levels: Levels of each dimension from cube_levels.
+    :type levels: dict
+    :param weight_col: Optional column of respondent weights, rescaled to a mean of 1 (default: None).
+    :type weight_col: str | None
+    :return: Trump votes and respondents as arrays shaped like the cube, and the number of respondents dropped for a
+        missing outcome or a level outside the cube.
+    :rtype: tuple
+    """
+    outcome = poll_data[outcome_col].to_numpy(dtype=np.float64)
+    codes = [
+        rk.encode_dimension(poll_data[dim], dim_levels)
+        for dim, dim_levels in levels.items()
+    ]
+    keep = ~np.isnan(outcome) & np.all(np.stack(codes) >= 0, axis=0)
+    weights = np.ones(len(poll_data))
+    if weight_col is not None:
+        weights = poll_data[weight_col].to_numpy(dtype=np.float64)
+        weights = weights / weights[keep].mean()
+    shape = tuple(len(dim_levels) for dim_levels in levels.values())
+    flat = np.ravel_multi_index([dim_codes[keep] for dim_codes in codes], shape)
+    size = int(np.prod(shape))
+    votes = np.bincount(flat, weights=weights[keep] * outcome[keep], minlength=size)
+    respondents = np.bincount(flat, weights=weights[keep], minlength=size)
+    return votes.reshape(shape), respondents.reshape(shape), int((~keep).sum())
+
+
+def fit_kappa(votes, respondents, prior):
+    """
+    Estimates the beta-binomial prior strength by the method of moments.
+
+    Under the model, a cell's raw share around its prior mean m has variance m(1 - m)(1 + (n - 1) rho) / n, where
+    rho = 1 / (kappa + 1). Solving the respondent-weighted sum of squared deviations for rho gives the estimate.
+    :param votes: Trump votes per cell.
+    :type votes: numpy array
+    :param respondents: Respondents per cell.
+    :type respondents: numpy array
+    :param prior: Prior mean per cell.
+    :type prior: numpy array
+    :return: Prior strength kappa, in respondents.
+    :rtype: float
+    """
+    seen = respondents > 0
+    n = respondents[seen]
+    share = votes[seen] / n
+    m = prior[seen]
+    excess = np.sum(n * (share - m) ** 2 - m * (1 - m))
+    spread = np.sum(m * (1 - m) * np.clip(n - 1, 0, None))
+    rho = excess / spread if spread > 0 else MAX_RHO
+    rho = min(max(rho, MIN_RHO), MAX_RHO)
+    return 1 / rho - 1
+
+
+def shrink(votes, respondents, prior, kappa):
+    """
+    Computes beta-binomial posterior means and standard deviations.
+    :param votes: Trump votes per cell.
+    :type votes: numpy array
+    :param respondents: Respondents per cell.
+    :type respondents: numpy array
+    :param prior: Prior mean per cell.
+    :type prior: numpy array
+    :param kappa: Prior strength, in respondents.
+    :type kappa: float
+    :return: Posterior mean and standard deviation per cell.
+    :rtype: tuple
+    """
+    strength = kappa + respondents
+    mean = (kappa * prior + votes) / strength
+    return mean, np.sqrt(mean * (1 - mean) / (strength + 1))
+
+
+def logit(p):
+    """
+    Computes the log odds of shares.
+    :param p: Shares strictly between 0 and 1.
+    :type p: numpy array
+    :return: Log odds.
+    :rtype: numpy array
+    """
+    return np.log(p) - np.log1p(-p)
+
+
+def margin_prior(votes, respondents):
+    """
+    Builds each cell's prior from its smoothed state and demographic margins under a main-effects logit model.
+    :param votes: Trump votes per cell.
+    :type votes: numpy array
+    :param respondents: Respondents per cell.
+    :type respondents: numpy array
+    :return: Prior mean per cell, and the prior strength used to smooth each dimension's margins.
+    :rtype: tuple
+    """
+    overall = votes.sum() / respondents.sum()
+    log_odds = np.full(votes.shape, logit(overall))
+    margin_kappa = []
+    for axis in range(votes.ndim):
+        others = tuple(i for i in range(votes.ndim) if i != axis)
+        level_votes = votes.sum(axis=others)
+        level_respondents = respondents.sum(axis=others)
+        base = np.full(level_votes.shape, overall)
+        kappa = fit_kappa(level_votes, level_respondents, base)
+        level_share, _ = shrink(level_votes, level_respondents, base, kappa)
+        effect = logit(level_share) - logit(overall)
+        shape = [1] * votes.ndim
+        shape[axis] = -1
+        log_odds = log_odds + effect.reshape(shape)
+        margin_kappa.append(kappa)
+    return 1 / (1 + np.exp(-log_odds)), margin_kappa
+
+
+def smooth_cells(poll_data, outcome_col, strat, dims=None, weight_col=None):
+    """
+    Computes partially pooled Trump shares for every demographic cell of the post-stratification table.
+    :param poll_data: Recoded poll data with a column for each cell dimension.
+    :type poll_data: pandas dataframe
+    :param outcome_col: Column coding a vote for Trump as 1 and for Biden as 0.
+    :type outcome_col: str
+    :param strat: Post-stratification table with one row per demographic cell.
+    :type strat: pandas dataframe
+    :param dims: Cell dimensions (default: CELL_DIMS).
+    :type dims: list | None
+    :param weight_col: Optional column of respondent weights (default: None).
+    :type weight_col: str | None
+    :return: One row per cell with its respondents, raw share, prior and eb_subgroup_estimate with its standard error,
+        and a dictionary of diagnostics.
+    :rtype: tuple
+    """
+    levels = cube_levels(strat, dims)
+    votes, respondents, dropped = count_cells(
+        poll_data, outcome_col, levels, weight_col
+    )
+    if not respondents.any():
+        raise ValueError("No respondents fall into the cells of the strat table.")
+    prior, margin_kappa = margin_prior(votes, respondents)
+    kappa = fit_kappa(votes, respondents, prior)
+    estimate, estimate_se = shrink(votes, respondents, prior, kappa)
+
+    grid = np.meshgrid(*levels.values(), indexing="ij")
+    cells = pd.DataFrame({dim: dim_grid.ravel() for dim, dim_grid in zip(levels, grid)})
+    with np.errstate(invalid="ignore", divide="ignore"):
+        raw = np.where(respondents > 0, votes / respondents, np.nan)
+    # Integer keys, as from read_cells, so the table lines up with the other cell estimates
+    for col in ps.CELL_COLS:
+        if col in cells.columns:
+            cells[col] = cells[col].astype(int)
+    cells["n_rows"] = respondents.ravel()
+    cells["raw_estimate"] = raw.ravel()
+    cells["prior_estimate"] = prior.ravel()
+    cells["eb_subgroup_estimate"] = estimate.ravel()
+    cells["eb_subgroup_estimate_se"] = estimate_se.ravel()
+    diagnostics = {
+        "kappa": kappa,
+        "margin_kappa": dict(zip(levels, margin_kappa)),
+        "cells": votes.size,
+        "empty_cells": int((respondents == 0).sum()),
+        "dropped_rows": dropped,
+    }
+    return cells, diagnostics
+
+
+def fill_sparse(estimates, estimate_col, smoothed, min_rows=None):
+    """
+    Replaces missing cell estimates, and optionally those of sparse cells, with partially pooled estimates.
+    :param estimates: Cell table with estimate_col, e.g. machine learning predictions after the all_combinations merge.
+    :type estimates: pandas dataframe
+    :param estimate_col: Column with the estimates to repair.
+    :type estimate_col: str
+    :param smoothed: Cell table from smooth_cells.
+    :type smoothed: pandas dataframe
+    :param min_rows: Cells with fewer respondents than this are also replaced (default: None, only missing cells).
+    :type min_rows: float | None
+    :return: Repaired estimates.
+    :rtype: pandas series
+    """
+    cell_cols = [col for col in ps.CELL_COLS if col in estimates.columns]
+    pooled = smoothed.groupby(cell_cols)[["eb_subgroup_estimate", "n_rows"]].agg(
+        {"eb_subgroup_estimate": "mean", "n_rows": "sum"}
+    )
+    aligned = pooled.reindex(pd.MultiIndex.from_frame(estimates[cell_cols]))
+    replace = estimates[estimate_col].isna().to_numpy()
+    if min_rows is not None:
+        replace |= aligned["n_rows"].fillna(0).to_numpy() < min_rows
+    fill = aligned["eb_subgroup_estimate"].to_numpy()
+    return estimates[estimate_col].mask(replace & ~np.isnan(fill), fill)
+
+
+def main():
+    """
+    Entry point for the script.
+    :return: None.
+    :rtype: None.
+    """
+    strat = pd.read_csv("../data/post_stratification_data_by_state.csv")
+    poll = pd.concat(
+        [
+            pd.read_csv("../data/harvard_poll.csv"),
+            pd.read_csv("../data/nat_2020_aug_cleaned.csv"),
+        ],
+        ignore_index=True,
+    )
+    cells, diagnostics = smooth_cells(poll, "vote_choice_recoded", strat)
+    print(f"Smoothing diagnostics:\n{diagnostics}\n")
+    cells.to_csv("../data/eb_cell_estimates_2020.csv", index=False)
+    state_pred = ps.predict_state_se(
+        ps.build_strat_table(
+            "../data/post_stratification_data_by_state.csv",
+            "../data/2020_ecollege_rep.csv",
+            "../data/turnout_by_state.csv",
+        ),
+        cells,
+        "eb_subgroup_estimate",
+        "eb_subgroup_estimate_se",
+        turnout="state_2016",
+    )
+    print(state_pred.sort_values("trump_win_prob").to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
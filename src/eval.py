@@ -42,96 +42,123 @@ def calc_mse_margin(state_outcomes, y_true, y_pred):
     return mse
 
 
-# Load actual data
-
-# With margins
-actual_margin = pd.read_html(
-    "https://en.wikipedia.org/wiki/2020_United_States_presidential_election#Results_by_state"
-)
-
-m1 = actual_margin[29]["State or district"]
-m2 = actual_margin[29]["Margin"]
-clean_margin = pd.concat([m1, m2], axis=1)
-clean_margin.to_csv("../output/actual_margin.csv")
-
-# Due to non-standard state abbreviations and limited data, manual editing of the Wiki-retrieved data was more efficient
-# than using code, resulting in the actual_margin_result.csv file
-cleaned_actual_margin = pd.read_csv("../data/2020_election/actual_margin_result.csv")
-cleaned_actual_margin["%"] = (
-    cleaned_actual_margin["%"].str.strip("%").astype(float) / 100
-)
-
-# Electoral college results
-actual_2020 = pd.read_csv("../data/2020_election/2020_electoral_results.csv")
-
-# Load predictions with margins
-margin_mrp = pd.read_csv("../data/2020_election/margin_final_pred_elec_2020_MRP.csv")
-margin_ml = pd.read_csv("../data/2020_election/margin_final_pred_elec_ML_2020.csv")
-
-# Join predictions and actual
-joined_preds_actual = cleaned_actual_margin.merge(
-    margin_mrp[["State", "margin_trump"]], on="State", how="left"
-)
-joined_preds_actual = joined_preds_actual.merge(
-    margin_ml[["State", "margin_trump"]],
-    on="State",
-    how="left",
-    suffixes=("_mrp", "_ml"),
-)
-
-# Calculate MSE
-# ML MSE
-ml_eval = calc_mse_margin(joined_preds_actual, "%", "margin_trump_ml")
-
-# MRP MSE
-mrp_eval = calc_mse_margin(joined_preds_actual, "%", "margin_trump_mrp")
-
-# Create MSE evaluation dataframe
-model_eval = pd.DataFrame({"ml_mse": [ml_eval], "mrp_mse": [mrp_eval]})
-
-model_eval.to_csv("../output/model_eval.csv", index=False)
-
-# Load predictions
-ml_pred_2020 = pd.read_csv("../data/2020_election/final_pred_elec_ML_2020.csv")
-mrp_pred_2020 = pd.read_csv("../data/2020_election/final_pred_elec_2020_MRP.csv")
-
-actual_2020["actual_winner"] = actual_2020.apply(
-    lambda x: get_winner(x["biden"], x["trump"]), axis=1
-)
-
-# Populate dataframe with predicted outcomes
-actual_2020["ml_pred_winner"] = ml_pred_2020["state_pred"]
-actual_2020["mrp_pred_winner"] = mrp_pred_2020["state_pred"]
-
-# Compare predictions with actual outcomes
-actual_2020["ml_pred_accuracy"] = (
-    actual_2020["actual_winner"] == actual_2020["ml_pred_winner"]
-)
-actual_2020["mrp_pred_accuracy"] = (
-    actual_2020["actual_winner"] == actual_2020["mrp_pred_winner"]
-)
-
-# Remove extraneous rows
-actual_2020 = actual_2020.drop([51, 52], axis=0)
-
-# Calculate accuracy
-# print(np.sum(actual_2020["pred_accuracy"]) / len(actual_2020))
-ml_accuracy = np.round(np.sum(actual_2020["ml_pred_accuracy"]) / len(actual_2020), 5)
-mrp_accuracy = np.round(np.sum(actual_2020["mrp_pred_accuracy"]) / len(actual_2020), 5)
-accuracy_matrix = pd.DataFrame(
-    {
-        "ml_accuracy": [
-            ml_accuracy,
-            np.sum(actual_2020["ml_pred_accuracy"]),
-            len(actual_2020),
-        ],
-        "mrp_accuracy": [
-            mrp_accuracy,
-            np.sum(actual_2020["mrp_pred_accuracy"]),
-            len(actual_2020),
-        ],
-    },
-    index=["accuracy", "states_correct", "total_states"],
-)
-actual_2020.to_csv("../output/accuracy_outcomes.csv")
-accuracy_matrix.to_csv("../output/accuracy_matrix.csv")
+def load_actual_margins(filepath):
+    """
+    Reads the manually cleaned table of actual state margins and converts percentages to proportions.
+    :param filepath: Path to actual_margin_result.csv.
+    :type filepath: str
+    :return: Actual margins by state.
+    :rtype: pandas dataframe
+    """
+    actual_margin = pd.read_csv(filepath)
+    actual_margin["%"] = actual_margin["%"].str.strip("%").astype(float) / 100
+    return actual_margin
+
+
+def evaluate_margins(actual_margin, margin_preds):
+    """
+    Computes the margin MSE of each model against actual results.
+    :param actual_margin: Actual margins by state from load_actual_margins.
+    :type actual_margin: pandas dataframe
+    :param margin_preds: Predicted margins keyed by model name, each with State and margin_trump columns.
+    :type margin_preds: dict of pandas dataframes
+    :return: One column of MSE per model, named <model>_mse.
+    :rtype: pandas dataframe
+    """
+    model_eval = {}
+    for name, margin_pred in margin_preds.items():
+        joined = actual_margin.merge(
+            margin_pred[["State", "margin_trump"]], on="State", how="left"
+        )
+        model_eval[f"{name}_mse"] = [calc_mse_margin(joined, "%", "margin_trump")]
+    return pd.DataFrame(model_eval)
+
+
+def evaluate_accuracy(actual_results, state_preds):
+    """
+    Compares each model's state calls with the actual winners.
+    :param actual_results: Electoral college results by state with biden and trump columns.
+    :type actual_results: pandas dataframe
+    :param state_preds: Predictions keyed by model name, each with a state_pred column in state order.
+    :type state_preds: dict of pandas dataframes
+    :return: Per-state outcomes and a summary accuracy matrix.
+    :rtype: tuple of pandas dataframes
+    """
+    outcomes = actual_results.copy()
+    outcomes["actual_winner"] = outcomes.apply(
+        lambda x: get_winner(x["biden"], x["trump"]), axis=1
+    )
+    matrix = {}
+    for name, state_pred in state_preds.items():
+        # Populate dataframe with predicted outcomes and compare them with actual outcomes
+        outcomes[f"{name}_pred_winner"] = state_pred["state_pred"]
+        outcomes[f"{name}_pred_accuracy"] = (
+            outcomes["actual_winner"] == outcomes[f"{name}_pred_winner"]
+        )
+    for name in state_preds:
+        correct = np.sum(outcomes[f"{name}_pred_accuracy"])
+        matrix[f"{name}_accuracy"] = [
+            np.round(correct / len(outcomes), 5),
+            correct,
+            len(outcomes),
+        ]
+    accuracy_matrix = pd.DataFrame(
+        matrix, index=["accuracy", "states_correct", "total_states"]
+    )
+    return outcomes, accuracy_matrix
+
+
+def main():
+    """
+    Entry point for the script.
+    :return: None.
+    :rtype: None.
+    """
+    # Load actual data with margins
+    actual_margin = pd.read_html(
+        "https://en.wikipedia.org/wiki/2020_United_States_presidential_election#Results_by_state"
+    )
+
+    m1 = actual_margin[29]["State or district"]
+    m2 = actual_margin[29]["Margin"]
+    clean_margin = pd.concat([m1, m2], axis=1)
+    clean_margin.to_csv("../output/actual_margin.csv")
+
+    # Due to non-standard state abbreviations and limited data, manual editing of the Wiki-retrieved data was more
+    # efficient than using code, resulting in the actual_margin_result.csv file
+    cleaned_actual_margin = load_actual_margins(
+        "../data/2020_election/actual_margin_result.csv"
+    )
+
+    # Load predictions with margins and calculate MSE
+    model_eval = evaluate_margins(
+        cleaned_actual_margin,
+        {
+            "ml": pd.read_csv(
+                "../data/2020_election/margin_final_pred_elec_ML_2020.csv"
+            ),
+            "mrp": pd.read_csv(
+                "../data/2020_election/margin_final_pred_elec_2020_MRP.csv"
+            ),
+        },
+    )
+    model_eval.to_csv("../output/model_eval.csv", index=False)
+
+    # Electoral college results, with extraneous total and notes rows removed
+    actual_2020 = pd.read_csv("../data/2020_election/2020_electoral_results.csv")
+    actual_2020 = actual_2020.drop([51, 52], axis=0)
+
+    # Load predictions and calculate accuracy
+    actual_2020, accuracy_matrix = evaluate_accuracy(
+        actual_2020,
+        {
+            "ml": pd.read_csv("../data/2020_election/final_pred_elec_ML_2020.csv"),
+            "mrp": pd.read_csv("../data/2020_election/final_pred_elec_2020_MRP.csv"),
+        },
+    )
+    actual_2020.to_csv("../output/accuracy_outcomes.csv")
+    accuracy_matrix.to_csv("../output/accuracy_matrix.csv")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+"""
+This script keeps a versioned store of recoded poll features, so each raw poll file is recoded once and then read back
+by training and analysis code instead of being recoded again.
+
+A feature set is keyed by the SHA-256 of the raw poll file and a recode spec hash. The spec hash covers the source of
+the loader, of the whole recoder module (its column mapping, recoding function and the helpers and tables they use),
+the helpers in SPEC_DEPENDENCIES and FEATURE_SPEC_VERSION, so editing a recode mapping automatically produces a new key
+and the stale feature set is rebuilt on next use. Feature sets are stored as Parquet, which lets callers read only the
+columns they need.
+
+Writers take an exclusive lock on the store while they recode and update the index, and the index is replaced
+atomically, so concurrent callers neither corrupt it nor lose each other's entries.
+"""
+
+import fcntl
+import hashlib
+import inspect
+import json
+import os
+
+import pandas as pd
+
+import helper as utl
+import state_keys as sk
+
+STORE_DIR = "../data/feature_store"
+
+# Bump to invalidate every stored feature set after a change to a helper the recoders call that is not in
+# SPEC_DEPENDENCIES
+FEATURE_SPEC_VERSION = 1
+
+# Helpers called by the loaders and recoding functions, whose source is part of the spec hash
+SPEC_DEPENDENCIES = [sk, utl.read_and_filter_poll, utl.extract_zipped_data]
+
+INDEX_NAME = "index.json"
+LOCK_NAME = ".lock"
+
+
+def load_reuters(filepath):
+    """
+    Reads raw Reuters/Ipsos poll data.
+    :param filepath: Path to the raw Reuters CSV file.
+    :type filepath: str
+    :return: Raw poll data restricted to the recoded columns.
+    :rtype: dataframe
+    """
+    import process_reuters_poll as reuters
+
+    return utl.read_and_filter_poll(
+        filepath, encoding="windows-1252", cols_to_keep=list(reuters.COL_RENAME)
+    )
+
+
+def load_comet(filepath):
+    """
+    Reads raw COMETrends poll data from a STATA file, or from the first STATA file in a zip archive.
+    :param filepath: Path to the raw COMET .dta or .zip file.
+    :type filepath: str
+    :return: Raw poll data restricted to the recoded columns.
+    :rtype: dataframe
+    """
+    import process_comet_poll as comet
+
+    if filepath.endswith(".zip"):
+        destination = os.path.dirname(filepath)
+        extracted = utl.extract_zipped_data(filepath, destination, file_ext=".dta")
+        filepath = os.path.join(destination, extracted[0])
+    return comet.select_comet_data(pd.read_stata(filepath), list(comet.COL_RENAME))
+
+
+def load_monmouth(filepath):
+    """
+    Reads a raw Monmouth poll.
+    :param filepath: Path to the raw Monmouth .tab file.
+    :type filepath: str
+    :return: Raw poll data restricted to the recoded columns, the vote questions and the weight.
+    :rtype: dataframe
+    """
+    import process_monmouth_poll as monmouth
+
+    return monmouth.read_monmouth_poll(filepath)
+
+
+def get_recoder(source):
+    """
+    Looks up the loader, recoding function and column mapping of a poll source.
+    :param source: Poll source, "reuters", "comet" or "monmouth".
+    :type source: str
+    :return: Loader, recoding function and the recoder module.
+    :rtype: tuple
+    """
+    if source == "reuters":
+        import process_reuters_poll as module
+
+        return load_reuters, module.process_reuters_poll, module
+    if source == "comet":
+        import process_comet_poll as module
+
+        return load_comet, module.process_comet_data, module
+    if source == "monmouth":
+        import process_monmouth_poll as module
+
+        return load_monmouth, module.process_monmouth_poll, module
+    raise ValueError(f"Unknown poll source: {source}")
+
+
+def spec_hash(source):
+    """
+    Hashes everything that determines how a poll source is recoded.
+    :param source: Poll source, "reuters", "comet" or "monmouth".
+    :type source: str
+    :return: Hex digest of the recode spec.
+    :rtype: str
+    """
+    loader, _, module = get_recoder(source)
+    spec = {
+        "version": FEATURE_SPEC_VERSION,
+        "loader": inspect.getsource(loader),
+        "recoder": inspect.getsource(module),
+        "dependencies": [inspect.getsource(dep) for dep in SPEC_DEPENDENCIES],
+    }
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def read_index(store_dir=STORE_DIR):
+    """
+    Reads the store index, which remembers file hashes and the feature sets built so far.
+    :param store_dir: Directory of the feature store (default: STORE_DIR).
+    :type store_dir: str
+    :return: Index with "files" and "features" entries.
+    :rtype: dict
+    """
+    index_path = os.path.join(store_dir, INDEX_NAME)
+    if os.path.exists(index_path):
+        return utl.read_json(index_path)
+    return {"files": {}, "features": {}}
+
+
+def write_index(index, store_dir=STORE_DIR):
+    """
+    Replaces the store index atomically, so a crash mid-write leaves the previous index in place.
+    :param index: Store index.
+    :type index: dict
+    :param store_dir: Directory of the feature store (default: STORE_DIR).
+    :type store_dir: str
+    :return: None.
+    :rtype: None.
+    """
+    index_path = os.path.join(store_dir, INDEX_NAME)
+    tmp_path = f"{index_path}.tmp"
+    utl.write_json(tmp_path, index)
+    os.replace(tmp_path, index_path)
+
+
+def file_hash(filepath, index, chunk_size=1 << 20):
+    """
+    Computes the SHA-256 of a raw file, reusing the stored hash while its size and modification time are unchanged.
+    :param filepath: Path to the raw file.
+    :type filepath: str
+    :param index: Store index from read_index, updated in place.
+    :type index: dict
+    :param chunk_size: Number of bytes read at a time (default: 1 MiB).
+    :type chunk_size: int
+    :return: Hex digest of the file contents.
+    :rtype: str
+    """
+    stat = os.stat(filepath)
+    path_key = os.path.abspath(filepath)
+    cached = index["files"].get(path_key)
+    if (
+        cached
+        and cached["size"] == stat.st_size
+        and cached["mtime"] == stat.st_mtime_ns
+    ):
+        return cached["sha256"]
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as file_obj:
+        for chunk in iter(lambda: file_obj.read(chunk_size), b""):
+            digest.update(chunk)
+    index["files"][path_key] = {
+        "size": stat.st_size,
+        "mtime": stat.st_mtime_ns,
+        "sha256": digest.hexdigest(),
+    }
+    return digest.hexdigest()
+
+
+def feature_key(source, filepath, index):
+    """
+    Builds the key of the feature set for a raw file under the current recode spec.
+    :param source: Poll source, "reuters", "comet" or "monmouth".
+    :type source: str
+    :param filepath: Path to the raw poll file.
+    :type filepath: str
+    :param index: Store index from read_index.
+    :type index: dict
+    :return: Feature set key.
+    :rtype: str
+    """
+    return f"{source}-{file_hash(filepath, index)[:16]}-{spec_hash(source)[:12]}"
+
+
+def materialize(source, filepath, store_dir=STORE_DIR, force=False):
+    """
+    Recodes a raw poll file into the store unless a feature set for the same file and recode spec already exists.
+    :param source: Poll source, "reuters", "comet" or "monmouth".
+    :type source: str
+    :param filepath: Path to the raw poll file.
+    :type filepath: str
+    :param store_dir: Directory of the feature store (default: STORE_DIR).
+    :type store_dir: str
+    :param force: Whether to recode even if the feature set exists (default: False).
+    :type force: bool
+    :return: Path to the Parquet file of the feature set.
+    :rtype: str
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    with open(os.path.join(store_dir, LOCK_NAME), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        index = read_index(store_dir)
+        unchanged = json.dumps(index, sort_keys=True)
+        key = feature_key(source, filepath, index)
+        feature_path = os.path.join(store_dir, f"{key}.parquet")
+        if force or not os.path.exists(feature_path):
+            loader, recode, module = get_recoder(source)
+            features = recode(loader(filepath), keep_all=True)
+            tmp_path = f"{feature_path}.tmp"
+            features.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, feature_path)
+
+            # Feature sets of the same raw file under older specs are stale
+            for old_key, entry in list(index["features"].items()):
+                if entry["raw"] == os.path.abspath(filepath) and old_key != key:
+                    old_path = os.path.join(store_dir, f"{old_key}.parquet")
+                    if os.path.exists(old_path):
+                        os.remove(old_path)
+                    del index["features"][old_key]
+            index["features"][key] = {
+                "source": source,
+                "raw": os.path.abspath(filepath),
+                "columns": list(features.columns),
+                "coded_columns": module.coded_columns(features),
+                "rows": len(features),
+            }
+        if json.dumps(index, sort_keys=True) != unchanged:
+            write_index(index, store_dir)
+    return feature_path
+
+
+def get_features(source, filepath, columns=None, keep_all=True, store_dir=STORE_DIR):
+    """
+    Returns recoded features for a raw poll file, recoding it only if the store has no current feature set.
+    :param source: Poll source, "reuters", "comet" or "monmouth".
+    :type source: str
+    :param filepath: Path to the raw poll file.
+    :type filepath: str
+    :param columns: Optional subset of columns to read (default: None).
+    :type columns: list | None
+    :param keep_all: Whether to include original columns when columns is None, as in the recoding functions
+        (default: True).
+    :type keep_all: bool
+    :param store_dir: Directory of the feature store (default: STORE_DIR).
+    :type store_dir: str
+    :return: Recoded poll data.
+    :rtype: dataframe
+    """
+    feature_path = materialize(source, filepath, store_dir)
+    if columns is None and not keep_all:
+        key = os.path.basename(feature_path)[: -len(".parquet")]
+        columns = read_index(store_dir)["features"][key]["coded_columns"]
+    return pd.read_parquet(feature_path, columns=columns)
+
+
+def main():
+    """
+    Entry point for the script.
+    :return: None.
+    :rtype: None.
+    """
+    raw_files = {
+        "reuters": "../data/reuters_poll/2024_reuters.csv",
+        "comet": "../data/comet_polls/prenov20.zip",
+        "monmouth": "../data/national_aug_2020/MUP222_NATL_archive_full.tab",
+    }
+    for source, filepath in raw_files.items():
+        if os.path.exists(filepath):
+            print(f"{source}: {materialize(source, filepath)}")
+        else:
+            print(f"{source}: raw file {filepath} not found, skipping")
+
+
+if __name__ == "__main__":
+    main()
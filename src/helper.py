@@ -5,14 +5,17 @@ as `utl`.
 
 import csv
 import gzip
+import io
 import json
 import os
 import shutil
 import zipfile
+from multiprocessing import shared_memory
 
+import numpy as np
 import pandas as pd
 
-import map_viz_gen as mp
+import state_keys as sk
 
 
 def read_json(filepath, encoding="utf-8"):
@@ -26,7 +29,9 @@ def read_json(filepath, encoding="utf-8"):
         return json.load(file_obj)
 
 
-def write_json(filepath, data, encoding="utf-8", ensure_ascii=False, indent=2):
+def write_json(
+    filepath, data, encoding="utf-8", ensure_ascii=False, indent=2, compression="infer"
+):
     """
     Serializes an object as JSON.
     :param filepath: (str) name of path for file
@@ -34,11 +39,283 @@ def write_json(filepath, data, encoding="utf-8", ensure_ascii=False, indent=2):
     :param encoding: (str) name of the encoding for file.
     :param ensure_ascii: (bool) whether non-ASCII characters are printed as-is. If True, non-ASCII characters
         are escaped.
-    :param indent: the number of "pretty printed" indentation spaces to apply to encoded JSON.
+    :param indent: the number of "pretty printed" indentation spaces to apply to encoded JSON. If None, the JSON is
+        written without any whitespace between items.
+    :param compression: (str | None) "gzip", "zstd", None, or "infer" to choose from the file extension.
     :return: None.
     """
-    with open(filepath, "w", encoding=encoding) as file_obj:
-        json.dump(data, file_obj, ensure_ascii=ensure_ascii, indent=indent)
+    separators = (",", ":") if indent is None else None
+    with open_output(filepath, encoding=encoding, compression=compression) as file_obj:
+        json.dump(
+            data,
+            file_obj,
+            ensure_ascii=ensure_ascii,
+            indent=indent,
+            separators=separators,
+        )
+
+
+def infer_compression(filepath, compression="infer"):
+    """
+    Determines the compression codec for a file.
+    :param filepath: path to file.
+    :type filepath: str
+    :param compression: "gzip", "zstd", None, or "infer" to choose from the file extension (.gz, .zst).
+    :type compression: str | None
+    :return: name of the codec, or None for uncompressed output.
+    :rtype: str | None
+    """
+    if compression != "infer":
+        return compression
+    if filepath.endswith(".gz"):
+        return "gzip"
+    if filepath.endswith(".zst"):
+        return "zstd"
+    return None
+
+
+def open_output(
+    filepath, encoding="utf-8", newline="", compression="infer", level=None
+):
+    """
+    Opens a text file for writing, transparently compressing it with gzip or zstd.
+    :param filepath: path to file.
+    :type filepath: str
+    :param encoding: name of encoding for file.
+    :type encoding: str
+    :param newline: replacement value for newline character.
+    :type newline: str
+    :param compression: "gzip", "zstd", None, or "infer" to choose from the file extension (.gz, .zst).
+    :type compression: str | None
+    :param level: compression level. Defaults to fast settings (gzip 4, zstd 3) so writing stays I/O-bound.
+    :type level: int | None
+    :return: writable text file object.
+    :rtype: io.TextIOWrapper
+    """
+    codec = infer_compression(filepath, compression)
+    if codec is None:
+        return open(filepath, "w", encoding=encoding, newline=newline)
+    if codec == "gzip":
+        return gzip.open(
+            filepath,
+            "wt",
+            compresslevel=4 if level is None else level,
+            encoding=encoding,
+            newline=newline,
+        )
+    if codec == "zstd":
+        try:
+            import zstandard
+        except ImportError as e:
+            raise ImportError(
+                "zstd compression requires the zstandard package (pip install zstandard)"
+            ) from e
+        compressor = zstandard.ZstdCompressor(level=3 if level is None else level)
+        stream = compressor.stream_writer(open(filepath, "wb"), closefd=True)
+        return io.TextIOWrapper(stream, encoding=encoding, newline=newline)
+    raise ValueError(f"Unsupported compression: {codec}")
+
+
+def iter_batches(data, batch_size):
+    """
+    Splits tabular data into dataframe batches.
+    :param data: a dataframe, or an iterable of dataframes such as a generator of simulation results.
+    :type data: dataframe | iterable
+    :param batch_size: maximum number of rows per batch when data is a single dataframe.
+    :type batch_size: int
+    :return: generator of dataframes.
+    :rtype: generator
+    """
+    if isinstance(data, pd.DataFrame):
+        for start in range(0, max(len(data), 1), batch_size):
+            yield data.iloc[start : start + batch_size]
+    else:
+        yield from data
+
+
+def replace_empty_strings(frame, replace_null="None"):
+    """
+    Replaces empty strings in text columns. Missing values in every column are handled by the CSV writer's na_rep,
+    so numeric columns are never converted to Python objects.
+    :param frame: data to clean.
+    :type frame: dataframe
+    :param replace_null: replacement value for empty strings.
+    :type replace_null: str
+    :return: dataframe with empty strings replaced.
+    :rtype: dataframe
+    """
+    text_cols = [
+        col
+        for col in frame.columns
+        if frame[col].dtype == object or pd.api.types.is_string_dtype(frame[col])
+    ]
+    if not text_cols:
+        return frame
+    frame = frame.copy(deep=False)
+    for col in text_cols:
+        empty = frame[col].to_numpy() == ""
+        if empty.any():
+            frame[col] = frame[col].mask(empty, replace_null)
+    return frame
+
+
+def write_frame_csv(
+    filepath,
+    data,
+    replace_null="None",
+    batch_size=100_000,
+    encoding="utf-8",
+    compression="infer",
+    level=None,
+):
+    """
+    Writes tabular data to a (optionally compressed) CSV file in batches. Missing values are replaced with
+    vectorized column operations, so large tables are written at close to I/O speed.
+    :param filepath: path to file. Files ending in .gz or .zst are compressed unless compression is given.
+    :type filepath: str
+    :param data: a dataframe, or an iterable of dataframes with identical columns.
+    :type data: dataframe | iterable
+    :param replace_null: replacement value for missing data and empty strings.
+    :type replace_null: str
+    :param batch_size: number of rows written per batch.
+    :type batch_size: int
+    :param encoding: name of encoding for file.
+    :type encoding: str
+    :param compression: "gzip", "zstd", None, or "infer" to choose from the file extension.
+    :type compression: str | None
+    :param level: compression level (default: fast settings).
+    :type level: int | None
+    :return: number of data rows written.
+    :rtype: int
+    """
+    n_rows = 0
+    with open_output(
+        filepath, encoding=encoding, compression=compression, level=level
+    ) as file_obj:
+        for i, batch in enumerate(iter_batches(data, batch_size)):
+            batch = replace_empty_strings(batch, replace_null)
+            batch.to_csv(
+                file_obj,
+                header=i == 0,
+                index=False,
+                na_rep=replace_null,
+                lineterminator="\n",
+            )
+            n_rows += len(batch)
+    return n_rows
+
+
+def write_ndjson(
+    filepath,
+    data,
+    batch_size=100_000,
+    encoding="utf-8",
+    compression="infer",
+    level=None,
+):
+    """
+    Writes records as newline-delimited JSON, one object per line, in batches.
+    :param filepath: path to file. Files ending in .gz or .zst are compressed unless compression is given.
+    :type filepath: str
+    :param data: a dataframe, an iterable of dataframes, or an iterable of dictionaries.
+    :type data: dataframe | iterable
+    :param batch_size: number of rows written per batch.
+    :type batch_size: int
+    :param encoding: name of encoding for file.
+    :type encoding: str
+    :param compression: "gzip", "zstd", None, or "infer" to choose from the file extension.
+    :type compression: str | None
+    :param level: compression level (default: fast settings).
+    :type level: int | None
+    :return: number of records written.
+    :rtype: int
+    """
+    n_rows = 0
+    with open_output(
+        filepath, encoding=encoding, compression=compression, level=level
+    ) as file_obj:
+        if not isinstance(data, pd.DataFrame):
+            data = iter(data)
+            first = next(data, None)
+            if first is None:
+                return 0
+            data = _chain_first(first, data)
+            if not isinstance(first, pd.DataFrame):
+                # Plain records are encoded one at a time with compact separators
+                for record in data:
+                    file_obj.write(
+                        json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+                    )
+                    file_obj.write("\n")
+                    n_rows += 1
+                return n_rows
+        for batch in iter_batches(data, batch_size):
+            if batch.empty:
+                continue
+            # Each batch is encoded by pandas in a single call and already ends with a newline
+            file_obj.write(
+                batch.to_json(orient="records", lines=True, force_ascii=False)
+            )
+            n_rows += len(batch)
+    return n_rows
+
+
+def _chain_first(first, rest):
+    """
+    Yields an item that was already taken from an iterator, followed by the rest of the iterator.
+    """
+    yield first
+    yield from rest
+
+
+def share_arrays(arrays):
+    """
+    Copies arrays into a single shared memory block.
+    :param arrays: Arrays keyed by name.
+    :type arrays: dict
+    :return: Shared memory block and the layout needed to attach to it.
+    :rtype: tuple
+    """
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        # Keep every array 8-byte aligned
+        offset = -(-offset // 8) * 8
+        layout[name] = (offset, array.shape, array.dtype.str)
+        offset += array.nbytes
+    block = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    for name, array in arrays.items():
+        view = attach_array(block, layout[name])
+        view[...] = array
+    return block, layout
+
+
+def attach_array(block, spec):
+    """
+    Creates a numpy view of one array in a shared memory block.
+    :param block: Shared memory block.
+    :type block: multiprocessing.shared_memory.SharedMemory
+    :param spec: Offset, shape and dtype of the array.
+    :type spec: tuple
+    :return: Array backed by the shared memory block.
+    :rtype: numpy array
+    """
+    offset, shape, dtype = spec
+    return np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf, offset=offset)
+
+
+def attach_shared(block_name, layout):
+    """
+    Attaches to a shared memory block created by share_arrays, e.g. in a process pool initializer.
+    :param block_name: Name of the shared memory block.
+    :type block_name: str
+    :param layout: Layout returned by share_arrays.
+    :type layout: dict
+    :return: Shared memory block (keep a reference while the arrays are in use) and arrays keyed by name.
+    :rtype: tuple
+    """
+    block = shared_memory.SharedMemory(name=block_name)
+    return block, {name: attach_array(block, spec) for name, spec in layout.items()}
 
 
 def write_csv(
@@ -131,11 +408,13 @@ def get_fips(url, delimiter="|"):
     :type url: str
     :param delimiter: Optional delimiter used on Census website.
     :type delimiter: str
-    :return: FIPs codes with matching state names data.
+    :return: FIPs codes of the states and the District of Columbia, keyed as in state_keys, with lowercase names.
     :rtype: dataframe
     """
     fips = pd.read_csv(url, sep=delimiter)
-    fips["STATE_NAME"] = fips["STATE_NAME"].str.lower().str.strip()
+    fips["STATEFP"] = sk.to_fips(fips["STATEFP"])
+    fips = fips.dropna(subset=["STATEFP"]).reset_index(drop=True)
+    fips["STATE_NAME"] = sk.state_names(fips["STATEFP"])
     return fips
 
 
@@ -249,6 +528,9 @@ def read_and_filter_poll(
 
 
 def main():
+    # Map generation pulls in geopandas and matplotlib, which scripts importing helper should not pay for
+    import map_viz_gen as mp
+
     # e_college_votes = get_e_college_rep(
     #     "https://www.archives.gov/electoral-college/allocation"
     # )
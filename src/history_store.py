@@ -0,0 +1,392 @@
+"""
+This script keeps an append-only history of prediction runs, so changes in state calls, margins and electoral votes
+between runs can be looked up without rereading every final_pred_elec CSV.
+
+The store has three parts, all of which are only ever added to:
+
+- runs/<run_id>.parquet holds the per-state outputs of one run (call, margin, win probability, electoral votes),
+  keyed by integer FIPS code, so comparing two runs reads two small files whatever the length of the history,
+- states/<FIPS>.jsonl holds one line per run for each state, so the time series of a state reads one file,
+- runs.jsonl is the run index, with one line per run giving its model, config id and electoral vote totals.
+
+A run is appended by writing its Parquet file, then its state lines, and finally its index line. The index line marks
+the run as complete: readers ignore state lines of runs missing from the index, so an interrupted append leaves the
+history consistent.
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+import state_keys as sk
+
+STORE_DIR = "../output/history"
+
+INDEX_NAME = "runs.jsonl"
+
+# Prediction CSVs written before the history existed
+BACKFILL_PATTERN = "../data/final_pred_elec*.csv"
+
+# Per-state outputs stored for each run, when the predictions have them
+VALUE_COLS = [
+    "state_pred",
+    "margin_trump",
+    "trump_win_prob",
+    "trump_share",
+    "trump_votes_states",
+    "biden_votes_states",
+    "state_votes",
+]
+
+# Margins that move by less than this are not reported as changes
+MARGIN_TOLERANCE = 0.005
+
+
+def config_id(config):
+    """
+    Identifies a run configuration by a hash of its JSON representation.
+    :param config: JSON-serializable run configuration.
+    :type config: dict
+    :return: Hex digest prefix.
+    :rtype: str
+    """
+    payload = json.dumps(config, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:12]
+
+
+def new_run_id():
+    """
+    Creates a run id that sorts by creation time.
+    :return: Run id.
+    :rtype: str
+    """
+    return f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+
+def run_table(state_pred):
+    """
+    Keys state predictions by FIPS code and keeps the outputs stored in the history.
+    :param state_pred: State predictions, e.g. from predict_states or a final_pred_elec CSV, with state names in a
+        "state" or "State" column.
+    :type state_pred: pandas dataframe
+    :return: One row per state with STATEFIP, state and the available VALUE_COLS, sorted by STATEFIP.
+    :rtype: pandas dataframe
+    """
+    name_col = "state" if "state" in state_pred.columns else "State"
+    fips = sk.to_fips(state_pred[name_col])
+    table = state_pred[[col for col in VALUE_COLS if col in state_pred.columns]].copy()
+    if "margin_trump" not in table.columns and "trump_votes_states" in table.columns:
+        total = table["trump_votes_states"] + table["biden_votes_states"]
+        table["margin_trump"] = (
+            table["biden_votes_states"] - table["trump_votes_states"]
+        ) / total
+    table.insert(0, "STATEFIP", fips.astype("float64").to_numpy())
+    table = table[table["STATEFIP"].notna()]
+    table["STATEFIP"] = table["STATEFIP"].astype(np.int8)
+    table.insert(1, "state", sk.state_names(table["STATEFIP"]))
+    return table.sort_values("STATEFIP").reset_index(drop=True)
+
+
+def read_index(store_dir=STORE_DIR):
+    """
+    Reads the run index.
+    :param store_dir: Directory of the history store (default: STORE_DIR).
+    :type store_dir: str
+    :return: One row per complete run, in the order the runs were appended.
+    :rtype: pandas dataframe
+    """
+    index_path = os.path.join(store_dir, INDEX_NAME)
+    if not os.path.exists(index_path) or os.path.getsize(index_path) == 0:
+        return pd.DataFrame(
+            columns=["run_id", "created", "model", "config_id", "trump", "biden"]
+        )
+    return pd.read_json(index_path, lines=True, dtype={"run_id": str})
+
+
+def append_line(filepath, entry):
+    """
+    Appends one JSON line to a file with a single write.
+    :param filepath: Path to the JSON lines file.
+    :type filepath: str
+    :param entry: JSON-serializable entry.
+    :type entry: dict
+    :return: None.
+    :rtype: None.
+    """
+    line = json.dumps(entry, separators=(",", ":"), default=str) + "\n"
+    with open(filepath, "a", encoding="utf-8") as file_obj:
+        file_obj.write(line)
+        file_obj.flush()
+        os.fsync(file_obj.fileno())
+
+
+def append_run(state_pred, model, config=None, run_id=None, store_dir=STORE_DIR):
+    """
+    Appends the state predictions of a run to the history.
+    :param state_pred: State predictions, e.g. from predict_states.
+    :type state_pred: pandas dataframe
+    :param model: Name of the model or run, e.g. the namespace of a batch run.
+    :type model: str
+    :param config: JSON-serializable run configuration, identified in the index by its hash (default: None).
+    :type config: dict | None
+    :param run_id: Id of the run (default: a new id from the current time).
+    :type run_id: str | None
+    :param store_dir: Directory of the history store (default: STORE_DIR).
+    :type store_dir: str
+    :return: Index entry of the run.
+    :rtype: dict
+    """
+    run_id = run_id or new_run_id()
+    os.makedirs(os.path.join(store_dir, "runs"), exist_ok=True)
+    os.makedirs(os.path.join(store_dir, "states"), exist_ok=True)
+    run_path = os.path.join(store_dir, "runs", f"{run_id}.parquet")
+    if os.path.exists(run_path) or run_id in set(read_index(store_dir)["run_id"]):
+        raise ValueError(f"Run already in the history: {run_id}")
+
+    table = run_table(state_pred)
+    entry = {
+        "run_id": run_id,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "model": model,
+        "config_id": config_id(config) if config is not None else None,
+        **(
+            {
+                "trump": int(table.loc[table["state_pred"] == 1, "state_votes"].sum()),
+                "biden": int(table.loc[table["state_pred"] == 0, "state_votes"].sum()),
+            }
+            if {"state_pred", "state_votes"} <= set(table.columns)
+            else {}
+        ),
+        "states": len(table),
+    }
+    tmp_path = f"{run_path}.tmp"
+    table.assign(run_id=run_id).to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, run_path)
+
+    values = table.drop(columns=["STATEFIP", "state"])
+    records = values.astype(object).where(values.notna(), None).to_dict("records")
+    for fips, record in zip(table["STATEFIP"], records):
+        append_line(
+            os.path.join(store_dir, "states", f"{fips:02d}.jsonl"),
+            {"run_id": run_id, "created": entry["created"], "model": model, **record},
+        )
+    append_line(os.path.join(store_dir, INDEX_NAME), entry)
+    return entry
+
+
+def backfill(pattern=BACKFILL_PATTERN, store_dir=STORE_DIR):
+    """
+    Appends existing prediction CSVs to the history as runs, oldest file first. Each file becomes the run
+    backfill-<file name>, with the file name as its model, so files already in the history are skipped.
+    :param pattern: Glob pattern of the CSVs (default: BACKFILL_PATTERN).
+    :type pattern: str
+    :param store_dir: Directory of the history store (default: STORE_DIR).
+    :type store_dir: str
+    :return: Index entries of the appended runs.
+    :rtype: list
+    """
+    existing = set(read_index(store_dir)["run_id"])
+    entries = []
+    for filepath in sorted(glob.glob(pattern), key=os.path.getmtime):
+        name = os.path.splitext(os.path.basename(filepath))[0]
+        run_id = f"backfill-{name}"
+        if run_id in existing:
+            continue
+        entries.append(
+            append_run(
+                pd.read_csv(filepath),
+                name,
+                config={"source": os.path.basename(filepath)},
+                run_id=run_id,
+                store_dir=store_dir,
+            )
+        )
+    return entries
+
+
+def parse_run(value):
+    """
+    Reads a run given on the command line, where an integer such as -2 is a position in the index.
+    :param value: Command line value.
+    :type value: str
+    :return: Run id or integer position.
+    :rtype: str | int
+    """
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+
+def resolve_run(run_id, index):
+    """
+    Resolves a run id, or a position in the index such as -1 for the latest run, to a run id.
+    :param run_id: Run id or integer position.
+    :type run_id: str | int
+    :param index: Run index from read_index.
+    :type index: pandas dataframe
+    :return: Run id.
+    :rtype: str
+    """
+    if isinstance(run_id, (int, np.integer)):
+        if index.empty:
+            raise KeyError("The history has no runs.")
+        return index["run_id"].iloc[run_id]
+    if run_id not in set(index["run_id"]):
+        raise KeyError(f"No run {run_id} in the history.")
+    return run_id
+
+
+def load_run(run_id=-1, store_dir=STORE_DIR, columns=None):
+    """
+    Reads the per-state outputs of one run.
+    :param run_id: Run id, or position in the index (default: -1, the latest run).
+    :type run_id: str | int
+    :param store_dir: Directory of the history store (default: STORE_DIR).
+    :type store_dir: str
+    :param columns: Columns to read (default: all).
+    :type columns: list | None
+    :return: One row per state.
+    :rtype: pandas dataframe
+    """
+    run_id = resolve_run(run_id, read_index(store_dir))
+    return pd.read_parquet(
+        os.path.join(store_dir, "runs", f"{run_id}.parquet"), columns=columns
+    )
+
+
+def diff_runs(
+    old_run, new_run=-1, store_dir=STORE_DIR, margin_tolerance=MARGIN_TOLERANCE
+):
+    """
+    Lists the states whose call or margin changed between two runs, reading only those two runs.
+    :param old_run: Run id, or position in the index, of the earlier run.
+    :type old_run: str | int
+    :param new_run: Run id, or position in the index, of the later run (default: -1, the latest run).
+    :type new_run: str | int
+    :param store_dir: Directory of the history store (default: STORE_DIR).
+    :type store_dir: str
+    :param margin_tolerance: Smallest margin change reported (default: MARGIN_TOLERANCE).
+    :type margin_tolerance: float
+    :return: One row per changed state with old and new values, a "flipped" flag and the margin change, largest
+        changes first.
+    :rtype: pandas dataframe
+    """
+    old = load_run(old_run, store_dir).drop(columns="run_id")
+    new = load_run(new_run, store_dir).drop(columns="run_id")
+    diff = pd.merge(
+        old, new, on=["STATEFIP", "state"], how="outer", suffixes=("_old", "_new")
+    )
+    diff["flipped"] = diff["state_pred_old"] != diff["state_pred_new"]
+    diff["margin_change"] = diff["margin_trump_new"] - diff["margin_trump_old"]
+    if "trump_win_prob_old" in diff.columns and "trump_win_prob_new" in diff.columns:
+        diff["win_prob_change"] = (
+            diff["trump_win_prob_new"] - diff["trump_win_prob_old"]
+        )
+    changed = diff["flipped"] | (diff["margin_change"].abs() >= margin_tolerance)
+    diff = diff[changed].copy()
+    order = diff["margin_change"].abs().fillna(np.inf).sort_values(ascending=False)
+    return diff.loc[order.index].reset_index(drop=True)
+
+
+def summarize_diff(diff):
+    """
+    Summarizes a run diff for regression checks.
+    :param diff: Run diff from diff_runs.
+    :type diff: pandas dataframe
+    :return: Flipped states, the electoral votes that moved to each candidate and the largest margin change.
+    :rtype: dict
+    """
+    flipped = diff[diff["flipped"]]
+    votes = flipped["state_votes_new"].fillna(flipped["state_votes_old"])
+    return {
+        "flipped": list(flipped["state"]),
+        "to_trump": int(votes[flipped["state_pred_new"] == 1].sum()),
+        "to_biden": int(votes[flipped["state_pred_new"] == 0].sum()),
+        "max_margin_change": (
+            float(diff["margin_change"].abs().max()) if len(diff) else 0.0
+        ),
+    }
+
+
+def state_history(state, store_dir=STORE_DIR, model=None):
+    """
+    Reads the time series of one state's outputs across runs from its state file.
+    :param state: State name, abbreviation or FIPS code.
+    :type state: str | int
+    :param store_dir: Directory of the history store (default: STORE_DIR).
+    :type store_dir: str
+    :param model: Only keep runs of this model (default: all).
+    :type model: str | None
+    :return: One row per complete run, in the order the runs were appended.
+    :rtype: pandas dataframe
+    """
+    fips = sk.to_fips([state]).iloc[0]
+    if pd.isna(fips):
+        raise KeyError(f"Unknown state: {state}")
+    state_path = os.path.join(store_dir, "states", f"{int(fips):02d}.jsonl")
+    if not os.path.exists(state_path):
+        return pd.DataFrame()
+    history = pd.read_json(state_path, lines=True, dtype={"run_id": str})
+    # Lines of runs missing from the index come from interrupted appends
+    history = history[history["run_id"].isin(read_index(store_dir)["run_id"])]
+    if model is not None:
+        history = history[history["model"] == model]
+    return history.reset_index(drop=True)
+
+
+def main():
+    """
+    Entry point for the script.
+    :return: None.
+    :rtype: None.
+    """
+    parser = argparse.ArgumentParser(description="Query the prediction history.")
+    parser.add_argument("--store", default=STORE_DIR)
+    parser.add_argument(
+        "--append",
+        nargs=2,
+        metavar=("MODEL", "CSV"),
+        help="Append the state predictions in CSV as a run of MODEL.",
+    )
+    parser.add_argument(
+        "--backfill",
+        nargs="?",
+        const=BACKFILL_PATTERN,
+        metavar="GLOB",
+        help=f"Append the prediction CSVs matching GLOB (default: {BACKFILL_PATTERN}) that are not in the history.",
+    )
+    parser.add_argument(
+        "--since",
+        type=parse_run,
+        help="Show what changed between this run, or index position such as -2, and the latest run.",
+    )
+    parser.add_argument("--state", help="Show the time series of this state.")
+    args = parser.parse_args()
+
+    if args.append:
+        model, filepath = args.append
+        entry = append_run(pd.read_csv(filepath), model, store_dir=args.store)
+        print(f"Appended run {entry['run_id']}: {entry}")
+    if args.backfill:
+        for entry in backfill(args.backfill, store_dir=args.store):
+            print(f"Appended run {entry['run_id']}: {entry}")
+    if args.since is not None:
+        diff = diff_runs(args.since, store_dir=args.store)
+        print(diff)
+        print(summarize_diff(diff))
+    if args.state:
+        print(state_history(args.state, store_dir=args.store))
+    if not (args.append or args.backfill or args.since is not None or args.state):
+        print(read_index(args.store))
+
+
+if __name__ == "__main__":
+    main()
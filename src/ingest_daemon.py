@@ -0,0 +1,717 @@
+"""
+This script runs a local ingest service. It watches a drop directory for new raw poll files and takes each one from
+arrival to a published results feed without anyone running scripts:
+
+    unzip -> recode (feature_store) -> score cells (eb_smoothing) -> aggregate states (post_strat) -> publish
+
+The type of poll (Reuters/Ipsos CSV, COMETrends STATA or Monmouth tab-separated archive, optionally zipped) is detected
+from the file's columns.
+Accepted files are moved out of the drop directory into the ingest directory and recorded as jobs in a SQLite queue,
+so queued and failed jobs survive restarts. Jobs run on a bounded pool of worker processes:
+
+- backpressure: the watcher leaves new files in the drop directory while MAX_QUEUED jobs are waiting, and the pool
+  only takes as many jobs as it has workers,
+- retries: a failed job is queued again after RETRY_DELAY seconds, doubling with each attempt, until MAX_ATTEMPTS, and
+  a worker process that dies (e.g. killed for running out of memory) fails its job and the pool is replaced,
+- status: every job records its state, current stage, attempts, last error and result (see the status command).
+
+Cells are scored with empirical-Bayes smoothing, which takes milliseconds, rather than a Stan refit. Results are
+published as a hex map feed under feeds/ingest/<source>/<job id>.json, which the website serves as soon as it is
+written, and appended to the prediction history.
+
+Usage: python ingest_daemon.py serve, python ingest_daemon.py status, python ingest_daemon.py retry JOB_ID
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import pandas as pd
+
+import helper as utl
+
+DROP_DIR = "../data/drop"
+INGEST_DIR = "../output/ingest"
+QUEUE_NAME = "queue.sqlite3"
+
+# Seconds between scans of the drop directory; a file is taken once its size and modification time are unchanged
+# between two scans, so files still being copied are left alone
+POLL_INTERVAL = 5
+
+MAX_WORKERS = 2
+MAX_QUEUED = 20
+MAX_ATTEMPTS = 3
+RETRY_DELAY = 30
+
+# Raw file type and the columns of each source's recoded data that hold the demographic cell dimensions and the vote
+# for Trump (1) or Biden (0). COMETrends asks for birth year, which is bucketed into age_group.
+SOURCES = {
+    "reuters": {
+        "extension": ".csv",
+        "cells": {
+            "age_group_coded": "age_recoded",
+            "gender_coded": "male",
+            "education_coded": "education_recoded",
+            "race_coded": "race_recoded",
+            "STATEFP": "STATEFIP",
+        },
+        "outcome": "vote_choice_coded",
+        # Reuters codes college degrees as 2; the ACS cells use 3
+        "education": {2: 3},
+    },
+    "comet": {
+        "extension": ".dta",
+        "cells": {
+            "age_group": "age_recoded",
+            "gender_coded": "male",
+            "education_coded": "education_recoded",
+            "race_coded": "race_recoded",
+            "STATEFP": "STATEFIP",
+        },
+        "outcome": "vote_coded",
+    },
+    "monmouth": {
+        "extension": ".tab",
+        "cells": {
+            "age_recoded": "age_recoded",
+            "male": "male",
+            "education_recoded": "education_recoded",
+            "race_recoded": "race_recoded",
+            "STATEFP": "STATEFIP",
+        },
+        "outcome": "vote_choice_recoded",
+    },
+}
+
+SHARED = {
+    "post_strat": "../data/post_stratification_data_by_state.csv",
+    "ecollege": "../data/2020_ecollege_rep.csv",
+    "turnout": "../data/turnout_by_state.csv",
+    "feature_store": "../data/feature_store",
+    "feeds_dir": "../website_699/ppredict/feeds",
+    "history_dir": "../output/history",
+    "turnout_method": "state_2020",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    path TEXT NOT NULL,
+    sha256 TEXT NOT NULL UNIQUE,
+    source TEXT,
+    state TEXT NOT NULL,
+    stage TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    not_before REAL NOT NULL DEFAULT 0,
+    error TEXT,
+    result TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+)
+"""
+
+
+def connect(ingest_dir=INGEST_DIR):
+    """
+    Opens the job queue, creating it if needed.
+    :param ingest_dir: Directory of the ingest service (default: INGEST_DIR).
+    :type ingest_dir: str
+    :return: Connection to the queue database.
+    :rtype: sqlite3.Connection
+    """
+    os.makedirs(ingest_dir, exist_ok=True)
+    conn = sqlite3.connect(
+        os.path.join(ingest_dir, QUEUE_NAME), timeout=30, isolation_level=None
+    )
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(SCHEMA)
+    return conn
+
+
+def file_sha256(filepath, chunk_size=1 << 20):
+    """
+    Computes the SHA-256 of a file, which identifies a poll file however often it is dropped.
+    :param filepath: Path to the file.
+    :type filepath: str
+    :param chunk_size: Number of bytes read at a time (default: 1 MiB).
+    :type chunk_size: int
+    :return: Hex digest of the file contents.
+    :rtype: str
+    """
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as file_obj:
+        for chunk in iter(lambda: file_obj.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def detect_columns(source, columns):
+    """
+    Checks whether a file's columns contain every raw column recoded for a source.
+    :param source: Poll source, "reuters", "comet" or "monmouth".
+    :type source: str
+    :param columns: Column names of the file.
+    :type columns: list
+    :return: Whether the file is a poll of that source.
+    :rtype: bool
+    """
+    if source == "reuters":
+        import process_reuters_poll as module
+    elif source == "comet":
+        import process_comet_poll as module
+    else:
+        import process_monmouth_poll as module
+
+        if module.vote_columns(columns) is None:
+            return False
+    return set(module.COL_RENAME) <= set(columns)
+
+
+def detect_source(filepath):
+    """
+    Detects the poll source of a raw file from its columns, looking inside zip archives.
+    :param filepath: Path to a .csv, .dta, .tab or .zip file.
+    :type filepath: str
+    :return: Poll source, or None if the file is not a known poll.
+    :rtype: str | None
+    """
+    extensions = tuple(spec["extension"] for spec in SOURCES.values())
+    if filepath.endswith(".zip"):
+        with zipfile.ZipFile(filepath) as archive:
+            names = [
+                name
+                for name in archive.namelist()
+                if "__MACOSX" not in name and name.endswith(extensions)
+            ]
+            if not names:
+                return None
+            with archive.open(names[0]) as file_obj:
+                if names[0].endswith(".dta"):
+                    with pd.read_stata(file_obj, iterator=True) as reader:
+                        columns = reader.varlist
+                elif names[0].endswith(".tab"):
+                    columns = list(pd.read_csv(file_obj, sep="\t", nrows=0).columns)
+                else:
+                    columns = pd.read_csv(file_obj, nrows=0, encoding="windows-1252")
+                    columns = list(columns.columns)
+    elif filepath.endswith(".dta"):
+        with pd.read_stata(filepath, iterator=True) as reader:
+            columns = reader.varlist
+    elif filepath.endswith(".tab"):
+        columns = list(pd.read_csv(filepath, sep="\t", nrows=0).columns)
+    elif filepath.endswith(".csv"):
+        columns = list(pd.read_csv(filepath, nrows=0, encoding="windows-1252").columns)
+    else:
+        return None
+    for source in SOURCES:
+        if detect_columns(source, columns):
+            return source
+    return None
+
+
+def scan_drop_dir(drop_dir, seen):
+    """
+    Lists the files of the drop directory that have not changed since the previous scan.
+    :param drop_dir: Directory watched for new poll files.
+    :type drop_dir: str
+    :param seen: Size and modification time of each file at the previous scan, updated in place.
+    :type seen: dict
+    :return: Paths of files ready to be queued.
+    :rtype: list
+    """
+    ready, current = [], {}
+    for entry in os.scandir(drop_dir):
+        if not entry.is_file() or entry.name.startswith("."):
+            continue
+        if entry.name.endswith((".part", ".tmp", ".crdownload")):
+            continue
+        stat = entry.stat()
+        current[entry.path] = (stat.st_size, stat.st_mtime_ns)
+        if seen.get(entry.path) == current[entry.path]:
+            ready.append(entry.path)
+    seen.clear()
+    seen.update(current)
+    return sorted(ready)
+
+
+def enqueue(conn, filepath, ingest_dir=INGEST_DIR):
+    """
+    Moves a dropped file into the ingest directory and queues a job for it. Files already ingested are set aside.
+    :param conn: Connection from connect.
+    :type conn: sqlite3.Connection
+    :param filepath: Path to the dropped file.
+    :type filepath: str
+    :param ingest_dir: Directory of the ingest service (default: INGEST_DIR).
+    :type ingest_dir: str
+    :return: Id of the new job, or None for a duplicate.
+    :rtype: int | None
+    """
+    sha256 = file_sha256(filepath)
+    name = os.path.basename(filepath)
+    if conn.execute("SELECT 1 FROM jobs WHERE sha256 = ?", (sha256,)).fetchone():
+        os.makedirs(os.path.join(ingest_dir, "duplicates"), exist_ok=True)
+        os.replace(filepath, os.path.join(ingest_dir, "duplicates", name))
+        print(f"Skipped {name}: already ingested")
+        return None
+    try:
+        source = detect_source(filepath)
+    except Exception as e:
+        print(f"Could not read {name}: {e}")
+        source = None
+    os.makedirs(os.path.join(ingest_dir, "inbox"), exist_ok=True)
+    path = os.path.join(ingest_dir, "inbox", f"{sha256[:16]}_{name}")
+    os.replace(filepath, path)
+    now = time.time()
+    cursor = conn.execute(
+        "INSERT INTO jobs (name, path, sha256, source, state, error, created, updated) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        (
+            name,
+            path,
+            sha256,
+            source,
+            "queued" if source else "rejected",
+            None if source else "Unrecognized poll file",
+            now,
+            now,
+        ),
+    )
+    print(f"Queued job {cursor.lastrowid}: {name} ({source or 'rejected'})")
+    return cursor.lastrowid
+
+
+def count_waiting(conn):
+    """
+    Counts the jobs waiting to run.
+    :param conn: Connection from connect.
+    :type conn: sqlite3.Connection
+    :return: Number of queued jobs.
+    :rtype: int
+    """
+    row = conn.execute("SELECT COUNT(*) FROM jobs WHERE state = 'queued'").fetchone()
+    return row[0]
+
+
+def claim_job(conn):
+    """
+    Takes the oldest queued job that is due and marks it as running.
+    :param conn: Connection from connect.
+    :type conn: sqlite3.Connection
+    :return: The job, or None if no job is due.
+    :rtype: dict | None
+    """
+    now = time.time()
+    row = conn.execute(
+        "UPDATE jobs SET state = 'running', attempts = attempts + 1, updated = ? "
+        "WHERE id = (SELECT id FROM jobs WHERE state = 'queued' AND not_before <= ? ORDER BY id LIMIT 1) "
+        "RETURNING *",
+        (now, now),
+    ).fetchone()
+    return dict(row) if row else None
+
+
+def update_job(conn, job_id, **fields):
+    """
+    Updates fields of a job.
+    :param conn: Connection from connect.
+    :type conn: sqlite3.Connection
+    :param job_id: Id of the job.
+    :type job_id: int
+    :param fields: Columns and their new values.
+    :return: None.
+    :rtype: None.
+    """
+    fields["updated"] = time.time()
+    assignments = ", ".join(f"{column} = ?" for column in fields)
+    conn.execute(
+        f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id)
+    )
+
+
+def fail_job(conn, job, error, max_attempts=MAX_ATTEMPTS, retry_delay=RETRY_DELAY):
+    """
+    Records a failed attempt, queueing the job again after a delay until it runs out of attempts.
+    :param conn: Connection from connect.
+    :type conn: sqlite3.Connection
+    :param job: The job that failed.
+    :type job: dict
+    :param error: Description of the failure.
+    :type error: str
+    :param max_attempts: Number of attempts before the job fails for good (default: MAX_ATTEMPTS).
+    :type max_attempts: int
+    :param retry_delay: Seconds before the first retry, doubled for each later one (default: RETRY_DELAY).
+    :type retry_delay: float
+    :return: None.
+    :rtype: None.
+    """
+    if job["attempts"] < max_attempts:
+        delay = retry_delay * 2 ** (job["attempts"] - 1)
+        update_job(
+            conn, job["id"], state="queued", error=error, not_before=time.time() + delay
+        )
+        print(f"Job {job['id']} failed ({error}), retrying in {delay:.0f}s")
+    else:
+        update_job(conn, job["id"], state="failed", error=error)
+        print(f"Job {job['id']} failed after {job['attempts']} attempts: {error}")
+
+
+def retry_job(conn, job_id):
+    """
+    Queues a failed job again with a fresh set of attempts.
+    :param conn: Connection from connect.
+    :type conn: sqlite3.Connection
+    :param job_id: Id of the job.
+    :type job_id: int
+    :return: Whether the job was queued; only failed jobs can be retried.
+    :rtype: bool
+    """
+    return bool(
+        conn.execute(
+            "UPDATE jobs SET state = 'queued', attempts = 0, not_before = 0, updated = ? "
+            "WHERE id = ? AND state = 'failed'",
+            (time.time(), job_id),
+        ).rowcount
+    )
+
+
+def recover_jobs(conn):
+    """
+    Queues jobs left running by a previous process that stopped, so they are run again.
+    :param conn: Connection from connect.
+    :type conn: sqlite3.Connection
+    :return: Number of recovered jobs.
+    :rtype: int
+    """
+    return conn.execute(
+        "UPDATE jobs SET state = 'queued', not_before = 0 WHERE state = 'running'"
+    ).rowcount
+
+
+def unzip_job(job, work_dir):
+    """
+    Extracts the poll file from a zipped drop, or returns the dropped file itself.
+    :param job: The job.
+    :type job: dict
+    :param work_dir: Working directory of the job.
+    :type work_dir: str
+    :return: Path to the raw poll file.
+    :rtype: str
+    """
+    if not job["path"].endswith(".zip"):
+        return job["path"]
+    file_ext = SOURCES[job["source"]]["extension"]
+    extracted = utl.extract_zipped_data(job["path"], work_dir, file_ext=file_ext)
+    if not extracted:
+        raise ValueError(f"No {file_ext} file in {job['name']}")
+    return os.path.join(work_dir, extracted[0])
+
+
+def recode_job(job, filepath, store_dir):
+    """
+    Recodes a raw poll through the feature store, which serializes workers that share its index.
+    :param job: The job.
+    :type job: dict
+    :param filepath: Path to the raw poll file.
+    :type filepath: str
+    :param store_dir: Directory of the feature store.
+    :type store_dir: str
+    :return: Recoded poll data.
+    :rtype: dataframe
+    """
+    import feature_store as fs
+
+    return fs.get_features(job["source"], filepath, store_dir=store_dir)
+
+
+def cell_poll(source, features):
+    """
+    Renames a source's recoded columns onto the demographic cell dimensions.
+    :param source: Poll source, "reuters", "comet" or "monmouth".
+    :type source: str
+    :param features: Recoded poll data.
+    :type features: dataframe
+    :return: Poll data with the available cell dimensions and a vote column.
+    :rtype: dataframe
+    """
+    spec = SOURCES[source]
+    cols = {col: dim for col, dim in spec["cells"].items() if col in features.columns}
+    poll = features[list(cols) + [spec["outcome"]]].rename(
+        columns={**cols, spec["outcome"]: "vote"}
+    )
+    poll = poll.apply(lambda col: pd.to_numeric(col.astype(object), errors="coerce"))
+    if "education" in spec and "education_recoded" in poll.columns:
+        poll["education_recoded"] = poll["education_recoded"].replace(spec["education"])
+    poll = poll.dropna()
+    if "male" in poll.columns:
+        # The post-stratification cells code sex as a boolean
+        poll["male"] = poll["male"].astype(bool)
+    return poll
+
+
+def run_job(job, ingest_dir=INGEST_DIR, shared=None):
+    """
+    Runs every stage of a job, from the dropped file to a published feed. Runs in a worker process.
+    :param job: The job.
+    :type job: dict
+    :param ingest_dir: Directory of the ingest service (default: INGEST_DIR).
+    :type ingest_dir: str
+    :param shared: Paths to reference data, the feature store and publishing directories, overriding SHARED
+        (default: None).
+    :type shared: dict | None
+    :return: Result of the job.
+    :rtype: dict
+    """
+    import eb_smoothing as eb
+    import history_store as hs
+    import map_viz_gen as mp
+    import post_strat as ps
+
+    shared = {**SHARED, **(shared or {})}
+    conn = connect(ingest_dir)
+    work_dir = os.path.join(ingest_dir, "work", str(job["id"]))
+    os.makedirs(work_dir, exist_ok=True)
+
+    update_job(conn, job["id"], stage="unzip")
+    filepath = unzip_job(job, work_dir)
+
+    update_job(conn, job["id"], stage="recode")
+    poll = cell_poll(job["source"], recode_job(job, filepath, shared["feature_store"]))
+
+    update_job(conn, job["id"], stage="score")
+    cells, diagnostics = eb.smooth_cells(
+        poll,
+        "vote",
+        pd.read_csv(shared["post_strat"]),
+        dims=[dim for dim in eb.CELL_DIMS if dim in poll.columns],
+    )
+
+    update_job(conn, job["id"], stage="aggregate")
+    strat = ps.build_strat_table(
+        shared["post_strat"], shared["ecollege"], shared["turnout"]
+    )
+    state_pred = ps.predict_states(
+        strat, cells, "eb_subgroup_estimate", turnout=shared["turnout_method"]
+    )
+    state_pred.to_csv(os.path.join(work_dir, "final_pred_elec.csv"), index=False)
+
+    update_job(conn, job["id"], stage="publish")
+    run_id = f"ingest/{job['source']}/{job['id']}"
+    feed_path = os.path.join(shared["feeds_dir"], f"{run_id}.json")
+    mp.build_results_feed(state_pred.set_index("state"), feed_path, run_id, pred=True)
+    if shared.get("history_dir"):
+        hs.append_run(
+            state_pred,
+            run_id,
+            {"source": job["source"], "sha256": job["sha256"]},
+            store_dir=shared["history_dir"],
+        )
+    conn.close()
+    return {
+        "run": run_id,
+        "feed": feed_path,
+        "respondents": len(poll),
+        "empty_cells": diagnostics["empty_cells"],
+        **ps.electoral_votes(state_pred),
+    }
+
+
+def next_due_job(conn):
+    """
+    Looks up the next job that is due, without claiming it.
+    :param conn: Connection from connect.
+    :type conn: sqlite3.Connection
+    :return: Id of the job, or None if no job is due.
+    :rtype: int | None
+    """
+    row = conn.execute(
+        "SELECT id FROM jobs WHERE state = 'queued' AND not_before <= ? LIMIT 1",
+        (time.time(),),
+    ).fetchone()
+    return row[0] if row else None
+
+
+def restart_pool(pool, workers):
+    """
+    Replaces a pool that broke because one of its worker processes died, which fails every job it was running and
+    makes it refuse new ones.
+    :param pool: The broken pool.
+    :type pool: concurrent.futures.ProcessPoolExecutor
+    :param workers: Number of worker processes.
+    :type workers: int
+    :return: A new pool.
+    :rtype: concurrent.futures.ProcessPoolExecutor
+    """
+    print("A worker process died, starting a new pool")
+    pool.shutdown(wait=False, cancel_futures=True)
+    return ProcessPoolExecutor(max_workers=workers)
+
+
+def serve(
+    drop_dir=DROP_DIR,
+    ingest_dir=INGEST_DIR,
+    shared=None,
+    workers=MAX_WORKERS,
+    max_queued=MAX_QUEUED,
+    poll_interval=POLL_INTERVAL,
+    once=False,
+):
+    """
+    Watches the drop directory and runs queued jobs on a pool of worker processes until interrupted.
+    :param drop_dir: Directory watched for new poll files (default: DROP_DIR).
+    :type drop_dir: str
+    :param ingest_dir: Directory of the ingest service (default: INGEST_DIR).
+    :type ingest_dir: str
+    :param shared: Paths overriding SHARED, e.g. the shared paths of a batch run configuration (default: None).
+    :type shared: dict | None
+    :param workers: Number of worker processes (default: MAX_WORKERS).
+    :type workers: int
+    :param max_queued: Number of waiting jobs above which new files are left in the drop directory (default:
+        MAX_QUEUED).
+    :type max_queued: int
+    :param poll_interval: Seconds between scans of the drop directory (default: POLL_INTERVAL).
+    :type poll_interval: float
+    :param once: Whether to stop once the drop directory is empty and no job is running or due (default: False).
+    :type once: bool
+    :return: None.
+    :rtype: None.
+    """
+    os.makedirs(drop_dir, exist_ok=True)
+    conn = connect(ingest_dir)
+    recovered = recover_jobs(conn)
+    if recovered:
+        print(f"Recovered {recovered} interrupted jobs")
+    seen = {}
+    running = {}
+    print(f"Watching {drop_dir} with {workers} workers")
+    pool = ProcessPoolExecutor(max_workers=workers)
+    try:
+        while True:
+            if count_waiting(conn) < max_queued:
+                for filepath in scan_drop_dir(drop_dir, seen):
+                    enqueue(conn, filepath, ingest_dir)
+                    if count_waiting(conn) >= max_queued:
+                        break
+            while len(running) < workers:
+                job = claim_job(conn)
+                if job is None:
+                    break
+                try:
+                    future = pool.submit(run_job, job, ingest_dir, shared)
+                except BrokenProcessPool:
+                    # The job never ran, so it goes back to the queue without using an attempt
+                    update_job(
+                        conn, job["id"], state="queued", attempts=job["attempts"] - 1
+                    )
+                    pool = restart_pool(pool, workers)
+                    continue
+                print(f"Started job {job['id']}: {job['name']}")
+                running[future] = job
+
+            if once and not running and not seen and next_due_job(conn) is None:
+                break
+            if not running:
+                time.sleep(poll_interval)
+                continue
+            done, _ = wait(running, timeout=poll_interval, return_when=FIRST_COMPLETED)
+            broken = False
+            for future in done:
+                job = running.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    broken = broken or isinstance(e, BrokenProcessPool)
+                    update_job(conn, job["id"], stage=None)
+                    fail_job(conn, job, f"{type(e).__name__}: {e}")
+                    continue
+                update_job(
+                    conn,
+                    job["id"],
+                    state="done",
+                    stage=None,
+                    error=None,
+                    result=json.dumps(result),
+                )
+                print(f"Finished job {job['id']}: {result}")
+            if broken:
+                pool = restart_pool(pool, workers)
+    finally:
+        pool.shutdown()
+    conn.close()
+
+
+def job_status(conn, limit=50):
+    """
+    Lists the most recent jobs with their state.
+    :param conn: Connection from connect.
+    :type conn: sqlite3.Connection
+    :param limit: Number of jobs to list (default: 50).
+    :type limit: int
+    :return: One row per job, newest first.
+    :rtype: pandas dataframe
+    """
+    status = pd.read_sql_query(
+        "SELECT id, name, source, state, stage, attempts, error, result, updated "
+        "FROM jobs ORDER BY id DESC LIMIT ?",
+        conn,
+        params=(limit,),
+    )
+    status["updated"] = pd.to_datetime(status["updated"], unit="s").dt.floor("s")
+    return status
+
+
+def main():
+    """
+    Entry point for the script.
+    :return: None.
+    :rtype: None.
+    """
+    parser = argparse.ArgumentParser(description="Ingest dropped poll files.")
+    parser.add_argument("--ingest-dir", default=INGEST_DIR)
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("serve", help="Watch the drop directory and run jobs.")
+    run.add_argument("--drop-dir", default=DROP_DIR)
+    run.add_argument("--workers", type=int, default=MAX_WORKERS)
+    run.add_argument("--max-queued", type=int, default=MAX_QUEUED)
+    run.add_argument("--poll-interval", type=float, default=POLL_INTERVAL)
+    run.add_argument(
+        "--config", help="Batch run configuration whose shared paths are used."
+    )
+    run.add_argument(
+        "--once", action="store_true", help="Stop when there is nothing left to do."
+    )
+    commands.add_parser("status", help="List jobs and their state.")
+    retry = commands.add_parser("retry", help="Queue a failed job again.")
+    retry.add_argument("job_id", type=int)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        shared = utl.read_json(args.config)["shared"] if args.config else None
+        serve(
+            args.drop_dir,
+            args.ingest_dir,
+            shared,
+            args.workers,
+            args.max_queued,
+            args.poll_interval,
+            args.once,
+        )
+    elif args.command == "status":
+        with pd.option_context("display.max_colwidth", 80, "display.width", 200):
+            print(job_status(connect(args.ingest_dir)).to_string(index=False))
+    else:
+        if retry_job(connect(args.ingest_dir), args.job_id):
+            print(f"Queued job {args.job_id} again")
+        else:
+            print(f"Job {args.job_id} is not a failed job")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,22 @@
 """
 This script contains functions to build a hexbin map of U.S. election results. Each hex tile represents a U.S. state and
 the tile is colored according to which candidate won the state.
+
+Maps can either be rendered to SVG with matplotlib (build_plot) or published for the website as a simplified hex
+geometry file, built once, plus a small JSON results feed per run that the browser uses to color the tiles.
 """
 
 # %% Load libraries
+import json
+import os
+
 import geopandas
 import matplotlib.pyplot as plt
 import pandas as pd
 import numpy as np
 
+import state_keys as sk
+
 
 def prep_map_data(filepath):
     """
@@ -18,14 +26,10 @@ def prep_map_data(filepath):
     :return: GeoDataFrame with processed map data
     :rtype: geopandas.GeoDataFrame object
     """
-    us_hex_map = geopandas.read_file("../data/us_states_hexgrid.geojson")
+    us_hex_map = geopandas.read_file(filepath)
     us_hex_map = us_hex_map.drop(columns=["bees"])
-    us_hex_map["google_name"] = (
-        us_hex_map["google_name"]
-        .str.replace("(United States)", "")
-        .str.lower()
-        .str.strip()
-    )
+    us_hex_map["STATEFP"] = sk.to_fips(us_hex_map["iso3166_2"])
+    us_hex_map["google_name"] = sk.state_names(us_hex_map["STATEFP"])
     return us_hex_map
 
 
@@ -50,10 +54,13 @@ def get_elect_college_results(nara_url, year, write_csv=False, csv_filepath=None
     state_results.columns = headers
     state_results = state_results.drop(state_results.index[0])
     state_results.iloc[:51, 1:] = state_results.iloc[:51, 1:].replace("-", 0)
-    state_results["State"] = (
-        state_results["State"].str.replace("*", "").str.lower().str.strip()
-    )
     state_results.iloc[:51, 1:] = state_results.iloc[:51, 1:].astype("int")
+    # State rows take their name from state_keys; the total and notes rows keep a lowercase label
+    fips = sk.to_fips(state_results["State"])
+    state_results["State"] = np.where(
+        fips.notna(), sk.state_names(fips), state_results["State"].str.lower()
+    )
+    state_results["STATEFP"] = fips.to_numpy()
     state_results.set_index("State", inplace=True)
     col_map = {
         "State's Number of Electoral Votes": "state_votes",
@@ -73,14 +80,21 @@ def merge_and_encode_wins(us_hex_map, state_results, pred=False):
     Processes election results and joins them with a geopandas map object.
     :param us_hex_map: Geopandas map of the United States.
     :type us_hex_map: Geopandas map object.
-    :param state_results: Dataframe containing election results.
+    :param state_results: Dataframe containing election results, with a STATEFP column or indexed by any state key
+        accepted by state_keys.to_fips.
     :type state_results: pandas.DataFrame.
     :param pred: Whether to create map based on model predictions or NARA data.
     :type pred: bool
     :return: Dataframe containing U.S. geographic and election data.
     :rtype: geopandas.GeoDataFrame.
     """
-    us_hex_map = us_hex_map.join(state_results, on="google_name")
+    if "STATEFP" in state_results.columns:
+        fips = state_results["STATEFP"]
+        state_results = state_results.drop(columns=["STATEFP"])
+    else:
+        fips = sk.to_fips(state_results.index.to_series())
+    state_results = state_results.set_index(pd.CategoricalIndex(fips))
+    us_hex_map = us_hex_map.join(state_results, on="STATEFP")
     if pred:
         us_hex_map["biden_win"] = np.where(us_hex_map["state_pred"] == 0, 1, 0)
     else:
@@ -92,13 +106,15 @@ def merge_and_encode_wins(us_hex_map, state_results, pred=False):
     return us_hex_map
 
 
-def build_plot(us_hex_map, filepath):
+def build_plot(us_hex_map, filepath, show=True):
     """
     Builds plot for election results and saves to disk.
     :param us_hex_map: Map of the United States with election data.
     :type us_hex_map: geopandas.GeoDataFrame.
     :param filepath: Destination filepath for output.
     :type filepath: str
+    :param show: Whether to display the plot after saving it (default True).
+    :type show: bool
     :return: None.
     :rtype: None.
     """
@@ -114,7 +130,120 @@ def build_plot(us_hex_map, filepath):
         filepath,
         format="svg",
     )
-    plt.show()
+    if show:
+        plt.show()
+    plt.close(fig)
+
+
+def clean_state_name(name):
+    """
+    Normalizes a hexgrid state name to the lowercase form used to join election results.
+    :param name: State name from the hexgrid, e.g. "Maine (United States)".
+    :type name: str
+    :return: Normalized state name.
+    :rtype: str
+    """
+    return name.replace("(United States)", "").lower().strip()
+
+
+def build_hex_geometry(geojson_path, filepath, width=1000):
+    """
+    Precomputes a compact hex geometry file for client-side maps. Tiles are projected onto an integer SVG grid and
+    stored as relative path strings with a label position, so the browser only has to color them.
+    :param geojson_path: Path to the hexgrid GeoJSON file.
+    :type geojson_path: str
+    :param filepath: Destination filepath for the geometry JSON.
+    :type filepath: str
+    :param width: Width of the SVG view box; coordinates are rounded to whole units (default 1000).
+    :type width: int
+    :return: Geometry written to disk.
+    :rtype: dict
+    """
+    with open(geojson_path, "r", encoding="utf-8") as file_obj:
+        features = json.load(file_obj)["features"]
+    rings = [np.array(f["geometry"]["coordinates"][0])[:-1] for f in features]
+    all_coords = np.vstack(rings)
+    min_x, min_y = all_coords.min(axis=0)
+    max_x, max_y = all_coords.max(axis=0)
+    scale = width / (max_x - min_x)
+    height = int(np.ceil((max_y - min_y) * scale))
+
+    states = []
+    for feature, ring in zip(features, rings):
+        # Flip the y axis so north is up in SVG coordinates
+        points = np.column_stack(
+            [(ring[:, 0] - min_x) * scale, (max_y - ring[:, 1]) * scale]
+        )
+        points = np.rint(points).astype(int)
+        steps = np.diff(points, axis=0)
+        path = f"M{points[0, 0]},{points[0, 1]}" + "".join(
+            f"l{dx},{dy}" for dx, dy in steps
+        )
+        label = np.rint(points.mean(axis=0)).astype(int)
+        states.append(
+            {
+                "id": feature["properties"]["iso3166_2"],
+                "name": clean_state_name(feature["properties"]["google_name"]),
+                "d": path + "z",
+                "label": label.tolist(),
+            }
+        )
+    geometry = {"viewBox": [0, 0, width, height], "states": states}
+    with open(filepath, "w", encoding="utf-8") as file_obj:
+        json.dump(geometry, file_obj, separators=(",", ":"))
+    return geometry
+
+
+def build_results_feed(state_results, filepath, run_id, pred=False):
+    """
+    Writes a compact per-run JSON feed of state outcomes for the client-side hex map.
+    :param state_results: Election results or predictions indexed by lowercase state name.
+    :type state_results: pandas.DataFrame
+    :param filepath: Destination filepath for the feed.
+    :type filepath: str
+    :param run_id: Identifier of the run, e.g. "2024/reuters/mrp".
+    :type run_id: str
+    :param pred: Whether the results are model predictions (state_pred column) or NARA data (biden/trump columns).
+    :type pred: bool
+    :return: Feed written to disk.
+    :rtype: dict
+    """
+    if pred:
+        biden_win = np.where(state_results["state_pred"] == 0, 1, 0)
+    else:
+        biden_win = np.where(
+            state_results["biden"].astype(int) > state_results["trump"].astype(int),
+            1,
+            0,
+        )
+    if "margin_trump" not in state_results.columns and pred:
+        state_results = state_results.assign(
+            margin_trump=(
+                state_results["biden_votes_states"]
+                - state_results["trump_votes_states"]
+            )
+            / (
+                state_results["trump_votes_states"]
+                + state_results["biden_votes_states"]
+            )
+        )
+    if "margin_trump" in state_results.columns:
+        margins = state_results["margin_trump"].round(4)
+        margins = [None if pd.isna(m) else float(m) for m in margins]
+    else:
+        margins = [None] * len(state_results)
+    feed = {
+        "run": run_id,
+        "fields": ["biden_win", "margin"],
+        "states": {
+            str(state): [int(win), margin]
+            for state, win, margin in zip(state_results.index, biden_win, margins)
+        },
+    }
+    os.makedirs(os.path.dirname(filepath) or ".", exist_ok=True)
+    with open(filepath, "w", encoding="utf-8") as file_obj:
+        json.dump(feed, file_obj, separators=(",", ":"))
+    return feed
 
 
 def main():
@@ -123,7 +252,29 @@ def main():
     :return: None.
     :rtype: None.
     """
-    us_hex_map = prep_map_data("../data/us_states_hexgrid.geojson")
+    # Build the hex geometry used by the website's client-side maps
+    build_hex_geometry(
+        "../data/us_states_hexgrid.geojson",
+        "../website_699/ppredict/static/ppredict/hex_geometry.json",
+    )
+
+    # Publish results feeds for the actual 2020 results and the 2024 predictions
+    state_results = pd.read_csv("../data/2020_electoral_results.csv", nrows=51)
+    build_results_feed(
+        state_results.set_index("State"),
+        "../website_699/ppredict/feeds/2020/actual.json",
+        "2020/actual",
+    )
+    state_results = pd.read_csv("../data/final_pred_elec_2024.csv")
+    build_results_feed(
+        state_results.set_index("state"),
+        "../website_699/ppredict/feeds/2024/reuters/ml.json",
+        "2024/reuters/ml",
+        pred=True,
+    )
+
+    # Render static SVG maps with matplotlib
+    # us_hex_map = prep_map_data("../data/us_states_hexgrid.geojson")
 
     # Build hex map based on actual 2020 election results
     # state_results = get_elect_college_results(
@@ -132,13 +283,13 @@ def main():
     # build_plot(us_hex_map, "../website_699/ppredict/static/ppredict/2020_hexbin.svg")
 
     # Build hexmap based on predictions
-    state_results = pd.read_csv("../data/2024_election/final_pred_elec_2024.csv")
-    state_results = state_results.set_index("state")
-    us_hex_map = merge_and_encode_wins(us_hex_map, state_results, pred=True)
-    build_plot(
-        us_hex_map,
-        "../website_699/ppredict/static/ppredict/corrected_2024_pred_hexbin.svg",
-    )
+    # state_results = pd.read_csv("../data/2024_election/final_pred_elec_2024.csv")
+    # state_results = state_results.set_index("state")
+    # us_hex_map = merge_and_encode_wins(us_hex_map, state_results, pred=True)
+    # build_plot(
+    #     us_hex_map,
+    #     "../website_699/ppredict/static/ppredict/corrected_2024_pred_hexbin.svg",
+    # )
 
 
 if __name__ == "__main__":
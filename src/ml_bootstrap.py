@@ -0,0 +1,225 @@
+"""
+This script estimates the uncertainty of the machine learning model's cell-level predictions by bootstrapping. The
+chosen estimator is refit on resamples of the training respondents, and each refit predicts the probability of voting
+for Trump for every prediction row. Predictions are averaged within demographic cells, and the mean and standard
+deviation across resamples give a per-cell estimate and standard error in the same shape as the MRP propensity score
+files (mrp_subgroup_estimate and mrp_subgroup_estimate_se).
+
+The encoded feature matrices are placed in shared memory once, and a process pool refits resamples in chunks. Workers
+read the matrices in place, so only resample seeds and per-cell results cross process boundaries.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from sklearn.base import clone
+from sklearn.ensemble import RandomForestClassifier
+
+import helper as utl
+
+CELL_COLS = ["age_recoded", "race_recoded", "male", "education_recoded"]
+
+# Workers attach to the shared arrays and receive the estimator once, in the pool initializer
+_shared = {}
+
+
+def encode_features(data, feature_cols, categorical_cols=None, columns=None):
+    """
+    One-hot encodes categorical features the way the machine learning notebook does (pd.get_dummies).
+    :param data: Poll data or prediction rows.
+    :type data: pandas dataframe
+    :param feature_cols: Columns used as features.
+    :type feature_cols: list
+    :param categorical_cols: Columns to one-hot encode (default: every feature column).
+    :type categorical_cols: list | None
+    :param columns: Encoded columns to align to, e.g. those of the training matrix (default: None).
+    :type columns: list | None
+    :return: Encoded feature matrix and its column names.
+    :rtype: tuple
+    """
+    if categorical_cols is None:
+        categorical_cols = feature_cols
+    encoded = pd.get_dummies(
+        data[feature_cols], columns=categorical_cols, dtype=np.float64
+    )
+    if columns is not None:
+        encoded = encoded.reindex(columns=columns, fill_value=0.0)
+    return np.ascontiguousarray(encoded.to_numpy(dtype=np.float64)), list(
+        encoded.columns
+    )
+
+
+def init_worker(block_name, layout, estimator):
+    """
+    Attaches a pool worker to the shared matrices and stores the estimator to refit.
+    :param block_name: Name of the shared memory block.
+    :type block_name: str
+    :param layout: Layout returned by helper.share_arrays.
+    :type layout: dict
+    :param estimator: Unfitted scikit-learn classifier.
+    :type estimator: sklearn estimator
+    :return: None.
+    :rtype: None.
+    """
+    _shared["block"], _shared["arrays"] = utl.attach_shared(block_name, layout)
+    _shared["estimator"] = estimator
+
+
+def fit_resample(arrays, estimator, seed):
+    """
+    Refits the estimator on one bootstrap resample and averages its predictions within cells.
+    :param arrays: Training matrix X, labels y, prediction matrix X_pred and cell index cell of each prediction row.
+    :type arrays: dict
+    :param estimator: Unfitted scikit-learn classifier.
+    :type estimator: sklearn estimator
+    :param seed: Seed of the resample.
+    :type seed: int
+    :return: Mean predicted probability of voting for Trump in each cell.
+    :rtype: numpy array
+    """
+    rng = np.random.default_rng(seed)
+    rows = rng.integers(0, len(arrays["y"]), len(arrays["y"]))
+    model = clone(estimator)
+    if "random_state" in model.get_params():
+        model.set_params(random_state=seed)
+    model.fit(arrays["X"][rows], arrays["y"][rows])
+
+    # A resample can miss a class entirely; its probability is then 0
+    prob = np.zeros(len(arrays["X_pred"]))
+    classes = list(model.classes_)
+    if 1 in classes:
+        prob = model.predict_proba(arrays["X_pred"])[:, classes.index(1)]
+    n_cells = int(arrays["cell"].max()) + 1
+    totals = np.bincount(arrays["cell"], weights=prob, minlength=n_cells)
+    counts = np.bincount(arrays["cell"], minlength=n_cells)
+    return totals / counts
+
+
+def fit_chunk(seeds):
+    """
+    Fits a chunk of bootstrap resamples in a pool worker.
+    :param seeds: Seeds of the resamples.
+    :type seeds: list
+    :return: Sum and sum of squares of cell predictions over the chunk.
+    :rtype: tuple
+    """
+    preds = np.vstack(
+        [fit_resample(_shared["arrays"], _shared["estimator"], seed) for seed in seeds]
+    )
+    return preds.sum(axis=0), (preds**2).sum(axis=0)
+
+
+def bootstrap_cells(
+    train,
+    target_col,
+    feature_cols,
+    predict_rows=None,
+    estimator=None,
+    n_resamples=200,
+    processes=None,
+    chunk_size=10,
+    seed=13,
+    cell_cols=None,
+):
+    """
+    Bootstraps per-cell machine learning predictions.
+    :param train: Training respondents with features and a 0/1 target (1 = Trump).
+    :type train: pandas dataframe
+    :param target_col: Column with the target, e.g. vote_choice_recoded.
+    :type target_col: str
+    :param feature_cols: Feature columns, one-hot encoded before fitting.
+    :type feature_cols: list
+    :param predict_rows: Rows to predict and average within cells (default: the training respondents).
+    :type predict_rows: pandas dataframe | None
+    :param estimator: Unfitted scikit-learn classifier (default: the notebook's random forest).
+    :type estimator: sklearn estimator | None
+    :param n_resamples: Number of bootstrap resamples (default: 200).
+    :type n_resamples: int
+    :param processes: Number of worker processes; 1 fits in this process (default: one per CPU).
+    :type processes: int | None
+    :param chunk_size: Number of resamples per task (default: 10).
+    :type chunk_size: int
+    :param seed: Seed from which resample seeds are derived (default: 13).
+    :type seed: int
+    :param cell_cols: Columns defining demographic cells (default: CELL_COLS).
+    :type cell_cols: list | None
+    :return: One row per cell with ml_subgroup_estimate, ml_subgroup_estimate_se and the number of prediction rows.
+    :rtype: pandas dataframe
+    """
+    if estimator is None:
+        estimator = RandomForestClassifier(
+            n_estimators=200, max_depth=5, max_features="sqrt", random_state=13
+        )
+    if "n_jobs" in estimator.get_params():
+        # Parallelism comes from the pool, so each refit stays single-threaded
+        estimator = clone(estimator).set_params(n_jobs=1)
+    if cell_cols is None:
+        cell_cols = CELL_COLS
+    if predict_rows is None:
+        predict_rows = train
+
+    X, columns = encode_features(train, feature_cols)
+    X_pred, _ = encode_features(predict_rows, feature_cols, columns=columns)
+    grouped = predict_rows.groupby(cell_cols, sort=True)
+    arrays = {
+        "X": X,
+        "y": train[target_col].to_numpy(dtype=np.int64),
+        "X_pred": X_pred,
+        "cell": grouped.ngroup().to_numpy(dtype=np.int64),
+    }
+
+    seeds = np.random.SeedSequence(seed).generate_state(n_resamples).tolist()
+    chunks = [seeds[i : i + chunk_size] for i in range(0, n_resamples, chunk_size)]
+    block, layout = utl.share_arrays(arrays)
+    try:
+        if processes == 1:
+            init_worker(block.name, layout, estimator)
+            results = [fit_chunk(chunk) for chunk in chunks]
+            _shared.clear()
+        else:
+            with ProcessPoolExecutor(
+                max_workers=processes,
+                initializer=init_worker,
+                initargs=(block.name, layout, estimator),
+            ) as pool:
+                results = list(pool.map(fit_chunk, chunks))
+    finally:
+        block.close()
+        block.unlink()
+
+    total = sum(result[0] for result in results)
+    total_sq = sum(result[1] for result in results)
+    mean = total / n_resamples
+    var = np.maximum(total_sq / n_resamples - mean**2, 0) * n_resamples
+    cells = grouped.size().reset_index(name="n_rows")
+    cells["ml_subgroup_estimate"] = mean
+    cells["ml_subgroup_estimate_se"] = np.sqrt(var / max(n_resamples - 1, 1))
+    return cells
+
+
+def main():
+    """
+    Entry point for the script.
+    :return: None.
+    :rtype: None.
+    """
+    poll = pd.read_csv("../data/nat_2020_aug_cleaned.csv")
+    feature_cols = CELL_COLS + [
+        "party_recoded",
+        "region",
+        "approve_trump",
+        "approve_biden",
+        "optimistic",
+        "elec_enthusiasm",
+        "political_leaning",
+    ]
+    poll = poll.dropna(subset=feature_cols + ["vote_choice_recoded"])
+    poll = poll[poll["vote_choice_recoded"].isin([0, 1])]
+    cells = bootstrap_cells(poll, "vote_choice_recoded", feature_cols)
+    cells.to_csv("../data/ml_cell_estimates_aug_2020.csv", index=False)
+    print(cells.sort_values("ml_subgroup_estimate_se", ascending=False).head(10))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,458 @@
+"""
+This script explains the machine learning models by permutation importance: how much worse a fitted model predicts
+held-out respondents when the answers to one poll question are shuffled among them. Unlike the impurity
+feature_importances_ plotted in the notebook, it is measured on test data, works for any classifier, and comes with a
+confidence interval.
+
+Every model in MODELS is fit on every wave in WAVES, with the notebook's train/test split. The one-hot columns of a
+question form one block and are shuffled together, so importance is reported per question rather than per dummy.
+Each shuffle is repeated n_repeats times with the same seeds for every block, and the increase in log loss over the
+unshuffled test set is averaged over repeats. The interval is a normal interval for that mean, so it reflects the
+randomness of the shuffles, not of the test sample.
+
+Test matrices are placed in shared memory once and the fitted models are sent to each worker once, in the pool
+initializer. Tasks are batches of shuffles: a worker stacks a shuffled copy of the test matrix per shuffle and scores
+the whole stack with a single predict_proba call.
+
+The results are written as a JSON feed that the website's importance chart reads, so the chart follows each retrain.
+"""
+
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+from sklearn.base import clone
+from sklearn.ensemble import GradientBoostingClassifier, RandomForestClassifier
+from sklearn.model_selection import train_test_split
+
+import helper as utl
+import ml_bootstrap as mlb
+
+FEED_PATH = "../website_699/ppredict/feeds/importance.json"
+
+TARGET_COL = "vote_choice_recoded"
+
+# Candidate estimators from the notebook's grid searches, fixed at typical best settings
+MODELS = {
+    "random_forest": RandomForestClassifier(
+        n_estimators=200, max_depth=5, max_features="sqrt", random_state=13, n_jobs=1
+    ),
+    "gradient_boosting": GradientBoostingClassifier(
+        n_estimators=150,
+        max_depth=3,
+        learning_rate=0.05,
+        max_features="sqrt",
+        random_state=13,
+    ),
+}
+
+# Recoded poll waves and the questions used as features. vote_codes maps a wave's own vote choice codes to 1 = Trump
+# and 0 = Biden where they differ; other choices are dropped.
+WAVES = {
+    "monmouth_march_2020": {
+        "data": "../data/nat_2020_cleaned_no_dummies.csv",
+        "vote_codes": {1: 1, 2: 0},
+        "features": mlb.CELL_COLS
+        + [
+            "approve_trump",
+            "approve_biden",
+            "optimistic",
+            "elec_enthusiasm",
+            "economic_situation",
+            "focused_imp_issues",
+            "party_recoded",
+            "political_leaning",
+            "region",
+        ],
+    },
+    "monmouth_june_2020": {
+        "data": "../data/nat_2020_june_cleaned.csv",
+        "features": mlb.CELL_COLS
+        + [
+            "approve_trump",
+            "approve_biden",
+            "optimistic",
+            "elec_enthusiasm",
+            "economic_situation",
+            "trump_stamina",
+            "biden_stamina",
+            "party_recoded",
+            "political_leaning",
+            "region",
+            "propensity",
+        ],
+    },
+    "monmouth_aug_2020": {
+        "data": "../data/nat_2020_aug_cleaned.csv",
+        "features": mlb.CELL_COLS
+        + [
+            "approve_trump",
+            "approve_biden",
+            "optimistic",
+            "elec_enthusiasm",
+            "top_household_concern",
+            "party_recoded",
+            "political_leaning",
+            "region",
+            "propensity",
+        ],
+    },
+    "reuters_jan_2024": {
+        "data": "../data/nat_2024_to_pred.csv",
+        "features": mlb.CELL_COLS
+        + ["region_coded", "party_id_coded", "religion_coded"],
+    },
+}
+
+# Features used as numbers rather than one-hot encoded
+CONTINUOUS_COLS = ["propensity"]
+
+# Names shown on the website
+FEATURE_LABELS = {
+    "age_recoded": "Age",
+    "race_recoded": "Race",
+    "male": "Gender",
+    "education_recoded": "Education",
+    "approve_trump": "Favorable of Trump",
+    "approve_biden": "Favorable of Biden",
+    "optimistic": "Optimistic about Election",
+    "elec_enthusiasm": "Enthusiasm about Election",
+    "economic_situation": "Economic Situation",
+    "focused_imp_issues": "Is Trump Focused on Important Issues",
+    "trump_stamina": "Trump Has Stamina",
+    "biden_stamina": "Biden Has Stamina",
+    "top_household_concern": "Top Household Concern",
+    "party_recoded": "Party Identification",
+    "party_id_coded": "Party Identification",
+    "political_leaning": "Political Leaning",
+    "region": "Region",
+    "region_coded": "Region",
+    "religion_coded": "Religion",
+    "propensity": "MRP Propensity",
+}
+
+# Probabilities are clipped away from 0 and 1 before taking logs
+EPS = 1e-15
+
+# Workers attach to the shared test matrices and receive the fitted models once, in the pool initializer
+_shared = {}
+
+
+def load_wave(spec, target_col=TARGET_COL):
+    """
+    Reads a poll wave and keeps the respondents with every feature and a two-party vote choice.
+    :param spec: Entry of WAVES.
+    :type spec: dict
+    :param target_col: Column with the vote choice (default: TARGET_COL).
+    :type target_col: str
+    :return: Respondents with the feature columns and the target coded 1 = Trump and 0 = Biden.
+    :rtype: pandas dataframe
+    """
+    poll = pd.read_csv(spec["data"], usecols=spec["features"] + [target_col])
+    poll[target_col] = poll[target_col].map(spec.get("vote_codes", {0: 0, 1: 1}))
+    return poll.dropna().reset_index(drop=True)
+
+
+def feature_blocks(columns, features):
+    """
+    Groups encoded columns by the feature they were encoded from.
+    :param columns: Encoded column names from ml_bootstrap.encode_features, e.g. party_recoded_1.0.
+    :type columns: list
+    :param features: Feature columns before encoding.
+    :type features: list
+    :return: Indices of the encoded columns of each feature, keyed by feature.
+    :rtype: dict
+    """
+    blocks = {feature: [] for feature in features}
+    for i, col in enumerate(columns):
+        # The longest matching name wins, so approve_trump_1.0 is not credited to a feature named approve
+        owner = max(
+            (f for f in features if col == f or col.startswith(f"{f}_")), key=len
+        )
+        blocks[owner].append(i)
+    return {
+        feature: np.array(cols, dtype=np.int64)
+        for feature, cols in blocks.items()
+        if cols
+    }
+
+
+def positive_proba(model, X):
+    """
+    Predicts the probability of voting for Trump.
+    :param model: Fitted scikit-learn classifier.
+    :type model: sklearn estimator
+    :param X: Feature matrix.
+    :type X: numpy array
+    :return: Probability of class 1 for each row.
+    :rtype: numpy array
+    """
+    return model.predict_proba(X)[:, list(model.classes_).index(1)]
+
+
+def log_loss_rows(prob, y):
+    """
+    Computes the mean log loss of each row of a stack of predictions.
+    :param prob: Predicted probabilities of class 1, one row per scored copy of the test set.
+    :type prob: numpy array
+    :param y: Labels of the test set.
+    :type y: numpy array
+    :return: Mean log loss of each row.
+    :rtype: numpy array
+    """
+    prob = np.clip(prob, EPS, 1 - EPS)
+    return -np.mean(y * np.log(prob) + (1 - y) * np.log1p(-prob), axis=-1)
+
+
+def init_worker(block_name, layout, models):
+    """
+    Attaches a pool worker to the shared test matrices and stores the fitted models.
+    :param block_name: Name of the shared memory block.
+    :type block_name: str
+    :param layout: Layout returned by helper.share_arrays.
+    :type layout: dict
+    :param models: Fitted models keyed by "<model>/<wave>".
+    :type models: dict
+    :return: None.
+    :rtype: None.
+    """
+    _shared["block"], _shared["arrays"] = utl.attach_shared(block_name, layout)
+    _shared["models"] = models
+
+
+def score_shuffles(arrays, model, wave, shuffles):
+    """
+    Scores a batch of shuffled copies of a wave's test matrix with a single predict_proba call.
+    :param arrays: Test matrix "<wave>/X" and labels "<wave>/y" of every wave.
+    :type arrays: dict
+    :param model: Fitted scikit-learn classifier.
+    :type model: sklearn estimator
+    :param wave: Wave whose test matrix is shuffled.
+    :type wave: str
+    :param shuffles: Encoded column indices of the block to shuffle and the seed of the shuffle, one pair per copy.
+    :type shuffles: list
+    :return: Log loss of each shuffled copy.
+    :rtype: numpy array
+    """
+    X = arrays[f"{wave}/X"]
+    n_rows = len(X)
+    stacked = np.tile(X, (len(shuffles), 1))
+    for i, (cols, seed) in enumerate(shuffles):
+        rows = np.random.default_rng(seed).permutation(n_rows)
+        stacked[i * n_rows : (i + 1) * n_rows, cols] = X[np.ix_(rows, cols)]
+    prob = positive_proba(model, stacked).reshape(len(shuffles), n_rows)
+    return log_loss_rows(prob, arrays[f"{wave}/y"])
+
+
+def score_batch(task):
+    """
+    Scores a batch of shuffles in a pool worker.
+    :param task: Model name, wave and shuffles as passed to score_shuffles.
+    :type task: tuple
+    :return: Log loss of each shuffled copy.
+    :rtype: numpy array
+    """
+    model_name, wave, shuffles = task
+    model = _shared["models"][f"{model_name}/{wave}"]
+    return score_shuffles(_shared["arrays"], model, wave, shuffles)
+
+
+def permutation_importance(
+    models=None,
+    waves=None,
+    n_repeats=30,
+    batch_size=16,
+    processes=None,
+    level=0.95,
+    seed=13,
+):
+    """
+    Computes permutation importance with confidence intervals for every model on every wave.
+    :param models: Unfitted scikit-learn classifiers keyed by name (default: MODELS).
+    :type models: dict | None
+    :param waves: Wave specifications keyed by wave (default: WAVES).
+    :type waves: dict | None
+    :param n_repeats: Number of shuffles of each feature (default: 30).
+    :type n_repeats: int
+    :param batch_size: Number of shuffled copies of the test matrix scored per predict_proba call (default: 16).
+    :type batch_size: int
+    :param processes: Number of worker processes; 1 scores in this process (default: one per CPU).
+    :type processes: int | None
+    :param level: Confidence level of the intervals (default: 0.95).
+    :type level: float
+    :param seed: Seed from which shuffle seeds are derived (default: 13).
+    :type seed: int
+    :return: One row per model, wave and feature with the mean increase in log loss and its interval, and one row per
+        model and wave with the test-set log loss and accuracy.
+    :rtype: tuple
+    """
+    if models is None:
+        models = MODELS
+    if waves is None:
+        waves = WAVES
+
+    arrays, fitted, blocks, fits = {}, {}, {}, []
+    for wave, spec in waves.items():
+        poll = load_wave(spec)
+        X, columns = mlb.encode_features(
+            poll,
+            spec["features"],
+            [col for col in spec["features"] if col not in CONTINUOUS_COLS],
+        )
+        y = poll[TARGET_COL].to_numpy(dtype=np.float64)
+        # The notebook's split
+        train_rows, test_rows = train_test_split(
+            np.arange(len(y)), test_size=0.55, random_state=11
+        )
+        arrays[f"{wave}/X"] = np.ascontiguousarray(X[test_rows])
+        arrays[f"{wave}/y"] = y[test_rows]
+        blocks[wave] = feature_blocks(columns, spec["features"])
+        for name, estimator in models.items():
+            model = clone(estimator).fit(X[train_rows], y[train_rows].astype(np.int64))
+            fitted[f"{name}/{wave}"] = model
+            prob = positive_proba(model, arrays[f"{wave}/X"])
+            fits.append(
+                {
+                    "model": name,
+                    "wave": wave,
+                    "train_rows": len(train_rows),
+                    "test_rows": len(test_rows),
+                    "log_loss": float(log_loss_rows(prob, arrays[f"{wave}/y"])),
+                    "accuracy": float(np.mean((prob > 0.5) == arrays[f"{wave}/y"])),
+                }
+            )
+    fits = pd.DataFrame(fits)
+
+    # The same seeds for every block, so differences between features are not shuffle noise
+    seeds = np.random.SeedSequence(seed).generate_state(n_repeats).tolist()
+    tasks, keys = [], []
+    for name in models:
+        for wave, wave_blocks in blocks.items():
+            shuffles = [
+                (feature, cols, s)
+                for feature, cols in wave_blocks.items()
+                for s in seeds
+            ]
+            for i in range(0, len(shuffles), batch_size):
+                batch = shuffles[i : i + batch_size]
+                tasks.append((name, wave, [(cols, s) for _, cols, s in batch]))
+                keys.extend((name, wave, feature) for feature, _, _ in batch)
+
+    block, layout = utl.share_arrays(arrays)
+    try:
+        if processes == 1:
+            init_worker(block.name, layout, fitted)
+            results = [score_batch(task) for task in tasks]
+            _shared.clear()
+        else:
+            with ProcessPoolExecutor(
+                max_workers=processes,
+                initializer=init_worker,
+                initargs=(block.name, layout, fitted),
+            ) as pool:
+                results = list(pool.map(score_batch, tasks))
+    finally:
+        block.close()
+        block.unlink()
+
+    scores = pd.DataFrame(keys, columns=["model", "wave", "feature"])
+    scores["shuffled_log_loss"] = np.concatenate(results)
+    scores = scores.merge(fits[["model", "wave", "log_loss"]], on=["model", "wave"])
+    scores["importance"] = scores["shuffled_log_loss"] - scores["log_loss"]
+    importance = (
+        scores.groupby(["model", "wave", "feature"], sort=False)["importance"]
+        .agg(["mean", "std", "count"])
+        .reset_index()
+        .rename(columns={"mean": "importance", "std": "importance_sd"})
+    )
+    half_width = (
+        NormalDist().inv_cdf((1 + level) / 2)
+        * importance["importance_sd"].fillna(0)
+        / np.sqrt(importance["count"])
+    )
+    importance["ci_low"] = importance["importance"] - half_width
+    importance["ci_high"] = importance["importance"] + half_width
+    importance["label"] = (
+        importance["feature"].map(FEATURE_LABELS).fillna(importance["feature"])
+    )
+    importance = importance.drop(columns="count").sort_values(
+        ["model", "wave", "importance"], ascending=[True, True, False]
+    )
+    return importance.reset_index(drop=True), fits
+
+
+def build_importance_feed(importance, fits, filepath, level=0.95, n_repeats=30):
+    """
+    Writes a compact JSON feed of permutation importances for the website's importance chart.
+    :param importance: Importances from permutation_importance.
+    :type importance: pandas dataframe
+    :param fits: Test-set scores from permutation_importance.
+    :type fits: pandas dataframe
+    :param filepath: Destination filepath for the feed.
+    :type filepath: str
+    :param level: Confidence level of the intervals (default: 0.95).
+    :type level: float
+    :param n_repeats: Number of shuffles of each feature (default: 30).
+    :type n_repeats: int
+    :return: Feed written to disk.
+    :rtype: dict
+    """
+    feed = {
+        "metric": "log_loss",
+        "level": level,
+        "n_repeats": n_repeats,
+        "fields": ["feature", "label", "importance", "ci_low", "ci_high"],
+        "models": [],
+    }
+    for fit in fits.itertuples(index=False):
+        rows = importance[
+            (importance["model"] == fit.model) & (importance["wave"] == fit.wave)
+        ]
+        feed["models"].append(
+            {
+                "model": fit.model,
+                "wave": fit.wave,
+                "test_rows": int(fit.test_rows),
+                "log_loss": round(fit.log_loss, 4),
+                "accuracy": round(fit.accuracy, 4),
+                "features": [
+                    [
+                        row.feature,
+                        row.label,
+                        round(row.importance, 4),
+                        round(row.ci_low, 4),
+                        round(row.ci_high, 4),
+                    ]
+                    for row in rows.itertuples(index=False)
+                ],
+            }
+        )
+    os.makedirs(os.path.dirname(filepath) or ".", exist_ok=True)
+    with open(filepath, "w", encoding="utf-8") as file_obj:
+        json.dump(feed, file_obj, separators=(",", ":"))
+    return feed
+
+
+def main():
+    """
+    Entry point for the script.
+    :return: None.
+    :rtype: None.
+    """
+    importance, fits = permutation_importance()
+    build_importance_feed(importance, fits, FEED_PATH)
+    print(fits.to_string(index=False))
+    for (model, wave), rows in importance.groupby(["model", "wave"], sort=False):
+        print(f"\n{model} / {wave}")
+        print(
+            rows[["label", "importance", "ci_low", "ci_high"]]
+            .head(10)
+            .to_string(index=False)
+        )
+
+
+if __name__ == "__main__":
+    main()
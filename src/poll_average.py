@@ -0,0 +1,296 @@
+"""
+This script averages vote choice across poll waves and vendors (Monmouth, Harvard/CES, COMETrends, Reuters/Ipsos).
+
+All waves are stacked into one long table with a common set of demographic cell columns, the field date of the wave
+and a respondent weight. Averages for any grouping (national, state or demographic cell) weight each respondent by an
+exponential recency decay relative to an as-of date and by the size of their wave. Rolling series are computed for
+every as-of date at once: respondents are first summed by wave and group, and the decay for every date and wave is then
+applied as a single matrix product.
+"""
+
+import numpy as np
+import pandas as pd
+
+CELL_COLS = ["age_recoded", "race_recoded", "male", "education_recoded", "STATEFIP"]
+LONG_COLS = ["source", "wave", "field_date"] + CELL_COLS + ["vote", "weight"]
+
+# Column names of each vendor's recoded output, mapped onto the long table
+SOURCE_COLUMNS = {
+    "monmouth": {"vote_choice_recoded": "vote", "FINALWGT": "weight"},
+    "harvard": {"vote_choice_recoded": "vote"},
+    "comet": {
+        "age_group": "age_recoded",
+        "gender_coded": "male",
+        "education_coded": "education_recoded",
+        "race_coded": "race_recoded",
+        "STATEFP": "STATEFIP",
+        "vote_coded": "vote",
+    },
+    "reuters": {
+        "age_group_coded": "age_recoded",
+        "gender_coded": "male",
+        "education_coded": "education_recoded",
+        "race_coded": "race_recoded",
+        "STATEFP": "STATEFIP",
+        "vote_choice_coded": "vote",
+    },
+}
+
+# Approximate last day of each wave's field period
+WAVE_DATES = {
+    "monmouth_march_2020": "2020-03-22",
+    "monmouth_june_2020": "2020-06-30",
+    "monmouth_aug_2020": "2020-08-10",
+    "comet_oct_2020": "2020-10-31",
+    "harvard_oct_2020": "2020-11-02",
+    "reuters_jan_2024": "2024-01-22",
+}
+
+
+def to_long(poll_data, source, wave, field_date=None, col_map=None):
+    """
+    Converts one recoded poll wave into the long table format.
+    :param poll_data: Recoded poll data for a single wave.
+    :type poll_data: pandas dataframe
+    :param source: Poll vendor, e.g. "monmouth".
+    :type source: str
+    :param wave: Identifier of the wave, e.g. "monmouth_june_2020".
+    :type wave: str
+    :param field_date: Field date of the wave (default: WAVE_DATES[wave]).
+    :type field_date: str | None
+    :param col_map: Column renames onto the long table (default: SOURCE_COLUMNS[source]).
+    :type col_map: dict | None
+    :return: Long table rows for the wave, with 1 = Trump and 0 = Biden in the vote column.
+    :rtype: pandas dataframe
+    """
+    if col_map is None:
+        col_map = SOURCE_COLUMNS.get(source, {})
+    if field_date is None:
+        field_date = WAVE_DATES[wave]
+    long = poll_data.rename(columns=col_map)
+    if "STATEFIP" not in long.columns and "state" in long.columns:
+        long["STATEFIP"] = long["state"]
+    if "weight" not in long.columns:
+        long["weight"] = 1.0
+    long = long.dropna(subset=["vote"])
+    long = long[long["vote"].isin([0, 1])]
+    long = long.assign(source=source, wave=wave, field_date=pd.Timestamp(field_date))
+    for col in CELL_COLS:
+        long[col] = pd.to_numeric(long[col], errors="coerce")
+    long["male"] = long["male"].astype(float)
+    if source == "reuters":
+        # Reuters codes college degrees as 2; the other polls and the ACS use 3
+        long["education_recoded"] = long["education_recoded"].replace(2, 3)
+    return long[LONG_COLS].reset_index(drop=True)
+
+
+def stack_polls(waves):
+    """
+    Stacks several long-format waves into a single table.
+    :param waves: Long tables from to_long.
+    :type waves: list of pandas dataframes
+    :return: Combined long table.
+    :rtype: pandas dataframe
+    """
+    return pd.concat(waves, ignore_index=True)
+
+
+def wave_group_sums(long, by):
+    """
+    Sums respondent weights and weighted votes by wave and group.
+    :param long: Long poll table.
+    :type long: pandas dataframe
+    :param by: Grouping columns; an empty list gives a national average.
+    :type by: list
+    :return: Wave dates, a frame of group labels and (wave x group) arrays of weight, weighted vote, squared weight
+        and count.
+    :rtype: tuple
+    """
+    long = long.dropna(subset=by)
+    wave_codes, waves = pd.factorize(long["wave"], sort=True)
+    if by:
+        grouped = long.groupby(by, sort=True)
+        group_codes = grouped.ngroup().to_numpy()
+        groups = grouped.size().index.to_frame(index=False)
+    else:
+        group_codes, groups = np.zeros(len(long), dtype=np.int64), pd.DataFrame(
+            index=[0]
+        )
+    n_waves, n_groups = len(waves), len(groups)
+    flat = wave_codes * n_groups + group_codes
+    weight = long["weight"].to_numpy(dtype=np.float64)
+    vote = long["vote"].to_numpy(dtype=np.float64)
+    size = n_waves * n_groups
+
+    def sums(values):
+        return np.bincount(flat, weights=values, minlength=size).reshape(
+            n_waves, n_groups
+        )
+
+    wave_dates = (
+        long.groupby("wave")["field_date"]
+        .max()
+        .reindex(waves)
+        .to_numpy("datetime64[D]")
+    )
+    return (
+        wave_dates,
+        groups,
+        sums(weight),
+        sums(weight * vote),
+        sums(weight**2),
+        sums(np.ones_like(weight)),
+    )
+
+
+def decay_matrix(as_of_dates, wave_dates, half_life):
+    """
+    Computes recency weights for every as-of date and wave. Waves fielded after an as-of date get no weight.
+    :param as_of_dates: Dates at which to evaluate the average.
+    :type as_of_dates: numpy datetime64 array
+    :param wave_dates: Field date of each wave.
+    :type wave_dates: numpy datetime64 array
+    :param half_life: Number of days after which a wave's weight is halved.
+    :type half_life: float
+    :return: (dates x waves) decay weights.
+    :rtype: numpy array
+    """
+    age = (as_of_dates[:, None] - wave_dates[None, :]).astype("timedelta64[D]")
+    age = age.astype(np.float64)
+    return np.where(age >= 0, 0.5 ** (age / half_life), 0.0)
+
+
+def rolling_average(long, as_of_dates, by=None, half_life=30, size_exponent=0.5):
+    """
+    Computes recency- and sample-size-weighted averages of Trump vote share for every group at every as-of date.
+    :param long: Long poll table.
+    :type long: pandas dataframe
+    :param as_of_dates: Dates at which to evaluate the average.
+    :type as_of_dates: list | pandas DatetimeIndex
+    :param by: Grouping columns, e.g. ["STATEFIP"] or CELL_COLS (default: national average).
+    :type by: list | None
+    :param half_life: Number of days after which a wave's weight is halved (default: 30).
+    :type half_life: float
+    :param size_exponent: Each wave's total weight scales with its sample size to this power. 1 pools respondents
+        equally; 0.5 (default) lets a wave's influence grow with the square root of its size.
+    :type size_exponent: float
+    :return: One row per as-of date and group with the average, total weight, effective sample size and respondents.
+    :rtype: pandas dataframe
+    """
+    by = [] if by is None else list(by)
+    as_of = pd.DatetimeIndex(as_of_dates).to_numpy("datetime64[D]")
+    wave_dates, groups, weight, weighted_vote, weight_sq, count = wave_group_sums(
+        long, by
+    )
+
+    # Rescale each wave so its total weight is proportional to n ** size_exponent
+    wave_n = count.sum(axis=1)
+    wave_weight = weight.sum(axis=1)
+    scale = np.divide(
+        wave_n**size_exponent,
+        wave_weight,
+        out=np.zeros_like(wave_weight),
+        where=wave_weight > 0,
+    )
+    decay = decay_matrix(as_of, wave_dates, half_life) * scale[None, :]
+
+    total = decay @ weight
+    estimate = np.divide(
+        decay @ weighted_vote, total, out=np.full_like(total, np.nan), where=total > 0
+    )
+    effective_n = np.divide(
+        total**2,
+        (decay**2) @ weight_sq,
+        out=np.zeros_like(total),
+        where=total > 0,
+    )
+    respondents = (decay > 0).astype(np.float64) @ count
+
+    result = pd.DataFrame(
+        {
+            "as_of": np.repeat(pd.DatetimeIndex(as_of), len(groups)),
+            "trump_share": estimate.ravel(),
+            "total_weight": total.ravel(),
+            "effective_n": effective_n.ravel(),
+            "respondents": respondents.ravel().astype(int),
+        }
+    )
+    if by:
+        group_frame = pd.concat([groups] * len(as_of), ignore_index=True)
+        result = pd.concat(
+            [result[["as_of"]], group_frame, result.drop(columns="as_of")], axis=1
+        )
+    return result
+
+
+def poll_average(long, as_of, by=None, half_life=30, size_exponent=0.5):
+    """
+    Computes recency- and sample-size-weighted averages of Trump vote share at a single as-of date.
+    :param long: Long poll table.
+    :type long: pandas dataframe
+    :param as_of: Date at which to evaluate the average.
+    :type as_of: str | pandas Timestamp
+    :param by: Grouping columns (default: national average).
+    :type by: list | None
+    :param half_life: Number of days after which a wave's weight is halved (default: 30).
+    :type half_life: float
+    :param size_exponent: Power of wave size used for wave weights (default: 0.5).
+    :type size_exponent: float
+    :return: One row per group.
+    :rtype: pandas dataframe
+    """
+    result = rolling_average(
+        long, [as_of], by=by, half_life=half_life, size_exponent=size_exponent
+    )
+    return result.drop(columns="as_of")
+
+
+def main():
+    """
+    Entry point for the script.
+    :return: None.
+    :rtype: None.
+    """
+    waves = [
+        to_long(
+            pd.read_csv("../data/nat_2020_cleaned_no_dummies2.csv"),
+            "monmouth",
+            "monmouth_march_2020",
+        ),
+        to_long(
+            pd.read_csv("../data/nat_2020_june_cleaned.csv"),
+            "monmouth",
+            "monmouth_june_2020",
+        ),
+        to_long(
+            pd.read_csv("../data/nat_2020_aug_cleaned.csv"),
+            "monmouth",
+            "monmouth_aug_2020",
+        ),
+        to_long(pd.read_csv("../data/harvard_poll.csv"), "harvard", "harvard_oct_2020"),
+    ]
+    long = stack_polls(waves)
+    campaign = pd.date_range("2020-03-01", "2020-11-03", freq="D")
+    state_series = rolling_average(long, campaign, by=["STATEFIP"])
+    national_series = rolling_average(long, campaign)
+    print(national_series.iloc[::30])
+    state_series.to_csv("../data/poll_average_by_state_2020.csv", index=False)
+
+    # The 2024 average rests on the single Reuters/Ipsos wave
+    long_2024 = stack_polls(
+        [
+            to_long(
+                pd.read_csv("../data/2024_clean_reuters_coded.csv"),
+                "reuters",
+                "reuters_jan_2024",
+            )
+        ]
+    )
+    print(poll_average(long_2024, "2024-02-01"))
+    poll_average(long_2024, "2024-02-01", by=["STATEFIP"]).to_csv(
+        "../data/poll_average_by_state_2024.csv", index=False
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+"""
+This script post-stratifies demographic cell estimates into state-level election predictions. It reproduces the
+aggregation step of the machine learning notebook: cell vote propensities are multiplied by (optionally
+turnout-adjusted) ACS population counts and summed by state to call each state and its margin.
+"""
+
+import math
+
+import numpy as np
+import pandas as pd
+
+import state_keys as sk
+
+CELL_COLS = ["age_recoded", "race_recoded", "male", "education_recoded", "STATEFIP"]
+
+# Turnout multipliers used in the machine learning notebook
+SEX_TURNOUT = {1: 0.595, 0: 0.63}
+RACE_TURNOUT = {1: 0.575, 2: 0.514, 3: 0.404, 4: 0.403, 9: 0.5}
+AGE_TURNOUT = {1: 0.55, 2: 0.656, 3: 0.73}
+
+
+def read_cells(filepath, cols=None):
+    """
+    Reads a table keyed by demographic cell and normalizes the key dtypes so tables from R and Python line up.
+    :param filepath: Path to a CSV file containing the cell columns.
+    :type filepath: str
+    :param cols: Optional list of columns to keep (default: all columns).
+    :type cols: list | None
+    :return: Cell table with integer cell keys.
+    :rtype: pandas dataframe
+    """
+    cells = pd.read_csv(filepath, usecols=cols)
+    for col in CELL_COLS:
+        if col in cells.columns:
+            cells[col] = cells[col].astype(int)
+    return cells
+
+
+def build_strat_table(post_strat_path, ecollege_path, turnout_path):
+    """
+    Joins ACS post-stratification counts with electoral college votes and state turnout.
+    :param post_strat_path: Path to post_stratification_data_by_state.csv.
+    :type post_strat_path: str
+    :param ecollege_path: Path to 2020_ecollege_rep.csv.
+    :type ecollege_path: str
+    :param turnout_path: Path to turnout_by_state.csv.
+    :type turnout_path: str
+    :return: Post-stratification table with one row per state and demographic cell.
+    :rtype: pandas dataframe
+    """
+    post_strat = read_cells(post_strat_path, cols=CELL_COLS + ["PERWT"]).dropna(
+        subset=["PERWT"]
+    )
+    ecollege = pd.read_csv(ecollege_path).dropna(subset=["e_votes"])
+    ecollege = ecollege[["STATEFP", "STATE", "STATE_NAME", "e_votes"]]
+    turnout = pd.read_csv(turnout_path, encoding="utf-8-sig")
+    turnout["STATEFIP"] = sk.to_fips(turnout["State"])
+    turnout = turnout.dropna(subset=["STATEFIP"]).drop(columns=["State"])
+    # Cell keys are plain integers, so the categorical state key is unwrapped before merging
+    turnout["STATEFIP"] = turnout["STATEFIP"].astype(np.int64)
+
+    strat = pd.merge(post_strat, ecollege, left_on="STATEFIP", right_on="STATEFP")
+    strat = pd.merge(strat, turnout, on="STATEFIP", how="left")
+    return strat.drop(columns=["STATEFP"])
+
+
+def turnout_weights(strat, method="sex"):
+    """
+    Computes expected voters per cell from ACS counts under one of the notebook's turnout assumptions.
+    :param strat: Post-stratification table from build_strat_table.
+    :type strat: pandas dataframe
+    :param method: One of "none", "sex", "race", "age", "state_2016" or "state_2020" (default: sex).
+    :type method: str
+    :return: Expected voters for each row of strat.
+    :rtype: numpy array
+    """
+    perwt = strat["PERWT"].to_numpy(dtype=np.float64)
+    if method == "none":
+        return perwt
+    if method == "sex":
+        return perwt * strat["male"].map(SEX_TURNOUT).to_numpy(dtype=np.float64)
+    if method == "race":
+        return perwt * strat["race_recoded"].map(RACE_TURNOUT).to_numpy(
+            dtype=np.float64
+        )
+    if method == "age":
+        return perwt * strat["age_recoded"].map(AGE_TURNOUT).to_numpy(dtype=np.float64)
+    if method in ("state_2016", "state_2020"):
+        col = f"{method.split('_')[1]}_turnout"
+        return perwt * strat[col].to_numpy(dtype=np.float64) / 100
+    raise ValueError(f"Unknown turnout method: {method}")
+
+
+def predict_states(strat, estimates, estimate_col, turnout="sex"):
+    """
+    Aggregates cell-level probabilities of voting for Trump into state predictions.
+    :param strat: Post-stratification table from build_strat_table.
+    :type strat: pandas dataframe
+    :param estimates: Cell estimates keyed by CELL_COLS.
+    :type estimates: pandas dataframe
+    :param estimate_col: Column in estimates holding the probability of voting for Trump.
+    :type estimate_col: str
+    :param turnout: Turnout assumption passed to turnout_weights (default: sex).
+    :type turnout: str
+    :return: One row per state with predicted votes, state call (1 = Trump) and margin.
+    :rtype: pandas dataframe
+    """
+    cells = pd.merge(
+        strat, estimates[CELL_COLS + [estimate_col]], on=CELL_COLS, how="inner"
+    )
+    voters = turnout_weights(cells, turnout)
+    estimate = cells[estimate_col].to_numpy(dtype=np.float64)
+    cells["trump_votes_states"] = estimate * voters
+    cells["biden_votes_states"] = (1 - estimate) * voters
+    state_pred = cells.groupby(["STATE_NAME", "STATEFIP", "STATE"], as_index=False)[
+        ["trump_votes_states", "biden_votes_states", "e_votes"]
+    ].agg(
+        {"trump_votes_states": "sum", "biden_votes_states": "sum", "e_votes": "first"}
+    )
+    state_pred = state_pred.rename(columns={"STATE_NAME": "state"})
+    state_pred["state_pred"] = np.where(
+        state_pred["trump_votes_states"] > state_pred["biden_votes_states"], 1, 0
+    )
+    state_pred["margin_trump"] = (
+        state_pred["biden_votes_states"] - state_pred["trump_votes_states"]
+    ) / (state_pred["trump_votes_states"] + state_pred["biden_votes_states"])
+    state_pred["state_votes"] = state_pred["e_votes"].astype(int)
+    return state_pred.drop(columns=["e_votes"])
+
+
+def predict_state_se(strat, estimates, estimate_col, se_col, turnout="sex"):
+    """
+    Propagates cell-level standard errors to the state two-party share, treating cell errors as independent. Works
+    for MRP (mrp_subgroup_estimate_se) and bootstrapped machine learning (ml_subgroup_estimate_se) estimates alike.
+    :param strat: Post-stratification table from build_strat_table.
+    :type strat: pandas dataframe
+    :param estimates: Cell estimates keyed by CELL_COLS.
+    :type estimates: pandas dataframe
+    :param estimate_col: Column in estimates holding the probability of voting for Trump.
+    :type estimate_col: str
+    :param se_col: Column in estimates holding the standard error of estimate_col.
+    :type se_col: str
+    :param turnout: Turnout assumption passed to turnout_weights (default: sex).
+    :type turnout: str
+    :return: One row per state with Trump's two-party share, its standard error and the probability that Trump wins
+        under a normal approximation.
+    :rtype: pandas dataframe
+    """
+    cell_cols = [col for col in CELL_COLS if col in estimates.columns]
+    cells = pd.merge(
+        strat, estimates[cell_cols + [estimate_col, se_col]], on=cell_cols, how="inner"
+    )
+    voters = turnout_weights(cells, turnout)
+    cells["_trump"] = cells[estimate_col].to_numpy(dtype=np.float64) * voters
+    cells["_var"] = (cells[se_col].to_numpy(dtype=np.float64) * voters) ** 2
+    cells["_voters"] = voters
+    states = cells.groupby(["STATE_NAME", "STATEFIP", "STATE"], as_index=False)[
+        ["_trump", "_var", "_voters"]
+    ].sum()
+    states["trump_share"] = states["_trump"] / states["_voters"]
+    states["trump_share_se"] = np.sqrt(states["_var"]) / states["_voters"]
+    z = (states["trump_share"] - 0.5) / states["trump_share_se"]
+    states["trump_win_prob"] = 0.5 * (1 + z.apply(lambda x: math.erf(x / np.sqrt(2))))
+    states = states.rename(columns={"STATE_NAME": "state"})
+    return states.drop(columns=["_trump", "_var", "_voters"])
+
+
+def fill_ml_estimates(estimates, ml_col, mrp_col, zero_divisor=10, one_divisor=4):
+    """
+    Fills missing machine learning cell predictions with MRP estimates and pulls exact 0 and 1 predictions back
+    towards the MRP estimate, following the notebook's edge-case handling.
+    :param estimates: Cell table containing machine learning and MRP estimates.
+    :type estimates: pandas dataframe
+    :param ml_col: Column with machine learning predictions.
+    :type ml_col: str
+    :param mrp_col: Column with MRP subgroup estimates.
+    :type mrp_col: str
+    :param zero_divisor: Predictions of exactly 0 become the MRP estimate divided by this value (default: 10).
+    :type zero_divisor: float
+    :param one_divisor: Predictions of exactly 1 become 1 minus the MRP estimate divided by this value (default: 4).
+    :type one_divisor: float
+    :return: Filled machine learning predictions.
+    :rtype: pandas series
+    """
+    ml_pred = estimates[ml_col].fillna(estimates[mrp_col])
+    ml_pred = ml_pred.mask(ml_pred == 0, estimates[mrp_col] / zero_divisor)
+    ml_pred = ml_pred.mask(ml_pred == 1, 1 - estimates[mrp_col] / one_divisor)
+    return ml_pred
+
+
+def electoral_votes(state_pred):
+    """
+    Totals the electoral votes won by each candidate.
+    :param state_pred: State predictions from predict_states.
+    :type state_pred: pandas dataframe
+    :return: Electoral votes for Trump and Biden.
+    :rtype: dict
+    """
+    trump = int(state_pred.loc[state_pred["state_pred"] == 1, "state_votes"].sum())
+    biden = int(state_pred.loc[state_pred["state_pred"] == 0, "state_votes"].sum())
+    return {"trump": trump, "biden": biden}
+
+
+def main():
+    """
+    Entry point for the script.
+    :return: None.
+    :rtype: None.
+    """
+    strat = build_strat_table(
+        "../data/post_stratification_data_by_state.csv",
+        "../data/2020_ecollege_rep.csv",
+        "../data/turnout_by_state.csv",
+    )
+    estimates = read_cells("../data/new_prop_scores_include_harvard_FINAL.csv")
+    state_pred = predict_states(strat, estimates, "mrp_subgroup_estimate")
+    print(state_pred)
+    print(electoral_votes(state_pred))
+
+
+if __name__ == "__main__":
+    main()
@@ -10,21 +10,33 @@ import numpy as np
 import pandas as pd
 
 import helper as utl
+import profiler as pf
+import state_keys as sk
+
+# Raw COMETrends columns and the names they are given before recoding
+COL_RENAME = {
+    "q3": "birth_year",
+    "q4": "gender",
+    "q5": "education",
+    "q6": "race",
+    "q6_6_text": "race_other",
+    "q7": "state",
+    "q10": "most_imp_issue",
+    "q54": "voted_for",
+    "q56": "plan_to_vote_for",
+    "regnz": "region",
+}
 
 
 def read_comet_poll(path):
     """
-    Reads a STATA file containing COMET data and displays summary information.
+    Reads a STATA file containing COMET data. Summary information is written by profiler.write_report.
     :param path: Path to the data file.
     :type path: str
     :return: Comet polling data.
     :rtype: dataframe
     """
     comet_data = pd.read_stata(path)
-    print("Data Summary\n")
-    print(comet_data.info())
-    print("\nSummary Stats:\n")
-    print(comet_data.describe())
     return comet_data
 
 
@@ -55,20 +67,7 @@ def process_comet_data(comet_data, keep_all=False):
     """
 
     # Clean columns
-    col_rename = {
-        "q3": "birth_year",
-        "q4": "gender",
-        "q5": "education",
-        "q6": "race",
-        "q6_6_text": "race_other",
-        "q7": "state",
-        "q10": "most_imp_issue",
-        "q54": "voted_for",
-        "q56": "plan_to_vote_for",
-        "regnz": "region",
-    }
-
-    clean_comet_data = comet_data.rename(columns=col_rename)
+    clean_comet_data = comet_data.rename(columns=COL_RENAME)
     vote_choice = [
         "will vote for joe biden",
         "voted for joe biden",
@@ -129,20 +128,7 @@ def process_comet_data(comet_data, keep_all=False):
     clean_comet_data["race_coded"] = clean_comet_data["race_coded"].astype("category")
 
     # Recode state
-    fips = utl.get_fips(
-        "https://www2.census.gov/geo/docs/reference/codes2020/national_state2020.txt"
-    )
-    fips["STATEFP"] = fips["STATEFP"].astype(int)
-    fips = fips[fips["STATEFP"] < 57]
-
-    clean_comet_data["state"] = clean_comet_data["state"].str.lower().str.strip()
-    fips["STATE_NAME"] = fips["STATE_NAME"].str.lower().str.strip()
-
-    merged_df = pd.merge(
-        clean_comet_data, fips, left_on="state", right_on="STATE_NAME", how="left"
-    )
-    clean_comet_data = merged_df.drop(columns=["STATE_NAME", "STATENS", "STATE"])
-    clean_comet_data["STATEFP"] = clean_comet_data["STATEFP"].astype("category")
+    clean_comet_data["STATEFP"] = sk.to_fips(clean_comet_data["state"])
 
     # Recode most important issue
     issue_condition = [
@@ -205,15 +191,21 @@ def process_comet_data(comet_data, keep_all=False):
     )
 
     # Return cleaned data
-    print(f"Dtypes Check:\n{clean_comet_data.dtypes}\n")
-    print(f"NaNs Check:\n{clean_comet_data.isna().sum().sum()}\n")
     if keep_all:
         return clean_comet_data
     else:
-        keep_cols = [
-            col for col in clean_comet_data.columns if col not in col_rename.values()
-        ]
-        return clean_comet_data[keep_cols]
+        return clean_comet_data[coded_columns(clean_comet_data)]
+
+
+def coded_columns(comet_data):
+    """
+    Lists the columns of recoded COMET data that are kept when original columns are dropped.
+    :param comet_data: Recoded COMETrends data.
+    :type comet_data: dataframe
+    :return: Recoded column names.
+    :rtype: list
+    """
+    return [col for col in comet_data.columns if col not in COL_RENAME.values()]
 
 
 def main():
@@ -225,22 +217,12 @@ def main():
     data_extracted = utl.extract_zipped_data(
         "../data/comet_polls/prenov20.zip", "../data/comet_polls/", file_ext=".dta"
     )
+    pf.write_report(f"../data/comet_polls/{data_extracted[0]}")
     comet_data = read_comet_poll(f"../data/comet_polls/{data_extracted[0]}")
-    comet_cols = [
-        "q3",
-        "q4",
-        "q5",
-        "q6",
-        "q6_6_text",
-        "q7",
-        "q10",
-        "q54",
-        "q56",
-        "regnz",
-    ]
-    comet_data = select_comet_data(comet_data, comet_cols)
+    comet_data = select_comet_data(comet_data, list(COL_RENAME))
+    # Recode once and derive the coded-only output from the full output
     clean_comet_data = process_comet_data(comet_data, keep_all=True)
-    comet_recoded = process_comet_data(comet_data, keep_all=False)
+    comet_recoded = clean_comet_data[coded_columns(clean_comet_data)]
     clean_comet_data.to_csv("../data/comet_polls/clean_comet.csv", index=False)
     comet_recoded.to_csv("../data/comet_polls/comet_recoded.csv", index=False)
 
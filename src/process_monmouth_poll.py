@@ -0,0 +1,193 @@
+"""
+This script cleans and recodes the Monmouth University national polls of 2020 from their raw tab-separated archives,
+following the recoding of the cleaning notebooks (process_poll_data.ipynb, clean_ML.ipynb):
+
+Monmouth University Polling Institute. 2020. "National Poll" (March, June and August 2020).
+https://www.monmouth.edu/polling-institute/reports/
+
+The demographic questions (QD*) keep their numbers across waves, but the vote choice question does not, so the wave's
+vote questions are found from the file's columns (see VOTE_QUESTIONS).
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+import profiler as pf
+import state_keys as sk
+
+# Raw Monmouth demographic columns and the names they are given before recoding
+COL_RENAME = {
+    "QD2": "party",
+    "QD2A": "party_unaffiliated",
+    "QD4": "education",
+    "QD5": "age",
+    "QD5A": "age_bin",
+    "QD7": "latino",
+    "QD8": "race",
+    "QD10": "gender",
+    "QD11": "state",
+}
+
+WEIGHT_COL = "FINALWGT"
+
+# Vote choice questions of each wave, as the choice columns and the follow-up asked of undecided respondents. The June
+# poll asked the choice in two versions, each of a part of the sample. 1 is Trump and 2 is Biden; 6 to 9 (undecided,
+# other or refused) are replaced by the follow-up answer.
+VOTE_QUESTIONS = [
+    (["Q12_1", "Q12_2"], "Q12B"),
+    (["Q14"], "Q14B"),
+    (["Q12"], "Q12B"),
+]
+
+# Census regions (1 = Northeast, 2 = Midwest, 3 = South, 4 = West) by state FIPS code
+REGION_FIPS = {
+    1: [9, 23, 25, 33, 34, 36, 42, 44, 50],
+    2: [17, 18, 19, 20, 26, 27, 29, 31, 38, 39, 46, 55],
+    3: [1, 5, 10, 11, 12, 13, 21, 22, 24, 28, 37, 40, 45, 47, 48, 51, 54],
+    4: [2, 4, 6, 8, 15, 16, 30, 32, 35, 41, 49, 53, 56],
+}
+
+
+def vote_columns(columns):
+    """
+    Finds the vote choice questions of a wave from its columns.
+    :param columns: Column names of the raw poll.
+    :type columns: list
+    :return: Choice columns and follow-up column, or None if the file has none of the known vote questions.
+    :rtype: tuple | None
+    """
+    for choices, lean in VOTE_QUESTIONS:
+        if set(choices + [lean]) <= set(columns):
+            return choices, lean
+    return None
+
+
+def read_monmouth_poll(filepath):
+    """
+    Reads a raw Monmouth poll, keeping the recoded columns, the vote questions and the weight.
+    :param filepath: Path to the raw .tab file.
+    :type filepath: str
+    :return: Raw poll data.
+    :rtype: dataframe
+    """
+    columns = list(pd.read_csv(filepath, sep="\t", nrows=0).columns)
+    questions = vote_columns(columns)
+    if questions is None:
+        raise ValueError(f"No known vote choice question in {filepath}")
+    choices, lean = questions
+    return pd.read_csv(
+        filepath, sep="\t", usecols=list(COL_RENAME) + choices + [lean, WEIGHT_COL]
+    )
+
+
+def process_monmouth_poll(poll_data, keep_all=False):
+    """
+    Recodes a raw Monmouth poll onto the codes of the cleaned Monmouth CSVs, keeping Trump and Biden voters.
+    :param poll_data: Raw poll data from read_monmouth_poll.
+    :type poll_data: dataframe
+    :param keep_all: Whether to keep the original columns next to the recoded ones (default: False).
+    :type keep_all: bool
+    :return: Recoded poll data.
+    :rtype: dataframe
+    """
+    choices, lean = vote_columns(poll_data.columns)
+    poll_data = poll_data.rename(columns=COL_RENAME)
+
+    # Recode vote choice: 1 for Trump, 0 for Biden, other answers dropped
+    vote = poll_data[choices].bfill(axis=1).iloc[:, 0]
+    vote = vote.where(~vote.isin([6, 7, 8, 9]), poll_data[lean])
+    poll_data = poll_data[vote.isin([1, 2])].copy()
+    poll_data["vote_choice_recoded"] = (vote[vote.isin([1, 2])] == 1).astype(int)
+
+    # Recode party: independents and refusals are asked which party they lean to
+    party = np.where(
+        poll_data["party"].isin([4, 9]),
+        poll_data["party_unaffiliated"],
+        poll_data["party"],
+    )
+    party_condition = [party == 1, party == 2, np.isin(party, [3, 9])]
+    party_codes = [1, 2, 3]
+    poll_data["party_recoded"] = np.select(party_condition, party_codes, default=np.nan)
+
+    # Recode age: respondents who refuse their age (99) are asked for a bracket
+    age = poll_data["age"].where(poll_data["age"] < 99)
+    age_condition = [
+        (age <= 34) | (age.isna() & (poll_data["age_bin"] == 1)),
+        (age <= 54) | (age.isna() & (poll_data["age_bin"] == 2)),
+        (age > 54) | (age.isna() & (poll_data["age_bin"] == 3)),
+    ]
+    age_codes = [1, 2, 3]
+    poll_data["age_recoded"] = np.select(age_condition, age_codes, default=np.nan)
+
+    # Recode race, counting Latino respondents as Latino whatever their race
+    race_condition = [
+        (poll_data["latino"] == 1) | (poll_data["race"] == 4),
+        poll_data["race"].isin([5, 9]),
+    ]
+    race_codes = [4, 9]
+    poll_data["race_recoded"] = np.select(
+        race_condition, race_codes, default=poll_data["race"]
+    )
+
+    # Recode gender
+    poll_data["male"] = poll_data["gender"] == 1
+
+    # Recode education: 1 for no college, 3 for some college or more, as in the ACS cells
+    education_condition = [
+        poll_data["education"] <= 3,
+        poll_data["education"].between(4, 8),
+    ]
+    education_codes = [1, 3]
+    poll_data["education_recoded"] = np.select(
+        education_condition, education_codes, default=np.nan
+    )
+
+    # Recode state and region
+    poll_data["STATEFP"] = sk.to_fips(poll_data["state"])
+    region_condition = [
+        poll_data["state"].isin(states) for states in REGION_FIPS.values()
+    ]
+    poll_data["region"] = np.select(region_condition, list(REGION_FIPS), default=np.nan)
+
+    if keep_all:
+        return poll_data
+    else:
+        return poll_data[coded_columns(poll_data)]
+
+
+def coded_columns(poll_data):
+    """
+    Lists the columns of recoded Monmouth data that are kept when original columns are dropped.
+    :param poll_data: Recoded Monmouth poll data.
+    :type poll_data: dataframe
+    :return: Recoded column names.
+    :rtype: list
+    """
+    raw = set(COL_RENAME.values()) | {
+        col for choices, lean in VOTE_QUESTIONS for col in choices + [lean]
+    }
+    return [col for col in poll_data.columns if col not in raw]
+
+
+def main():
+    """
+    Entry point for the script.
+    :return: None
+    :rtype: None
+    """
+    for filepath in [
+        "../data/national_march_2020/MUP213_NATL_archive.tab",
+        "../data/national_june_2020/MUP218_NATL_archive_full.tab",
+        "../data/national_aug_2020/MUP222_NATL_archive_full.tab",
+    ]:
+        pf.write_report(filepath)
+        recoded = process_monmouth_poll(read_monmouth_poll(filepath))
+        output_path = f"{os.path.splitext(filepath)[0]}_recoded.csv"
+        recoded.to_csv(output_path, index=False)
+        print(f"Wrote {len(recoded)} respondents to {output_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,26 +4,29 @@ This script cleans and recodes data from the following Reuters Poll:
 Reuters. 2024. “Reuters/Ipsos Large Sample Survey 1: January 2024.” https://doi.org/10.25940/ROPER-31120717.
 """
 
-import pandas as pd
 import helper as utl
+import profiler as pf
+import state_keys as sk
 import numpy as np
 
+# Raw Reuters columns and the names they are given before recoding
+COL_RENAME = {
+    "ppethm": "race",
+    "ppgender": "gender",
+    "ppreg4": "region",
+    "ppstaten": "state_abb",
+    "age_grp2": "age_group",
+    "PARTYID": "party_id",
+    "TM3155Y23": "vote_choice",
+    "pppa1648": "religion",
+    "edu_general": "education",
+}
+
 
 def process_reuters_poll(poll_data, keep_all=False):
 
     # Clean columns
-    col_rename = {
-        "ppethm": "race",
-        "ppgender": "gender",
-        "ppreg4": "region",
-        "ppstaten": "state_abb",
-        "age_grp2": "age_group",
-        "PARTYID": "party_id",
-        "TM3155Y23": "vote_choice",
-        "pppa1648": "religion",
-        "edu_general": "education",
-    }
-    poll_data = poll_data.rename(columns=col_rename)
+    poll_data = poll_data.rename(columns=COL_RENAME)
     for col in poll_data.columns:
         poll_data[col] = poll_data[col].str.strip().str.lower()
 
@@ -75,20 +78,7 @@ def process_reuters_poll(poll_data, keep_all=False):
     poll_data["race_coded"] = poll_data["race_coded"].astype("category")
 
     # Recode state
-    fips = utl.get_fips(
-        "https://www2.census.gov/geo/docs/reference/codes2020/national_state2020.txt"
-    )
-    fips["STATEFP"] = fips["STATEFP"].astype(int)
-    fips = fips[fips["STATEFP"] < 57]
-
-    poll_data["state_abb"] = poll_data["state_abb"].str.lower().str.strip()
-    fips["STATE"] = fips["STATE"].str.lower().str.strip()
-
-    merged_df = pd.merge(
-        poll_data, fips, left_on="state_abb", right_on="STATE", how="left"
-    )
-    poll_data = merged_df.drop(columns=["STATE_NAME", "STATENS", "STATE"])
-    poll_data["STATEFP"] = poll_data["STATEFP"].astype("category")
+    poll_data["STATEFP"] = sk.to_fips(poll_data["state_abb"])
 
     # Recode vote choice
     vote_condition = [
@@ -156,8 +146,18 @@ def process_reuters_poll(poll_data, keep_all=False):
     if keep_all:
         return poll_data
     else:
-        keep_cols = [col for col in poll_data.columns if col not in col_rename.values()]
-        return poll_data[keep_cols]
+        return poll_data[coded_columns(poll_data)]
+
+
+def coded_columns(poll_data):
+    """
+    Lists the columns of recoded Reuters data that are kept when original columns are dropped.
+    :param poll_data: Recoded Reuters poll data.
+    :type poll_data: dataframe
+    :return: Recoded column names.
+    :rtype: list
+    """
+    return [col for col in poll_data.columns if col not in COL_RENAME.values()]
 
 
 def main():
@@ -166,17 +166,6 @@ def main():
     :return: None
     :rtype: None
     """
-    keep_cols = [
-        "ppethm",
-        "ppgender",
-        "ppreg4",
-        "ppstaten",
-        "age_grp2",
-        "PARTYID",
-        "TM3155Y23",
-        "pppa1648",
-        "edu_general",
-    ]
     # data2 = pd.read_csv(
     #     "../data/reuters_poll/2024_reuters.csv", encoding="windows-1252"
     # )
@@ -184,17 +173,18 @@ def main():
     reuters_data = utl.read_and_filter_poll(
         "../data/reuters_poll/2024_reuters.csv",
         encoding="windows-1252",
-        cols_to_keep=keep_cols,
+        cols_to_keep=list(COL_RENAME),
     )
     # reuters_data.to_csv("../data/reuters_poll/reuters_poll_test.csv")
-    for col in reuters_data.columns:
-        print(reuters_data[col].value_counts())
+    # Diagnostics come from one streaming pass over the raw file rather than a value_counts per column
+    pf.write_report("../data/reuters_poll/2024_reuters.csv", encoding="windows-1252")
 
+    # Recode once and derive the coded-only output from the full output
     clean_reuters_data = process_reuters_poll(reuters_data, keep_all=True)
     clean_reuters_data.to_csv(
         "../data/reuters_poll/2024_clean_reuters_all.csv", index=False
     )
-    clean_coded_reuters_data = process_reuters_poll(reuters_data, keep_all=False)
+    clean_coded_reuters_data = clean_reuters_data[coded_columns(clean_reuters_data)]
     clean_coded_reuters_data.to_csv(
         "../data/reuters_poll/2024_clean_reuters_coded.csv", index=False
     )
@@ -0,0 +1,287 @@
+"""
+This script profiles raw poll files (CSV, tab-separated .tab or STATA .dta) in a single streaming pass and writes a
+compact JSON report, replacing the info(), describe() and per-column value_counts() calls used for diagnostics.
+
+The file is read in chunks of rows, and each column keeps bounded-memory summaries that are updated once per chunk:
+
+- row, null and numeric value counts, and the minimum, maximum and mean of numeric values,
+- approximate distinct counts from a HyperLogLog sketch (2 ** HLL_PRECISION registers, about 1.6% standard error),
+- top-k frequent values from a Misra-Gries summary, whose counts are exact while a column has no more than
+  TOPK_CAPACITY distinct values, and lower bounds otherwise. A column with no frequent values, such as a respondent
+  ID, can have every counter pruned away, and is then reported without top values.
+
+Values are profiled as they appear in the file: CSV and .tab files are read as text, so "1" and "1.0" are distinct
+values, and STATA value labels are used when the file has them.
+"""
+
+import os
+import warnings
+
+import numpy as np
+import pandas as pd
+
+import helper as utl
+
+CHUNK_ROWS = 100_000
+
+HLL_PRECISION = 12
+
+TOPK_CAPACITY = 64
+TOP_K = 10
+
+
+def iter_chunks(filepath, chunk_rows=CHUNK_ROWS, encoding="utf-8"):
+    """
+    Reads a raw poll file in chunks of rows.
+    :param filepath: Path to a .csv (optionally compressed), .tab or .dta file.
+    :type filepath: str
+    :param chunk_rows: Number of rows per chunk (default: CHUNK_ROWS).
+    :type chunk_rows: int
+    :param encoding: Encoding of CSV and .tab files (default: utf-8).
+    :type encoding: str
+    :return: Generator of dataframes.
+    :rtype: generator
+    """
+    if filepath.endswith(".dta"):
+        with pd.read_stata(filepath, chunksize=chunk_rows) as reader:
+            while True:
+                # Chunks may get different categories for partly labeled columns, which does not matter here
+                # because values are profiled by label
+                with warnings.catch_warnings():
+                    warnings.simplefilter(
+                        "ignore", pd.errors.CategoricalConversionWarning
+                    )
+                    chunk = next(reader, None)
+                if chunk is None:
+                    return
+                yield chunk
+    sep = "\t" if filepath.endswith((".tab", ".tsv")) else ","
+    with pd.read_csv(
+        filepath, sep=sep, dtype=str, encoding=encoding, chunksize=chunk_rows
+    ) as reader:
+        yield from reader
+
+
+def new_column_profile():
+    """
+    Creates the empty summaries of one column.
+    :return: Column summaries.
+    :rtype: dict
+    """
+    return {
+        "rows": 0,
+        "nulls": 0,
+        "numeric": 0,
+        "min": np.inf,
+        "max": -np.inf,
+        "sum": 0.0,
+        "registers": np.zeros(2**HLL_PRECISION, dtype=np.uint8),
+        "counts": pd.Series(dtype=np.int64),
+        "pruned": False,
+    }
+
+
+def hll_update(registers, values):
+    """
+    Adds values to a HyperLogLog sketch.
+    :param registers: Registers of the sketch, updated in place.
+    :type registers: numpy array
+    :param values: Non-null values of a column.
+    :type values: pandas series
+    :return: None.
+    :rtype: None.
+    """
+    hashes = pd.util.hash_pandas_object(values, index=False).to_numpy(dtype=np.uint64)
+    index = (hashes >> np.uint64(64 - HLL_PRECISION)).astype(np.int64)
+    # The remaining bits fit in a float64 mantissa, so frexp gives their exact bit length
+    rest = hashes & np.uint64((1 << (64 - HLL_PRECISION)) - 1)
+    bit_length = np.frexp(rest.astype(np.float64))[1]
+    rank = (64 - HLL_PRECISION - bit_length + 1).astype(np.uint8)
+    np.maximum.at(registers, index, rank)
+
+
+def hll_estimate(registers):
+    """
+    Estimates the number of distinct values added to a HyperLogLog sketch.
+    :param registers: Registers of the sketch.
+    :type registers: numpy array
+    :return: Approximate distinct count.
+    :rtype: int
+    """
+    m = len(registers)
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimate = alpha * m**2 / np.sum(2.0 ** -registers.astype(float))
+    zeros = int(np.sum(registers == 0))
+    if estimate <= 2.5 * m and zeros:
+        # Linear counting is more accurate for small cardinalities
+        estimate = m * np.log(m / zeros)
+    return int(round(estimate))
+
+
+def topk_update(profile, values):
+    """
+    Merges the value counts of a chunk into a column's Misra-Gries summary.
+    :param profile: Column summaries, updated in place.
+    :type profile: dict
+    :param values: Non-null values of a column.
+    :type values: pandas series
+    :return: None.
+    :rtype: None.
+    """
+    counts = pd.concat([profile["counts"], values.value_counts(sort=False)])
+    counts = counts.groupby(level=0, sort=False).sum()
+    if len(counts) > TOPK_CAPACITY:
+        # Subtracting the (capacity + 1)-th largest count keeps at most capacity counters
+        threshold = counts.nlargest(TOPK_CAPACITY + 1).iloc[-1]
+        counts = counts[counts > threshold] - threshold
+        profile["pruned"] = True
+    profile["counts"] = counts
+
+
+def update_profile(profile, column):
+    """
+    Folds one chunk of a column into its summaries.
+    :param profile: Column summaries from new_column_profile, updated in place.
+    :type profile: dict
+    :param column: One chunk of the column.
+    :type column: pandas series
+    :return: None.
+    :rtype: None.
+    """
+    values = column.dropna()
+    profile["rows"] += len(column)
+    profile["nulls"] += len(column) - len(values)
+    if values.empty:
+        return
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        values = values.astype(str)
+    numbers = pd.to_numeric(values, errors="coerce").dropna()
+    if len(numbers):
+        profile["numeric"] += len(numbers)
+        profile["min"] = min(profile["min"], float(numbers.min()))
+        profile["max"] = max(profile["max"], float(numbers.max()))
+        profile["sum"] += float(numbers.sum())
+    hll_update(profile["registers"], values)
+    topk_update(profile, values)
+
+
+def to_json_value(value):
+    """
+    Converts a numpy or pandas scalar to a JSON-serializable value.
+    :param value: Value of a column.
+    :type value: object
+    :return: Plain Python value.
+    :rtype: object
+    """
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return str(value)
+
+
+def finalize_profile(profile, top_k=TOP_K):
+    """
+    Summarizes a column's accumulators for the report.
+    :param profile: Column summaries.
+    :type profile: dict
+    :param top_k: Number of most frequent values to report (default: TOP_K).
+    :type top_k: int
+    :return: Column report.
+    :rtype: dict
+    """
+    report = {
+        "rows": profile["rows"],
+        "nulls": profile["nulls"],
+        "null_share": (
+            round(profile["nulls"] / profile["rows"], 5) if profile["rows"] else None
+        ),
+        "numeric": profile["numeric"],
+    }
+    if profile["numeric"]:
+        report["min"] = profile["min"]
+        report["max"] = profile["max"]
+        report["mean"] = round(profile["sum"] / profile["numeric"], 6)
+    if profile["pruned"]:
+        report["distinct_approx"] = hll_estimate(profile["registers"])
+    else:
+        report["distinct"] = len(profile["counts"])
+    # An empty pruned summary says only that no value is frequent, not that the column has no values
+    if not (profile["pruned"] and profile["counts"].empty):
+        top = profile["counts"].nlargest(top_k)
+        report["top"] = [
+            [to_json_value(value), int(count)] for value, count in top.items()
+        ]
+    report["top_exact"] = not profile["pruned"]
+    return report
+
+
+def profile_file(filepath, chunk_rows=CHUNK_ROWS, encoding="utf-8", top_k=TOP_K):
+    """
+    Profiles every column of a raw poll file in one streaming pass.
+    :param filepath: Path to a .csv (optionally compressed), .tab or .dta file.
+    :type filepath: str
+    :param chunk_rows: Number of rows per chunk (default: CHUNK_ROWS).
+    :type chunk_rows: int
+    :param encoding: Encoding of CSV and .tab files (default: utf-8).
+    :type encoding: str
+    :param top_k: Number of most frequent values to report per column (default: TOP_K).
+    :type top_k: int
+    :return: Report with the file name, row count and one entry per column.
+    :rtype: dict
+    """
+    profiles = {}
+    rows = 0
+    for chunk in iter_chunks(filepath, chunk_rows, encoding):
+        rows += len(chunk)
+        for col in chunk.columns:
+            if col not in profiles:
+                profiles[col] = new_column_profile()
+            update_profile(profiles[col], chunk[col])
+    return {
+        "file": os.path.basename(filepath),
+        "bytes": os.path.getsize(filepath),
+        "rows": rows,
+        "columns": {
+            col: finalize_profile(profile, top_k) for col, profile in profiles.items()
+        },
+    }
+
+
+def write_report(filepath, report_path=None, **kwargs):
+    """
+    Profiles a raw poll file and writes the report as JSON next to it.
+    :param filepath: Path to a .csv (optionally compressed), .tab or .dta file.
+    :type filepath: str
+    :param report_path: Destination of the report (default: the file path with a .profile.json suffix).
+    :type report_path: str | None
+    :param kwargs: Options passed to profile_file.
+    :return: The report.
+    :rtype: dict
+    """
+    report = profile_file(filepath, **kwargs)
+    utl.write_json(report_path or f"{filepath}.profile.json", report, indent=None)
+    return report
+
+
+def main():
+    """
+    Entry point for the script.
+    :return: None.
+    :rtype: None.
+    """
+    os.makedirs("../output/profiles", exist_ok=True)
+    for filepath in [
+        "../data/national_march_2020/MUP213_NATL_archive.tab",
+        "../data/national_june_2020/MUP218_NATL_archive_full.tab",
+        "../data/national_aug_2020/MUP222_NATL_archive_full.tab",
+    ]:
+        if not os.path.exists(filepath):
+            continue
+        report_path = f"../output/profiles/{os.path.basename(filepath)}.json"
+        report = write_report(filepath, report_path)
+        print(f"Profiled {report['rows']} rows of {report['file']} to {report_path}")
+
+
+if __name__ == "__main__":
+    main()
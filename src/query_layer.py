@@ -0,0 +1,310 @@
+"""
+This script exposes the data directory and pipeline outputs as tables of an embedded DuckDB database, so ad hoc
+questions can be answered with SQL joins instead of loading whole CSVs into pandas and chaining merges.
+
+Every CSV, tab-separated and Parquet file under the data and output directories is registered as a view named after
+its path, e.g. post_stratification_data_by_state or runs_2020_all_polls_mrp_final_pred_elec. Multi-file datasets in
+DATASETS, such as the per-run files of the prediction history, are registered as one view over all their files.
+Nothing is read when views are registered. DuckDB reads only the columns a query uses and skips Parquet row groups
+that its filters exclude, and it spills joins and aggregations to a temporary directory when they do not fit within
+MEMORY_LIMIT, so queries run out of core.
+
+CSV files cannot be pruned by row group, so frequently queried ones can be converted once to Parquet with
+columnarize. Later connections then read the Parquet copy for as long as it is newer than its CSV.
+
+Example:
+    python query_layer.py "SELECT STATEFIP, SUM(PERWT) FROM post_stratification_data_by_state GROUP BY 1"
+"""
+
+import argparse
+import glob
+import os
+import re
+
+import duckdb
+
+DATA_DIR = "../data"
+OUTPUT_DIR = "../output"
+
+# Parquet copies of CSV files written by columnarize
+COLUMNAR_DIR = "../output/columnar"
+
+# Scratch space for operators that spill to disk
+TEMP_DIR = "../output/duckdb_tmp"
+MEMORY_LIMIT = "2GB"
+
+# Datasets stored as many files with the same columns, registered as one view each (relative to OUTPUT_DIR)
+DATASETS = {
+    "history_runs": "history/runs/*.parquet",
+}
+
+EXTENSIONS = (".csv", ".csv.gz", ".tab", ".tsv", ".parquet")
+
+# Strings read as missing in text files, as pandas does for the files written by the R scripts
+NULL_STRINGS = ["", "NA"]
+
+
+def table_name(relpath):
+    """
+    Builds a SQL-safe table name from a file path relative to its root directory.
+    :param relpath: Relative file path, e.g. runs/2020/all_polls/mrp/final_pred_elec.csv.
+    :type relpath: str
+    :return: Lowercase table name, e.g. runs_2020_all_polls_mrp_final_pred_elec.
+    :rtype: str
+    """
+    for ext in EXTENSIONS:
+        if relpath.endswith(ext):
+            relpath = relpath[: -len(ext)]
+            break
+    name = re.sub(r"[^0-9a-zA-Z]+", "_", relpath).strip("_").lower()
+    return f"t_{name}" if name[:1].isdigit() else name
+
+
+def find_files(root, skip=()):
+    """
+    Lists the tabular files under a directory.
+    :param root: Directory to search.
+    :type root: str
+    :param skip: Subdirectories of root to leave out.
+    :type skip: tuple
+    :return: Relative paths of the files, sorted.
+    :rtype: list
+    """
+    skip_paths = [os.path.join(root, sub) for sub in skip]
+    found = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        if any(
+            dirpath == path or dirpath.startswith(path + os.sep) for path in skip_paths
+        ):
+            dirnames.clear()
+            continue
+        dirnames[:] = [name for name in dirnames if not name.startswith(".")]
+        for filename in filenames:
+            if filename.endswith(EXTENSIONS) and not filename.startswith("."):
+                found.append(os.path.relpath(os.path.join(dirpath, filename), root))
+    return sorted(found)
+
+
+def scan_sql(filepath):
+    """
+    Builds the table function that scans a file.
+    :param filepath: Path to a CSV, tab-separated or Parquet file, or a glob of Parquet files.
+    :type filepath: str
+    :return: SQL table function call.
+    :rtype: str
+    """
+    path = filepath.replace("'", "''")
+    if filepath.endswith(".parquet"):
+        return f"read_parquet('{path}', union_by_name = true)"
+    options = f"header = true, nullstr = {NULL_STRINGS}"
+    if filepath.endswith((".tab", ".tsv")):
+        options += ", delim = '\\t'"
+    return f"read_csv('{path}', {options})"
+
+
+def columnar_path(name, columnar_dir=COLUMNAR_DIR):
+    """
+    Returns the path of the Parquet copy of a table.
+    :param name: Table name.
+    :type name: str
+    :param columnar_dir: Directory of Parquet copies (default: COLUMNAR_DIR).
+    :type columnar_dir: str
+    :return: Path to the Parquet file.
+    :rtype: str
+    """
+    return os.path.join(columnar_dir, f"{name}.parquet")
+
+
+def fresh_copy(name, filepath, columnar_dir=COLUMNAR_DIR):
+    """
+    Finds a Parquet copy of a CSV file that is newer than the file.
+    :param name: Table name.
+    :type name: str
+    :param filepath: Path to the CSV file.
+    :type filepath: str
+    :param columnar_dir: Directory of Parquet copies (default: COLUMNAR_DIR).
+    :type columnar_dir: str
+    :return: Path to the copy, or None.
+    :rtype: str | None
+    """
+    copy_path = columnar_path(name, columnar_dir)
+    if os.path.exists(copy_path) and os.path.getmtime(copy_path) >= os.path.getmtime(
+        filepath
+    ):
+        return copy_path
+    return None
+
+
+def catalog(data_dir=DATA_DIR, output_dir=OUTPUT_DIR, columnar_dir=COLUMNAR_DIR):
+    """
+    Lists every table with the files it reads.
+    :param data_dir: Directory of input data (default: DATA_DIR).
+    :type data_dir: str
+    :param output_dir: Directory of pipeline outputs (default: OUTPUT_DIR).
+    :type output_dir: str
+    :param columnar_dir: Directory of Parquet copies (default: COLUMNAR_DIR).
+    :type columnar_dir: str
+    :return: Path or glob scanned by each table, keyed by table name. Data tables win name clashes with outputs.
+    :rtype: dict
+    """
+    tables = {}
+    for name, pattern in DATASETS.items():
+        if glob.glob(os.path.join(output_dir, pattern)):
+            tables[name] = os.path.join(output_dir, pattern)
+    # Files of multi-file datasets, scratch space and Parquet copies are not tables of their own
+    skip = tuple(os.path.dirname(pattern) for pattern in DATASETS.values())
+    skip += tuple(
+        os.path.relpath(path, output_dir)
+        for path in (columnar_dir, TEMP_DIR)
+        if os.path.abspath(path).startswith(os.path.abspath(output_dir) + os.sep)
+    )
+    for root, root_skip in [(data_dir, ()), (output_dir, skip)]:
+        if not os.path.isdir(root):
+            continue
+        for relpath in find_files(root, root_skip):
+            name = table_name(relpath)
+            if name not in tables:
+                tables[name] = os.path.join(root, relpath)
+    return tables
+
+
+def connect(
+    data_dir=DATA_DIR,
+    output_dir=OUTPUT_DIR,
+    columnar_dir=COLUMNAR_DIR,
+    memory_limit=MEMORY_LIMIT,
+    temp_dir=TEMP_DIR,
+):
+    """
+    Opens an in-memory DuckDB database with a view for every table in the catalog.
+    :param data_dir: Directory of input data (default: DATA_DIR).
+    :type data_dir: str
+    :param output_dir: Directory of pipeline outputs (default: OUTPUT_DIR).
+    :type output_dir: str
+    :param columnar_dir: Directory of Parquet copies, used instead of CSV files they are newer than (default:
+        COLUMNAR_DIR).
+    :type columnar_dir: str
+    :param memory_limit: Memory DuckDB may use before spilling to temp_dir (default: MEMORY_LIMIT).
+    :type memory_limit: str
+    :param temp_dir: Directory for spilled data (default: TEMP_DIR).
+    :type temp_dir: str
+    :return: Connection, and the files that could not be registered with their errors.
+    :rtype: tuple
+    """
+    conn = duckdb.connect()
+    conn.execute(f"SET memory_limit = '{memory_limit}'")
+    conn.execute(f"SET temp_directory = '{temp_dir}'")
+    skipped = {}
+    for name, filepath in catalog(data_dir, output_dir, columnar_dir).items():
+        source = filepath
+        if not filepath.endswith(".parquet"):
+            source = fresh_copy(name, filepath, columnar_dir) or filepath
+        try:
+            conn.execute(f'CREATE VIEW "{name}" AS SELECT * FROM {scan_sql(source)}')
+        except duckdb.Error as e:
+            skipped[filepath] = str(e).splitlines()[0]
+    return conn, skipped
+
+
+def list_tables(conn):
+    """
+    Lists the registered tables.
+    :param conn: Connection from connect.
+    :type conn: duckdb.DuckDBPyConnection
+    :return: Table names.
+    :rtype: list
+    """
+    return [row[0] for row in conn.execute("SHOW TABLES").fetchall()]
+
+
+def query(conn, sql, params=None):
+    """
+    Runs a query and returns its result as a dataframe.
+    :param conn: Connection from connect.
+    :type conn: duckdb.DuckDBPyConnection
+    :param sql: SQL query over the registered tables.
+    :type sql: str
+    :param params: Optional values for ? placeholders in the query (default: None).
+    :type params: list | None
+    :return: Query result.
+    :rtype: pandas dataframe
+    """
+    return conn.execute(sql, params or []).df()
+
+
+def explain(conn, sql):
+    """
+    Returns the physical plan of a query, which shows the columns and filters pushed down into each scan.
+    :param conn: Connection from connect.
+    :type conn: duckdb.DuckDBPyConnection
+    :param sql: SQL query over the registered tables.
+    :type sql: str
+    :return: Query plan.
+    :rtype: str
+    """
+    return conn.execute(f"EXPLAIN {sql}").fetchall()[0][1]
+
+
+def columnarize(conn, names, columnar_dir=COLUMNAR_DIR):
+    """
+    Writes Parquet copies of tables, which later connections read instead of the CSV files.
+    :param conn: Connection from connect.
+    :type conn: duckdb.DuckDBPyConnection
+    :param names: Names of the tables to copy.
+    :type names: list
+    :param columnar_dir: Directory of Parquet copies (default: COLUMNAR_DIR).
+    :type columnar_dir: str
+    :return: Paths of the copies.
+    :rtype: list
+    """
+    os.makedirs(columnar_dir, exist_ok=True)
+    paths = []
+    for name in names:
+        copy_path = columnar_path(name, columnar_dir)
+        tmp_path = f"{copy_path}.tmp"
+        conn.execute(
+            f"COPY (SELECT * FROM \"{name}\") TO '{tmp_path}' "
+            "(FORMAT parquet, COMPRESSION zstd)"
+        )
+        os.replace(tmp_path, copy_path)
+        paths.append(copy_path)
+    return paths
+
+
+def main():
+    """
+    Entry point for the script.
+    :return: None.
+    :rtype: None.
+    """
+    parser = argparse.ArgumentParser(
+        description="Query data and pipeline outputs with SQL."
+    )
+    parser.add_argument("sql", nargs="?", help="Query to run (default: list tables).")
+    parser.add_argument(
+        "--explain", action="store_true", help="Show the query plan instead."
+    )
+    parser.add_argument(
+        "--columnarize",
+        nargs="+",
+        metavar="TABLE",
+        help="Write Parquet copies of these tables.",
+    )
+    args = parser.parse_args()
+
+    conn, skipped = connect()
+    for filepath, error in skipped.items():
+        print(f"Skipped {filepath}: {error}")
+    if args.columnarize:
+        for copy_path in columnarize(conn, args.columnarize):
+            print(f"Wrote {copy_path}")
+    if args.sql and args.explain:
+        print(explain(conn, args.sql))
+    elif args.sql:
+        print(query(conn, args.sql).to_string(index=False))
+    elif not args.columnarize:
+        print("\n".join(list_tables(conn)))
+
+
+if __name__ == "__main__":
+    main()
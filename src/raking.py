@@ -0,0 +1,307 @@
+"""
+This script calibrates poll respondent weights to American Community Survey population margins by raking (iterative
+proportional fitting). Margins are taken from the post-stratification table (post_stratification_data_by_state.csv),
+so any combination of age, race, sex, education and state can be used as raking dimensions.
+
+Respondents are collapsed onto integer-coded demographic cells before raking. Every raking step is then a group sum
+over at most a few thousand cells, so the cost per iteration does not grow with the number of respondents.
+"""
+
+import numpy as np
+import pandas as pd
+
+RAKE_DIMS = ["age_recoded", "race_recoded", "male", "education_recoded", "STATEFIP"]
+
+# Dense cell arrays are used when the product of the dimension sizes stays below this limit.
+MAX_DENSE_CELLS = 10_000_000
+
+
+def get_acs_margins(post_strat, dims=None, weight_col="PERWT"):
+    """
+    Computes population shares for each level of each raking dimension from the post-stratification table.
+    :param post_strat: Post-stratification data with one row per demographic cell and a population weight column.
+    :type post_strat: pandas dataframe
+    :param dims: Columns to compute margins for (default: RAKE_DIMS).
+    :type dims: list | None
+    :param weight_col: Column containing ACS person weights (default: PERWT).
+    :type weight_col: str
+    :return: Population shares indexed by level for each dimension.
+    :rtype: dict of pandas series
+    """
+    if dims is None:
+        dims = RAKE_DIMS
+    margins = {}
+    for dim in dims:
+        totals = post_strat.groupby(dim, observed=True)[weight_col].sum()
+        margins[dim] = totals / totals.sum()
+    return margins
+
+
+def encode_dimension(values, levels):
+    """
+    Maps respondent values onto integer codes matching the order of the target levels.
+    :param values: Respondent values for a single dimension.
+    :type values: pandas series | array-like
+    :param levels: Levels of the dimension in target order.
+    :type levels: array-like
+    :return: Integer codes, with -1 for values that do not match any level.
+    :rtype: numpy array
+    """
+    return np.asarray(pd.Categorical(values, categories=levels).codes, dtype=np.int64)
+
+
+def collapse_cells(codes, sizes, base_weights):
+    """
+    Collapses respondents onto the cells defined by the cross-classification of all raking dimensions.
+    :param codes: Integer codes for each raking dimension, one array per dimension.
+    :type codes: list of numpy arrays
+    :param sizes: Number of levels in each dimension.
+    :type sizes: list of int
+    :param base_weights: Starting weight for each respondent.
+    :type base_weights: numpy array
+    :return: Cell index for each respondent, weight mass per cell and dimension codes per cell.
+    :rtype: tuple
+    """
+    n_cells = int(np.prod(sizes, dtype=np.int64))
+    cell = np.ravel_multi_index(codes, sizes)
+    if n_cells <= MAX_DENSE_CELLS:
+        cell_mass = np.bincount(cell, weights=base_weights, minlength=n_cells)
+        cell_codes = np.unravel_index(np.arange(n_cells), sizes)
+        return cell, cell_mass, list(cell_codes)
+    unique_cells, cell = np.unique(cell, return_inverse=True)
+    cell_mass = np.bincount(cell, weights=base_weights, minlength=len(unique_cells))
+    cell_codes = np.unravel_index(unique_cells, sizes)
+    return cell, cell_mass, list(cell_codes)
+
+
+def rake_cells(cell_mass, cell_codes, targets, max_iter=100, tol=1e-6):
+    """
+    Rakes cell masses to the target margins.
+    :param cell_mass: Current weight mass in each cell.
+    :type cell_mass: numpy array
+    :param cell_codes: Level code of each cell for every raking dimension.
+    :type cell_codes: list of numpy arrays
+    :param targets: Target weight totals for every level of every dimension.
+    :type targets: list of numpy arrays
+    :param max_iter: Maximum number of raking sweeps (default: 100).
+    :type max_iter: int
+    :param tol: Largest allowed relative deviation from any target margin (default: 1e-6).
+    :type tol: float
+    :return: Multiplicative adjustment for each cell, number of sweeps and final maximum relative deviation.
+    :rtype: tuple
+    """
+    factor = np.ones_like(cell_mass)
+    max_dev = np.inf
+    for iteration in range(1, max_iter + 1):
+        for dim_codes, target in zip(cell_codes, targets):
+            current = np.bincount(
+                dim_codes, weights=cell_mass * factor, minlength=len(target)
+            )
+            adjust = np.divide(
+                target, current, out=np.ones_like(target), where=current > 0
+            )
+            factor *= adjust[dim_codes]
+        max_dev = margin_deviation(cell_mass * factor, cell_codes, targets)
+        if max_dev < tol:
+            return factor, iteration, max_dev
+    return factor, max_iter, max_dev
+
+
+def margin_deviation(cell_mass, cell_codes, targets):
+    """
+    Computes the largest relative deviation between weighted margins and their targets.
+    :param cell_mass: Weight mass in each cell.
+    :type cell_mass: numpy array
+    :param cell_codes: Level code of each cell for every raking dimension.
+    :type cell_codes: list of numpy arrays
+    :param targets: Target weight totals for every level of every dimension.
+    :type targets: list of numpy arrays
+    :return: Maximum relative deviation across all levels with a positive target.
+    :rtype: float
+    """
+    max_dev = 0.0
+    for dim_codes, target in zip(cell_codes, targets):
+        current = np.bincount(dim_codes, weights=cell_mass, minlength=len(target))
+        positive = target > 0
+        if positive.any():
+            dev = np.abs(current[positive] - target[positive]) / target[positive]
+            max_dev = max(max_dev, float(dev.max()))
+    return max_dev
+
+
+def rake_weights(
+    codes, targets, base_weights=None, max_iter=100, tol=1e-6, trim=None, max_trim=20
+):
+    """
+    Calibrates respondent weights so that weighted shares match the target margins of every dimension.
+    :param codes: Integer codes for each raking dimension, one array per dimension. Codes must be non-negative.
+    :type codes: list of numpy arrays
+    :param targets: Target population shares for every level of every dimension, in code order.
+    :type targets: list of array-like
+    :param base_weights: Optional starting weights, such as vendor weights (default: equal weights).
+    :type base_weights: numpy array | None
+    :param max_iter: Maximum number of raking sweeps per trimming round (default: 100).
+    :type max_iter: int
+    :param tol: Largest allowed relative deviation from any target margin (default: 1e-6).
+    :type tol: float
+    :param trim: Optional (lower, upper) bounds on weights relative to the mean weight, e.g. (0.2, 5).
+    :type trim: tuple | None
+    :param max_trim: Maximum number of alternating rake and trim rounds (default: 20).
+    :type max_trim: int
+    :return: Raked weights scaled to mean 1 and a dictionary of diagnostics.
+    :rtype: tuple
+    """
+    n = len(codes[0])
+    if base_weights is None:
+        weights = np.ones(n, dtype=np.float64)
+    else:
+        weights = np.asarray(base_weights, dtype=np.float64).copy()
+    codes = [np.asarray(dim_codes, dtype=np.int64) for dim_codes in codes]
+    sizes = [len(target) for target in targets]
+    for dim_codes in codes:
+        if dim_codes.min() < 0:
+            raise ValueError("Respondent codes must match a target level.")
+
+    # Levels without respondents cannot be reached, so shares are renormalized over observed levels
+    totals = []
+    empty_levels = []
+    for dim_codes, target in zip(codes, targets):
+        target = np.asarray(target, dtype=np.float64)
+        observed = np.bincount(dim_codes, minlength=len(target)) > 0
+        empty_levels.append(np.flatnonzero(~observed & (target > 0)).tolist())
+        target = np.where(observed, target, 0.0)
+        totals.append(target / target.sum() * weights.sum())
+
+    iterations = 0
+    n_trimmed = 0
+    converged = False
+    for _ in range(max_trim):
+        cell, cell_mass, cell_codes = collapse_cells(codes, sizes, weights)
+        factor, sweeps, max_dev = rake_cells(
+            cell_mass, cell_codes, totals, max_iter=max_iter, tol=tol
+        )
+        iterations += sweeps
+        weights *= factor[cell]
+        converged = max_dev < tol
+        if trim is None:
+            break
+        mean_weight = weights.mean()
+        lower, upper = trim[0] * mean_weight, trim[1] * mean_weight
+        out_of_bounds = (weights < lower * (1 - tol)) | (weights > upper * (1 + tol))
+        n_trimmed = int(out_of_bounds.sum())
+        if n_trimmed == 0 and converged:
+            break
+        np.clip(weights, lower, upper, out=weights)
+    else:
+        # The last round ended on a trim, so report how far the trimmed weights are from the margins
+        cell, cell_mass, cell_codes = collapse_cells(codes, sizes, weights)
+        max_dev = margin_deviation(cell_mass, cell_codes, totals)
+        converged = max_dev < tol
+
+    weights /= weights.mean()
+    diagnostics = summarize_weights(weights)
+    diagnostics.update(
+        {
+            "iterations": iterations,
+            "converged": converged,
+            "max_margin_deviation": max_dev,
+            "n_trimmed": n_trimmed,
+            "empty_levels": empty_levels,
+        }
+    )
+    return weights, diagnostics
+
+
+def summarize_weights(weights):
+    """
+    Summarizes the spread of a set of weights.
+    :param weights: Respondent weights.
+    :type weights: numpy array
+    :return: Minimum, maximum, Kish design effect and effective sample size.
+    :rtype: dict
+    """
+    n = len(weights)
+    design_effect = n * np.sum(weights**2) / np.sum(weights) ** 2
+    return {
+        "n": n,
+        "min_weight": float(weights.min()),
+        "max_weight": float(weights.max()),
+        "design_effect": float(design_effect),
+        "effective_n": float(n / design_effect),
+    }
+
+
+def rake_poll(
+    poll_data,
+    margins,
+    base_weight_col=None,
+    weight_col="rake_weight",
+    max_iter=100,
+    tol=1e-6,
+    trim=None,
+):
+    """
+    Rakes a recoded poll to population margins and adds the calibrated weights as a new column.
+    :param poll_data: Recoded poll data containing a column for each raking dimension.
+    :type poll_data: pandas dataframe
+    :param margins: Population shares indexed by level for each dimension, as returned by get_acs_margins.
+    :type margins: dict of pandas series
+    :param base_weight_col: Optional column of starting weights, e.g. FINALWGT (default: None).
+    :type base_weight_col: str | None
+    :param weight_col: Name of the output weight column (default: rake_weight).
+    :type weight_col: str
+    :param max_iter: Maximum number of raking sweeps (default: 100).
+    :type max_iter: int
+    :param tol: Largest allowed relative deviation from any target margin (default: 1e-6).
+    :type tol: float
+    :param trim: Optional (lower, upper) bounds on weights relative to the mean weight (default: None).
+    :type trim: tuple | None
+    :return: Poll data with raked weights and a dictionary of diagnostics.
+    :rtype: tuple
+    """
+    dims = list(margins.keys())
+    codes = [encode_dimension(poll_data[dim], margins[dim].index) for dim in dims]
+    unmatched = {
+        dim: int((dim_codes < 0).sum())
+        for dim, dim_codes in zip(dims, codes)
+        if (dim_codes < 0).any()
+    }
+    if unmatched:
+        raise ValueError(f"Respondents without a matching margin level: {unmatched}")
+    base_weights = None
+    if base_weight_col is not None:
+        base_weights = poll_data[base_weight_col].to_numpy(dtype=np.float64)
+    weights, diagnostics = rake_weights(
+        codes,
+        [margins[dim].to_numpy() for dim in dims],
+        base_weights=base_weights,
+        max_iter=max_iter,
+        tol=tol,
+        trim=trim,
+    )
+    diagnostics["empty_levels"] = {
+        dim: [margins[dim].index[i] for i in empty]
+        for dim, empty in zip(dims, diagnostics["empty_levels"])
+        if empty
+    }
+    poll_data = poll_data.copy()
+    poll_data[weight_col] = weights
+    return poll_data, diagnostics
+
+
+def main():
+    """
+    Entry point for the script.
+    :return: None.
+    :rtype: None.
+    """
+    post_strat = pd.read_csv("../data/post_stratification_data_by_state.csv")
+    harvard = pd.read_csv("../data/harvard_poll.csv").dropna(subset=RAKE_DIMS)
+    margins = get_acs_margins(post_strat, RAKE_DIMS)
+    harvard, diagnostics = rake_poll(harvard, margins, trim=(0.2, 5))
+    print(f"Raking diagnostics:\n{diagnostics}\n")
+    harvard.to_csv("../data/harvard_poll_raked.csv", index=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,362 @@
+"""
+This script scores probabilistic election forecasts made of many simulated outcomes (draws) per state. Draws are read in
+chunks of rows, each row being one simulated election with a margin for every state, and folded into per-state
+accumulators. The accumulators are all that is kept in memory, so a 100k x 51 draw matrix per model variant never has
+to be loaded at once.
+
+Margins follow the margin_trump convention of the prediction files, (Biden - Trump) / total, so Trump wins a state when
+its margin is negative. Scores computed from the accumulators are:
+
+- Brier score and log loss of the probability that Trump wins each state, against the actual winner,
+- CRPS of the margin distribution against the actual margin, from a fine histogram of the draws,
+- calibration bins of predicted win probabilities against observed win rates,
+- coverage of central prediction intervals of the margin.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+# Histogram of margins used for CRPS and interval coverage
+MARGIN_RANGE = (-1.0, 1.0)
+N_BINS = 2000
+
+INTERVALS = [0.5, 0.8, 0.95]
+
+# Manually cleaned actual state margins (see eval.load_actual_margins); not checked in, so CRPS and interval coverage
+# are only scored when a copy is present
+ACTUAL_MARGINS_PATH = "../data/2020_election/actual_margin_result.csv"
+
+# Predicted probabilities are clipped away from 0 and 1 before taking logs
+LOG_LOSS_EPS = 1e-6
+
+
+def new_accumulator(n_states, n_bins=N_BINS, margin_range=MARGIN_RANGE):
+    """
+    Creates empty per-state accumulators for streamed draws.
+    :param n_states: Number of states (columns of each draw chunk).
+    :type n_states: int
+    :param n_bins: Number of histogram bins over margin_range (default: N_BINS).
+    :type n_bins: int
+    :param margin_range: Lowest and highest margin covered by the histogram (default: MARGIN_RANGE).
+    :type margin_range: tuple
+    :return: Accumulator with draw counts, Trump win counts, margin sums and margin histograms.
+    :rtype: dict
+    """
+    return {
+        "n": 0,
+        "trump_wins": np.zeros(n_states),
+        "margin_sum": np.zeros(n_states),
+        "hist": np.zeros((n_states, n_bins)),
+        "edges": np.linspace(margin_range[0], margin_range[1], n_bins + 1),
+    }
+
+
+def update(acc, draws):
+    """
+    Folds a chunk of draws into the accumulators.
+    :param acc: Accumulator from new_accumulator, updated in place.
+    :type acc: dict
+    :param draws: Simulated margins, one row per draw and one column per state.
+    :type draws: numpy array
+    :return: The updated accumulator.
+    :rtype: dict
+    """
+    draws = np.asarray(draws, dtype=np.float64)
+    n_states, n_bins = acc["hist"].shape
+    acc["n"] += len(draws)
+    acc["trump_wins"] += (draws < 0).sum(axis=0)
+    acc["margin_sum"] += draws.sum(axis=0)
+
+    # Margins outside the histogram range fall into the first or last bin
+    low, high = acc["edges"][0], acc["edges"][-1]
+    bins = ((draws - low) / (high - low) * n_bins).astype(np.int64)
+    np.clip(bins, 0, n_bins - 1, out=bins)
+    flat = (bins + np.arange(n_states) * n_bins).ravel()
+    acc["hist"] += np.bincount(flat, minlength=n_states * n_bins).reshape(
+        n_states, n_bins
+    )
+    return acc
+
+
+def iter_draw_chunks(filepath, chunk_rows=10_000, columns=None):
+    """
+    Reads a draw file in chunks of rows. Supports .npy (memory-mapped), .parquet and .csv files (optionally
+    compressed).
+    :param filepath: Path to the draw file.
+    :type filepath: str
+    :param chunk_rows: Number of draws per chunk (default: 10,000).
+    :type chunk_rows: int
+    :param columns: State columns to read, in order, for .parquet and .csv files (default: every column).
+    :type columns: list | None
+    :return: Generator of draw chunks.
+    :rtype: generator of numpy arrays
+    """
+    if filepath.endswith(".npy"):
+        draws = np.load(filepath, mmap_mode="r")
+        for start in range(0, len(draws), chunk_rows):
+            yield np.asarray(draws[start : start + chunk_rows])
+    elif filepath.endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(filepath).iter_batches(
+            batch_size=chunk_rows, columns=columns
+        ):
+            yield batch.to_pandas().to_numpy(dtype=np.float64)
+    else:
+        for chunk in pd.read_csv(filepath, chunksize=chunk_rows, usecols=columns):
+            yield chunk[columns or chunk.columns].to_numpy(dtype=np.float64)
+
+
+def simulate_draws(margin, margin_se, n_draws, chunk_rows=10_000, seed=13):
+    """
+    Generates normal draws of state margins in chunks, e.g. from the standard errors of predict_state_se.
+    :param margin: Expected margin of each state.
+    :type margin: array-like
+    :param margin_se: Standard error of each state's margin.
+    :type margin_se: array-like
+    :param n_draws: Total number of draws.
+    :type n_draws: int
+    :param chunk_rows: Number of draws per chunk (default: 10,000).
+    :type chunk_rows: int
+    :param seed: Random seed (default: 13).
+    :type seed: int
+    :return: Generator of draw chunks.
+    :rtype: generator of numpy arrays
+    """
+    rng = np.random.default_rng(seed)
+    margin = np.asarray(margin, dtype=np.float64)
+    margin_se = np.asarray(margin_se, dtype=np.float64)
+    for start in range(0, n_draws, chunk_rows):
+        rows = min(chunk_rows, n_draws - start)
+        yield margin + margin_se * rng.standard_normal((rows, len(margin)))
+
+
+def histogram_crps(acc, actual_margin):
+    """
+    Computes the CRPS of each state's margin histogram against the actual margin.
+    :param acc: Accumulator holding at least one draw.
+    :type acc: dict
+    :param actual_margin: Actual margin of each state.
+    :type actual_margin: numpy array
+    :return: CRPS of each state.
+    :rtype: numpy array
+    """
+    edges = acc["edges"]
+    cdf = np.cumsum(acc["hist"], axis=1) / acc["n"]
+    # The histogram CDF is evaluated at the right edge of each bin
+    observed = (edges[None, 1:] >= actual_margin[:, None]).astype(np.float64)
+    return ((cdf - observed) ** 2 * np.diff(edges)[None, :]).sum(axis=1)
+
+
+def interval_bounds(acc, level):
+    """
+    Finds the central prediction interval of each state's margin from its histogram.
+    :param acc: Accumulator holding at least one draw.
+    :type acc: dict
+    :param level: Interval level, e.g. 0.8.
+    :type level: float
+    :return: Lower and upper bounds of each state's interval.
+    :rtype: tuple of numpy arrays
+    """
+    cdf = np.cumsum(acc["hist"], axis=1) / acc["n"]
+    edges = acc["edges"]
+    lower = np.array([edges[np.searchsorted(row, (1 - level) / 2)] for row in cdf])
+    upper = np.array([edges[np.searchsorted(row, (1 + level) / 2) + 1] for row in cdf])
+    return lower, upper
+
+
+def calibration_bins(win_prob, trump_won, n_bins=10):
+    """
+    Groups predicted win probabilities into equal-width bins and compares them with observed win rates.
+    :param win_prob: Predicted probability that Trump wins, per state (and per variant when pooled).
+    :type win_prob: numpy array
+    :param trump_won: Whether Trump won each state.
+    :type trump_won: numpy array
+    :param n_bins: Number of probability bins (default: 10).
+    :type n_bins: int
+    :return: One row per non-empty bin with the mean predicted probability, observed win rate and count.
+    :rtype: pandas dataframe
+    """
+    bins = np.minimum((np.asarray(win_prob) * n_bins).astype(np.int64), n_bins - 1)
+    counts = np.bincount(bins, minlength=n_bins)
+    pred = np.bincount(bins, weights=win_prob, minlength=n_bins)
+    observed = np.bincount(bins, weights=trump_won, minlength=n_bins)
+    calibration = pd.DataFrame(
+        {
+            "bin_lower": np.arange(n_bins) / n_bins,
+            "bin_upper": np.arange(1, n_bins + 1) / n_bins,
+            "mean_pred": pred / np.maximum(counts, 1),
+            "observed_rate": observed / np.maximum(counts, 1),
+            "n": counts,
+        }
+    )
+    return calibration[calibration["n"] > 0].reset_index(drop=True)
+
+
+def finalize(acc, states, trump_won, actual_margin=None, intervals=None):
+    """
+    Computes per-state and overall scores from the accumulators.
+    :param acc: Accumulator holding at least one draw.
+    :type acc: dict
+    :param states: State names in column order.
+    :type states: list
+    :param trump_won: Whether Trump won each state.
+    :type trump_won: array-like
+    :param actual_margin: Actual margin of each state; CRPS and coverage are skipped without it (default: None).
+    :type actual_margin: array-like | None
+    :param intervals: Central interval levels to check coverage for (default: INTERVALS).
+    :type intervals: list | None
+    :return: Per-state scores and a dictionary of overall scores.
+    :rtype: tuple
+    """
+    if acc["n"] == 0:
+        raise ValueError("No draws were accumulated.")
+    if intervals is None:
+        intervals = INTERVALS
+    trump_won = np.asarray(trump_won, dtype=np.float64)
+    win_prob = acc["trump_wins"] / acc["n"]
+    clipped = np.clip(win_prob, LOG_LOSS_EPS, 1 - LOG_LOSS_EPS)
+    per_state = pd.DataFrame(
+        {
+            "state": states,
+            "trump_win_prob": win_prob,
+            "trump_won": trump_won.astype(int),
+            "mean_margin": acc["margin_sum"] / acc["n"],
+            "brier": (win_prob - trump_won) ** 2,
+            "log_loss": -(
+                trump_won * np.log(clipped) + (1 - trump_won) * np.log(1 - clipped)
+            ),
+        }
+    )
+    if actual_margin is not None:
+        actual_margin = np.asarray(actual_margin, dtype=np.float64)
+        per_state["actual_margin"] = actual_margin
+        per_state["crps"] = histogram_crps(acc, actual_margin)
+        for level in intervals:
+            lower, upper = interval_bounds(acc, level)
+            per_state[f"covered_{int(level * 100)}"] = (lower <= actual_margin) & (
+                actual_margin <= upper
+            )
+
+    score_cols = [col for col in per_state.columns if col in ("brier", "log_loss")]
+    score_cols += [col for col in per_state.columns if col.startswith(("crps", "cov"))]
+    overall = {"n_draws": acc["n"], "n_states": len(states)}
+    overall.update({col: float(per_state[col].mean()) for col in score_cols})
+    overall["accuracy"] = float(((win_prob > 0.5) == (trump_won == 1)).mean())
+    return per_state, overall
+
+
+def score_draws(chunks, states, trump_won, actual_margin=None, **kwargs):
+    """
+    Streams draw chunks through the accumulators and scores them.
+    :param chunks: Iterable of draw chunks, e.g. from iter_draw_chunks or simulate_draws.
+    :type chunks: iterable of numpy arrays
+    :param states: State names in column order.
+    :type states: list
+    :param trump_won: Whether Trump won each state.
+    :type trump_won: array-like
+    :param actual_margin: Actual margin of each state (default: None).
+    :type actual_margin: array-like | None
+    :param kwargs: Histogram options passed to new_accumulator.
+    :return: Per-state scores and a dictionary of overall scores.
+    :rtype: tuple
+    """
+    acc = new_accumulator(len(states), **kwargs)
+    for chunk in chunks:
+        update(acc, chunk)
+    return finalize(acc, states, trump_won, actual_margin)
+
+
+def score_variants(variants, states, trump_won, actual_margin=None, chunk_rows=10_000):
+    """
+    Scores several model variants, each given as a draw file or an iterable of draw chunks.
+    :param variants: Draw sources keyed by variant name.
+    :type variants: dict
+    :param states: State names in column order.
+    :type states: list
+    :param trump_won: Whether Trump won each state.
+    :type trump_won: array-like
+    :param actual_margin: Actual margin of each state (default: None).
+    :type actual_margin: array-like | None
+    :param chunk_rows: Number of draws per chunk when reading files (default: 10,000).
+    :type chunk_rows: int
+    :return: Per-state scores of every variant, overall scores (one row per variant) and pooled calibration bins.
+    :rtype: tuple of pandas dataframes
+    """
+    per_state, overall = [], []
+    for name, source in variants.items():
+        if isinstance(source, str):
+            source = iter_draw_chunks(source, chunk_rows)
+        variant_states, variant_overall = score_draws(
+            source, states, trump_won, actual_margin
+        )
+        per_state.append(variant_states.assign(variant=name))
+        overall.append({"variant": name, **variant_overall})
+    per_state = pd.concat(per_state, ignore_index=True)
+    calibration = calibration_bins(
+        per_state["trump_win_prob"].to_numpy(), per_state["trump_won"].to_numpy()
+    )
+    return per_state, pd.DataFrame(overall), calibration
+
+
+def main():
+    """
+    Entry point for the script.
+    :return: None.
+    :rtype: None.
+    """
+    import post_strat as ps
+
+    strat = ps.build_strat_table(
+        "../data/post_stratification_data_by_state.csv",
+        "../data/2020_ecollege_rep.csv",
+        "../data/turnout_by_state.csv",
+    )
+    actual = pd.read_csv("../data/2020_electoral_results.csv", nrows=51)
+    variants = {}
+    for name, filepath in {
+        "mrp_harvard": "../data/new_prop_scores_include_harvard_FINAL.csv",
+        "mrp_all": "../data/new_prop_scores_all.csv",
+    }.items():
+        state_se = ps.predict_state_se(
+            strat,
+            ps.read_cells(filepath),
+            "mrp_subgroup_estimate",
+            "mrp_subgroup_estimate_se",
+        )
+        state_se = state_se.set_index("state").reindex(actual["State"])
+        # Convert Trump's two-party share to the (Biden - Trump) / total margin
+        variants[name] = simulate_draws(
+            1 - 2 * state_se["trump_share"], 2 * state_se["trump_share_se"], 100_000
+        )
+
+    actual_margin = None
+    if os.path.exists(ACTUAL_MARGINS_PATH):
+        import eval as ev
+
+        margins = ev.load_actual_margins(ACTUAL_MARGINS_PATH)
+        actual_margin = margins.set_index("State")["%"].reindex(actual["State"])
+    else:
+        print(
+            f"Warning: {ACTUAL_MARGINS_PATH} not found, so CRPS and interval "
+            "coverage are skipped; only Brier score, log loss and accuracy are "
+            "reported."
+        )
+
+    per_state, overall, calibration = score_variants(
+        variants,
+        list(actual["State"]),
+        (actual["trump"] > actual["biden"]).to_numpy(),
+        actual_margin,
+    )
+    os.makedirs("../output", exist_ok=True)
+    per_state.to_csv("../output/draw_scores_by_state.csv", index=False)
+    overall.to_csv("../output/draw_scores.csv", index=False)
+    calibration.to_csv("../output/draw_calibration.csv", index=False)
+    print(overall)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""
+This script maps the many ways states are written across our sources (names such as "Maine (United States)" or
+"alabama*", postal abbreviations, FIPS codes as strings or numbers) to a single integer key: the state FIPS code, stored
+as a pandas categorical over the 50 states and the District of Columbia.
+
+Sources are keyed once at ingest and every later join is an integer merge, or direct array indexing through
+state_index. Normalization only ever runs on the distinct values of a column, so keying a poll with thousands of
+respondents costs 51 string operations at most.
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+# FIPS code, postal abbreviation and lowercase name of the 50 states and the District of Columbia
+STATES = [
+    (1, "AL", "alabama"),
+    (2, "AK", "alaska"),
+    (4, "AZ", "arizona"),
+    (5, "AR", "arkansas"),
+    (6, "CA", "california"),
+    (8, "CO", "colorado"),
+    (9, "CT", "connecticut"),
+    (10, "DE", "delaware"),
+    (11, "DC", "district of columbia"),
+    (12, "FL", "florida"),
+    (13, "GA", "georgia"),
+    (15, "HI", "hawaii"),
+    (16, "ID", "idaho"),
+    (17, "IL", "illinois"),
+    (18, "IN", "indiana"),
+    (19, "IA", "iowa"),
+    (20, "KS", "kansas"),
+    (21, "KY", "kentucky"),
+    (22, "LA", "louisiana"),
+    (23, "ME", "maine"),
+    (24, "MD", "maryland"),
+    (25, "MA", "massachusetts"),
+    (26, "MI", "michigan"),
+    (27, "MN", "minnesota"),
+    (28, "MS", "mississippi"),
+    (29, "MO", "missouri"),
+    (30, "MT", "montana"),
+    (31, "NE", "nebraska"),
+    (32, "NV", "nevada"),
+    (33, "NH", "new hampshire"),
+    (34, "NJ", "new jersey"),
+    (35, "NM", "new mexico"),
+    (36, "NY", "new york"),
+    (37, "NC", "north carolina"),
+    (38, "ND", "north dakota"),
+    (39, "OH", "ohio"),
+    (40, "OK", "oklahoma"),
+    (41, "OR", "oregon"),
+    (42, "PA", "pennsylvania"),
+    (44, "RI", "rhode island"),
+    (45, "SC", "south carolina"),
+    (46, "SD", "south dakota"),
+    (47, "TN", "tennessee"),
+    (48, "TX", "texas"),
+    (49, "UT", "utah"),
+    (50, "VT", "vermont"),
+    (51, "VA", "virginia"),
+    (53, "WA", "washington"),
+    (54, "WV", "west virginia"),
+    (55, "WI", "wisconsin"),
+    (56, "WY", "wyoming"),
+]
+
+FIPS = np.array([fips for fips, _, _ in STATES], dtype=np.int8)
+ABBREVIATIONS = [abbr for _, abbr, _ in STATES]
+NAMES = [name for _, _, name in STATES]
+
+# Every state key column shares this dtype, so merges between sources never upcast or fall back to object columns
+STATE_DTYPE = pd.CategoricalDtype(FIPS)
+
+# Other spellings found in our sources
+ALIASES = {
+    "washington dc": 11,
+    "washington d.c.": 11,
+    "d.c.": 11,
+}
+
+_LOOKUP = {
+    **{name: fips for fips, _, name in STATES},
+    **{abbr.lower(): fips for fips, abbr, _ in STATES},
+    **ALIASES,
+}
+
+
+def normalize_key(value):
+    """
+    Finds the FIPS code of a single state value.
+    :param value: State name, postal abbreviation or FIPS code, in any case and with stray markers such as "*" or
+        "(United States)".
+    :type value: str | int | float
+    :return: FIPS code, or None if the value is not a state or the District of Columbia.
+    :rtype: int | None
+    """
+    if isinstance(value, (int, np.integer)) or (
+        isinstance(value, (float, np.floating)) and float(value).is_integer()
+    ):
+        return int(value) if int(value) in STATE_DTYPE.categories else None
+    if not isinstance(value, str):
+        return None
+    key = re.sub(r"\(.*\)|\*", "", value).strip().lower()
+    if key.isdigit():
+        return normalize_key(int(key))
+    return _LOOKUP.get(key)
+
+
+def to_fips(values):
+    """
+    Keys a column of state values by FIPS code. Only the distinct values are normalized.
+    :param values: State names, abbreviations or FIPS codes.
+    :type values: pandas series | array-like
+    :return: FIPS codes as a STATE_DTYPE categorical, with NaN for values that are not states.
+    :rtype: pandas series
+    """
+    index = values.index if isinstance(values, pd.Series) else None
+    codes, uniques = pd.factorize(pd.Series(values), use_na_sentinel=True)
+    keys = np.array(
+        [normalize_key(value) or -1 for value in uniques] + [-1], dtype=np.int64
+    )
+    fips = keys[codes]
+    categories = np.searchsorted(FIPS, fips).clip(0, len(FIPS) - 1)
+    categories = np.where(FIPS[categories] == fips, categories, -1)
+    return pd.Series(
+        pd.Categorical.from_codes(categories, dtype=STATE_DTYPE), index=index
+    )
+
+
+def state_index(fips):
+    """
+    Converts FIPS codes to positions in STATES, so that per-state arrays can be indexed directly.
+    :param fips: FIPS codes, e.g. from to_fips.
+    :type fips: pandas series | array-like
+    :return: Position of each state, or -1 where the FIPS code is missing.
+    :rtype: numpy array
+    """
+    fips = pd.Series(fips)
+    if fips.dtype != STATE_DTYPE:
+        fips = to_fips(fips)
+    return fips.cat.codes.to_numpy(dtype=np.int64)
+
+
+def state_names(fips):
+    """
+    Looks up the lowercase names of FIPS codes.
+    :param fips: FIPS codes, e.g. from to_fips.
+    :type fips: pandas series | array-like
+    :return: Lowercase state names, with None where the FIPS code is missing.
+    :rtype: numpy array
+    """
+    index = state_index(fips)
+    names = np.array(NAMES + [None], dtype=object)
+    return names[index]
+
+
+def state_table():
+    """
+    Builds a table of every state keyed by FIPS code.
+    :return: One row per state with STATEFP, STATE (postal abbreviation) and STATE_NAME (lowercase name).
+    :rtype: pandas dataframe
+    """
+    return pd.DataFrame(
+        {
+            "STATEFP": pd.Categorical(FIPS, dtype=STATE_DTYPE),
+            "STATE": ABBREVIATIONS,
+            "STATE_NAME": NAMES,
+        }
+    )
@@ -0,0 +1,287 @@
+"""
+This script sweeps the hand-picked assumptions behind the published state calls and reports how each call and the
+electoral vote totals change. Swept assumptions are:
+
+- turnout multipliers by sex, race and age (the notebook's SEX_TURNOUT, RACE_TURNOUT and AGE_TURNOUT), and state
+  turnout from 2016 or 2020,
+- the divisors used to replace machine learning predictions of exactly 0 or 1 with a scaled MRP estimate,
+- the weight given to MRP estimates when blending them with machine learning predictions.
+
+The post-stratification table and cell estimates are encoded once as flat numeric arrays and placed in shared memory.
+Combinations of assumptions are split into chunks and evaluated by a process pool whose workers read the arrays in
+place, so the arrays are never pickled per task.
+
+The 0.5-2 weight clamp in models/mrp_model.Rmd enters the Stan model as a covariate, so changing it requires refitting
+the MRP model. Its effect can be swept by passing cell estimates from refits as separate runs.
+"""
+
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import helper as utl
+import post_strat as ps
+
+# Swept assumptions and their values in the published models
+BASELINE = {
+    "sex_turnout": ps.SEX_TURNOUT,
+    "race_turnout": None,
+    "age_turnout": None,
+    "state_turnout": None,
+    "zero_divisor": 10,
+    "one_divisor": 4,
+    "mrp_weight": 1.0,
+}
+
+# Workers attach to the shared arrays once, in the pool initializer
+_shared = {}
+
+
+def encode_inputs(strat, estimates, mrp_col="mrp_subgroup_estimate", ml_col=None):
+    """
+    Encodes the post-stratification table and cell estimates as flat arrays aligned by row.
+    :param strat: Post-stratification table from post_strat.build_strat_table.
+    :type strat: pandas dataframe
+    :param estimates: Cell estimates keyed by post_strat.CELL_COLS.
+    :type estimates: pandas dataframe
+    :param mrp_col: Column with MRP estimates (default: mrp_subgroup_estimate).
+    :type mrp_col: str
+    :param ml_col: Optional column with raw machine learning predictions (default: None).
+    :type ml_col: str | None
+    :return: Arrays keyed by name, and state names and electoral votes in state index order.
+    :rtype: tuple
+    """
+    cols = ps.CELL_COLS + [mrp_col] + ([ml_col] if ml_col else [])
+    cells = pd.merge(strat, estimates[cols], on=ps.CELL_COLS, how="inner")
+    state_idx, state_names = pd.factorize(cells["STATE_NAME"], sort=True)
+    e_votes = cells.groupby("STATE_NAME")["e_votes"].first().reindex(state_names)
+    mrp = cells[mrp_col].to_numpy(dtype=np.float64)
+    arrays = {
+        "perwt": cells["PERWT"].to_numpy(dtype=np.float64),
+        "male": cells["male"].to_numpy(dtype=np.int64),
+        "race": cells["race_recoded"].to_numpy(dtype=np.int64),
+        "age": cells["age_recoded"].to_numpy(dtype=np.int64),
+        "state": state_idx.astype(np.int64),
+        "turnout_2016": cells["2016_turnout"].to_numpy(dtype=np.float64) / 100,
+        "turnout_2020": cells["2020_turnout"].to_numpy(dtype=np.float64) / 100,
+        "mrp": mrp,
+        "ml": cells[ml_col].to_numpy(dtype=np.float64) if ml_col else mrp.copy(),
+        "e_votes": e_votes.to_numpy(dtype=np.float64),
+    }
+    return arrays, list(state_names)
+
+
+def init_worker(block_name, layout):
+    """
+    Attaches a pool worker to the shared arrays.
+    :param block_name: Name of the shared memory block.
+    :type block_name: str
+    :param layout: Layout returned by helper.share_arrays.
+    :type layout: dict
+    :return: None.
+    :rtype: None.
+    """
+    _shared["block"], _shared["arrays"] = utl.attach_shared(block_name, layout)
+
+
+def lookup(codes, multipliers):
+    """
+    Maps integer codes to turnout multipliers, with 1 for codes that have no multiplier.
+    :param codes: Integer codes.
+    :type codes: numpy array
+    :param multipliers: Multiplier for each code, or None to leave turnout unchanged.
+    :type multipliers: dict | None
+    :return: Multiplier for each code.
+    :rtype: numpy array
+    """
+    if not multipliers:
+        return np.ones(len(codes))
+    table = np.ones(int(codes.max()) + 1)
+    for code, value in multipliers.items():
+        if int(code) < len(table):
+            table[int(code)] = value
+    return table[codes]
+
+
+def evaluate_combination(arrays, params):
+    """
+    Calls every state under one combination of assumptions.
+    :param arrays: Encoded inputs from encode_inputs.
+    :type arrays: dict
+    :param params: Values of the swept assumptions (see BASELINE).
+    :type params: dict
+    :return: Trump's share of the two-party vote in each state.
+    :rtype: numpy array
+    """
+    voters = arrays["perwt"] * lookup(arrays["male"], params["sex_turnout"])
+    voters = voters * lookup(arrays["race"], params["race_turnout"])
+    voters = voters * lookup(arrays["age"], params["age_turnout"])
+    if params["state_turnout"]:
+        voters = voters * arrays[f"turnout_{params['state_turnout']}"]
+
+    mrp = arrays["mrp"]
+    ml = np.where(np.isnan(arrays["ml"]), mrp, arrays["ml"])
+    ml = np.where(ml == 0, mrp / params["zero_divisor"], ml)
+    ml = np.where(ml == 1, 1 - mrp / params["one_divisor"], ml)
+    estimate = params["mrp_weight"] * mrp + (1 - params["mrp_weight"]) * ml
+
+    n_states = len(arrays["e_votes"])
+    trump = np.bincount(arrays["state"], weights=estimate * voters, minlength=n_states)
+    total = np.bincount(arrays["state"], weights=voters, minlength=n_states)
+    return np.divide(trump, total, out=np.full(n_states, 0.5), where=total > 0)
+
+
+def evaluate_chunk(combinations):
+    """
+    Evaluates a chunk of combinations in a pool worker.
+    :param combinations: Combinations of assumptions.
+    :type combinations: list of dicts
+    :return: Trump's two-party share, one row per combination and one column per state.
+    :rtype: numpy array
+    """
+    arrays = _shared["arrays"]
+    return np.vstack([evaluate_combination(arrays, params) for params in combinations])
+
+
+def expand_grid(grid):
+    """
+    Expands a grid of assumption values into every combination, filling unswept assumptions from BASELINE.
+    :param grid: List of values for each swept assumption.
+    :type grid: dict
+    :return: Combinations of assumptions.
+    :rtype: list of dicts
+    """
+    unknown = set(grid) - set(BASELINE)
+    if unknown:
+        raise ValueError(f"Unknown sweep assumptions: {sorted(unknown)}")
+    names = list(grid)
+    return [
+        {**BASELINE, **dict(zip(names, values))}
+        for values in itertools.product(*(grid[name] for name in names))
+    ]
+
+
+def run_sweep(arrays, state_names, grid, processes=None, chunk_size=250):
+    """
+    Evaluates every combination of a grid of assumptions and compares each against the baseline calls.
+    :param arrays: Encoded inputs from encode_inputs.
+    :type arrays: dict
+    :param state_names: State names in state index order, from encode_inputs.
+    :type state_names: list
+    :param grid: List of values for each swept assumption.
+    :type grid: dict
+    :param processes: Number of worker processes; 1 evaluates in this process (default: one per CPU).
+    :type processes: int | None
+    :param chunk_size: Number of combinations per task (default: 250).
+    :type chunk_size: int
+    :return: One row per combination with its assumptions, electoral votes and flipped states, and Trump's two-party
+        share per state and combination.
+    :rtype: tuple of pandas dataframes
+    """
+    combinations = expand_grid(grid)
+    chunks = [
+        combinations[i : i + chunk_size]
+        for i in range(0, len(combinations), chunk_size)
+    ]
+    block, layout = utl.share_arrays(arrays)
+    try:
+        if processes == 1:
+            init_worker(block.name, layout)
+            shares = [evaluate_chunk(chunk) for chunk in chunks]
+            _shared.clear()
+        else:
+            with ProcessPoolExecutor(
+                max_workers=processes,
+                initializer=init_worker,
+                initargs=(block.name, layout),
+            ) as pool:
+                shares = list(pool.map(evaluate_chunk, chunks))
+    finally:
+        block.close()
+        block.unlink()
+    shares = np.vstack(shares)
+
+    baseline = evaluate_combination(arrays, BASELINE) > 0.5
+    trump_win = shares > 0.5
+    e_votes = arrays["e_votes"]
+    flips = trump_win != baseline
+    results = pd.DataFrame(
+        [
+            {
+                name: json.dumps(value) if isinstance(value, dict) else value
+                for name, value in params.items()
+                if name in grid
+            }
+            for params in combinations
+        ]
+    )
+    results["trump_ev"] = (trump_win * e_votes).sum(axis=1).astype(int)
+    results["biden_ev"] = (~trump_win * e_votes).sum(axis=1).astype(int)
+    results["n_flips"] = flips.sum(axis=1)
+    results["flipped_states"] = [
+        ",".join(state_names[i] for i in np.flatnonzero(row)) for row in flips
+    ]
+    state_shares = pd.DataFrame(shares, columns=state_names)
+    return results, state_shares
+
+
+def state_fragility(state_shares):
+    """
+    Summarizes how often each state's call differs from its most common call across a sweep.
+    :param state_shares: Trump's two-party share per state and combination, from run_sweep.
+    :type state_shares: pandas dataframe
+    :return: One row per state with the share of Trump calls, the minimum and maximum two-party share and the flip rate.
+    :rtype: pandas dataframe
+    """
+    trump_rate = (state_shares > 0.5).mean()
+    return pd.DataFrame(
+        {
+            "trump_call_rate": trump_rate,
+            "min_trump_share": state_shares.min(),
+            "max_trump_share": state_shares.max(),
+            "flip_rate": np.minimum(trump_rate, 1 - trump_rate),
+        }
+    ).sort_values("flip_rate", ascending=False)
+
+
+def main():
+    """
+    Entry point for the script.
+    :return: None.
+    :rtype: None.
+    """
+    strat = ps.build_strat_table(
+        "../data/post_stratification_data_by_state.csv",
+        "../data/2020_ecollege_rep.csv",
+        "../data/turnout_by_state.csv",
+    )
+    estimates = ps.read_cells("../data/new_prop_scores_include_harvard_FINAL.csv")
+    arrays, state_names = encode_inputs(strat, estimates)
+
+    # Scale the notebook's multipliers up and down, one dimension at a time and jointly
+    scales = np.linspace(0.8, 1.2, 9)
+    grid = {
+        "sex_turnout": [
+            {1: ps.SEX_TURNOUT[1] * male, 0: ps.SEX_TURNOUT[0]} for male in scales
+        ],
+        "race_turnout": [None]
+        + [{**ps.RACE_TURNOUT, 2: ps.RACE_TURNOUT[2] * s} for s in scales],
+        "age_turnout": [None]
+        + [{**ps.AGE_TURNOUT, 1: ps.AGE_TURNOUT[1] * s} for s in scales],
+        "state_turnout": [None, "2016", "2020"],
+    }
+    results, state_shares = run_sweep(arrays, state_names, grid)
+    os.makedirs("../output", exist_ok=True)
+    results.to_csv("../output/sensitivity_sweep.csv", index=False)
+    fragility = state_fragility(state_shares)
+    fragility.to_csv("../output/state_fragility.csv")
+    print(f"Evaluated {len(results)} combinations")
+    print(fragility.head(10))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+A local stand-in for the Census Data API, used to test the fan-out in src/census_fanout.py without network access.
+
+The server answers GET /<year>/<dataset>?get=...&for=<level>:*&in=... with a header row and one row per child
+geography. Every state has COUNTIES_PER_STATE counties and every county TRACTS_PER_COUNTY tracts. A variable's value
+is derived from its name and the geography, so results can be checked exactly. Requests can be made to fail with 503
+before they succeed, or to fail permanently, to exercise retries and resumption.
+"""
+
+import threading
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from json import dumps
+from urllib.parse import parse_qs, urlparse
+
+STATES = ["01", "02", "04"]
+COUNTIES_PER_STATE = 3
+TRACTS_PER_COUNTY = 2
+
+
+def variable_value(variable, geography):
+    """
+    Returns the deterministic value the server reports for a variable in a geography.
+    :param variable: Census variable code.
+    :type variable: str
+    :param geography: Geography codes, e.g. {"state": "01", "county": "001"}.
+    :type geography: dict
+    :return: Value of the variable.
+    :rtype: int
+    """
+    key = f"{variable}|" + "|".join(f"{geo}={code}" for geo, code in geography.items())
+    return zlib.crc32(key.encode()) % 100_000
+
+
+def child_codes(level, parent):
+    """
+    Lists the codes of the child geographies of a parent.
+    :param level: Child geography level, "state", "county" or "tract".
+    :type level: str
+    :param parent: Parent geography codes.
+    :type parent: dict
+    :return: Child geography codes.
+    :rtype: list
+    """
+    if level == "state":
+        return STATES
+    if level == "county":
+        return [f"{i:03d}" for i in range(1, COUNTIES_PER_STATE + 1)]
+    return [f"{i:06d}" for i in range(100, 100 + TRACTS_PER_COUNTY)]
+
+
+class MockCensusServer:
+    """
+    Runs the mock API on a local port in a background thread.
+    :param fail_first: Number of 503 responses returned for each distinct data request before it succeeds.
+    :type fail_first: int
+    :param fail_states: States whose data requests always fail with 400.
+    :type fail_states: set
+    """
+
+    def __init__(self, fail_first=0, fail_states=()):
+        self.fail_first = fail_first
+        self.fail_states = set(fail_states)
+        self.requests = []
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.handler_class())
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def endpoint(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    def data_requests(self):
+        """
+        Lists the requests for variables other than NAME, i.e. chunk fetches rather than geography listings.
+        """
+        with self.lock:
+            return [query for query in self.requests if query["get"] != ["NAME"]]
+
+    def handler_class(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = {key: values[0] for key, values in parse_qs(url.query).items()}
+                variables = query["get"].split(",")
+                level = query["for"].split(":")[0]
+                parent = dict(
+                    part.split(":") for part in query.get("in", "").split() if part
+                )
+                with mock.lock:
+                    mock.requests.append({**query, "get": variables})
+                    attempts = sum(
+                        1
+                        for seen in mock.requests
+                        if seen["get"] == variables
+                        and seen["for"] == query["for"]
+                        and seen.get("in") == query.get("in")
+                    )
+                if variables != ["NAME"]:
+                    if parent.get("state") in mock.fail_states:
+                        return self.reply(400, {"error": "unknown geography"})
+                    if attempts <= mock.fail_first:
+                        return self.reply(503, {"error": "unavailable"})
+                rows = [variables + list(parent) + [level]]
+                for code in child_codes(level, parent):
+                    geography = {**parent, level: code}
+                    rows.append(
+                        [
+                            (
+                                f"{level} {code}"
+                                if var == "NAME"
+                                else str(variable_value(var, geography))
+                            )
+                            for var in variables
+                        ]
+                        + list(geography.values())
+                    )
+                self.reply(200, rows)
+
+            def reply(self, status, body):
+                payload = dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        return Handler
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
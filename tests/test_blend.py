@@ -0,0 +1,101 @@
+"""
+Tests that the blend tensors of src/blend.py reproduce the state predictions of src/post_strat.py.
+"""
+
+import os
+import sys
+import unittest
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+)
+
+import blend as bl  # noqa: E402
+import post_strat as ps  # noqa: E402
+import state_keys as sk  # noqa: E402
+
+
+def synthetic_strat(seed=17):
+    """Builds a post-stratification table over every state and demographic cell, with random ACS counts."""
+    rng = np.random.default_rng(seed)
+    states = sk.state_table()
+    grid = pd.MultiIndex.from_product(
+        [[1, 2, 3], [1, 2, 3, 4, 9], [0, 1], [1, 3], states["STATEFP"].astype(int)],
+        names=ps.CELL_COLS,
+    ).to_frame(index=False)
+    strat = pd.merge(
+        grid,
+        states.astype({"STATEFP": int}).rename(columns={"STATEFP": "STATEFIP"}),
+        on="STATEFIP",
+    )
+    strat["PERWT"] = rng.integers(50, 50_000, len(strat)).astype(float)
+    strat["e_votes"] = strat["STATEFIP"] % 20 + 3
+    return strat
+
+
+def synthetic_estimates(strat, seed):
+    """Draws a random Trump probability for every cell of the table."""
+    estimates = strat[ps.CELL_COLS].copy()
+    estimates["mrp_subgroup_estimate"] = np.random.default_rng(seed).uniform(
+        0.05, 0.95, len(estimates)
+    )
+    return estimates
+
+
+class BlendTest(unittest.TestCase):
+    def setUp(self):
+        self.strat = synthetic_strat()
+        self.sources = {
+            name: synthetic_estimates(self.strat, seed)
+            for seed, name in enumerate(["mrp_a", "mrp_b", "mrp_c"])
+        }
+        self.cells = bl.align_estimates(self.strat, self.sources)
+
+    def test_single_source_matches_predict_states(self):
+        for turnout in ("sex", "age", "none"):
+            trump, total, _ = bl.aggregate(self.cells, ["mrp_a"], turnout=turnout)
+            blended = bl.state_outputs(trump, total, np.ones(1))
+            expected = ps.predict_states(
+                self.strat, self.sources["mrp_a"], "mrp_subgroup_estimate", turnout
+            )
+            merged = pd.merge(
+                blended, expected, on="STATEFIP", suffixes=("", "_expected")
+            )
+            self.assertEqual(len(merged), len(sk.STATES))
+            # Votes are summed in a different order, so they may differ in the last bits
+            for col in ["trump_votes_states", "biden_votes_states"]:
+                np.testing.assert_allclose(
+                    merged[col], merged[f"{col}_expected"], rtol=4e-15
+                )
+            np.testing.assert_allclose(
+                merged["margin_trump"], merged["margin_trump_expected"], atol=1e-15
+            )
+            np.testing.assert_array_equal(
+                merged["state_pred"], merged["state_pred_expected"]
+            )
+
+    def test_shared_group_weights_match_global_blend(self):
+        source_cols = list(self.sources)
+        weights = bl.random_candidates(len(source_cols), 50)[:, 0]
+        trump, total, _ = bl.aggregate(self.cells, source_cols)
+        expected = bl.blend_shares(trump, total, weights)
+        grouped, grouped_total, levels = bl.aggregate(
+            self.cells, source_cols, group_col="age_recoded"
+        )
+        self.assertEqual(levels, [1, 2, 3])
+        np.testing.assert_allclose(grouped_total, total, rtol=1e-15)
+        # The same weights, passed once for all groups and repeated for each group
+        shared = np.repeat(weights[:, None], len(levels), axis=1)
+        for candidate_weights in (weights, shared):
+            np.testing.assert_allclose(
+                bl.blend_shares(grouped, grouped_total, candidate_weights),
+                expected,
+                rtol=1e-14,
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+"""
+Tests the resumable Census fan-out against the local mock API in mock_census.py.
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import unittest
+
+SRC_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"
+)
+sys.path.insert(0, SRC_DIR)
+
+import census_fanout as cf  # noqa: E402
+import mock_census as mc  # noqa: E402
+
+# More variables than fit in one request, so every parent is fetched in two batches
+VARIABLES = [f"B01001_{i:03d}E" for i in range(1, 61)]
+
+
+def run_fan_out(server, out_dir, **kwargs):
+    return asyncio.run(
+        cf.fan_out(
+            "2020",
+            "acs/acs5",
+            VARIABLES,
+            out_dir,
+            api_key=None,
+            endpoint=server.endpoint,
+            max_per_second=0,
+            **kwargs,
+        )
+    )
+
+
+class FanOutTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.out_dir = self.tmp.name
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_retries_unavailable_responses(self):
+        with mc.MockCensusServer(fail_first=1) as server:
+            summary = run_fan_out(server, self.out_dir, states=["01", "02"])
+        self.assertEqual(
+            summary, {"planned": 4, "skipped": 0, "fetched": 4, "failed": 0}
+        )
+        # Every chunk was refused once and then fetched
+        self.assertEqual(len(server.data_requests()), 8)
+
+    def test_resume_skips_finished_chunks(self):
+        with mc.MockCensusServer(fail_states={"02"}) as server:
+            first = run_fan_out(server, self.out_dir, states=["01", "02"])
+        self.assertEqual(first["fetched"], 2)
+        self.assertEqual(first["failed"], 2)
+
+        with mc.MockCensusServer() as server:
+            second = run_fan_out(server, self.out_dir, states=["01", "02"])
+            fetched_states = {query["in"] for query in server.data_requests()}
+        self.assertEqual(
+            second, {"planned": 4, "skipped": 2, "fetched": 2, "failed": 0}
+        )
+        self.assertEqual(fetched_states, {"state:02"})
+
+        with mc.MockCensusServer() as server:
+            third = run_fan_out(server, self.out_dir, states=["01", "02"])
+            self.assertEqual(server.data_requests(), [])
+        self.assertEqual(third["skipped"], 4)
+
+    def test_load_fan_out_combines_batches(self):
+        with mc.MockCensusServer() as server:
+            run_fan_out(server, self.out_dir, level="tract")
+        combined = cf.load_fan_out(self.out_dir)
+
+        n_tracts = len(mc.STATES) * mc.COUNTIES_PER_STATE * mc.TRACTS_PER_COUNTY
+        self.assertEqual(len(combined), n_tracts)
+        self.assertEqual(
+            set(combined.columns), set(VARIABLES) | {"state", "county", "tract"}
+        )
+        self.assertFalse(combined[VARIABLES].isna().any().any())
+        row = combined.sort_values(["state", "county", "tract"]).iloc[-1]
+        geography = {
+            "state": row["state"],
+            "county": row["county"],
+            "tract": row["tract"],
+        }
+        for var in (VARIABLES[0], VARIABLES[-1]):
+            self.assertEqual(row[var], mc.variable_value(var, geography))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+"""
+Tests that the command line entry point stays fast to start: help and argument parsing must not import the heavy
+libraries that the pipeline commands load when they run.
+"""
+
+import os
+import subprocess
+import sys
+import time
+import unittest
+
+CLI_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "cli.py"
+)
+
+# Modules that only a running command may import
+HEAVY_MODULES = {"pandas", "numpy", "geopandas", "matplotlib", "sklearn", "requests"}
+
+# Total time spent importing modules, as reported by -X importtime, in microseconds
+IMPORT_BUDGET_US = 150_000
+
+# Wall-clock time for the whole process, including interpreter startup, in seconds
+WALL_BUDGET_S = 1.0
+
+
+def run_cli(*args):
+    """
+    Runs the CLI with import timing and returns the modules it imported, their total import time and the wall time.
+    """
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", CLI_PATH, *args],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    wall = time.perf_counter() - start
+    modules, total_us = set(), 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:") :].split("|")
+        modules.add(name.strip().split(".")[0])
+        total_us += int(self_us)
+    return modules, total_us, wall
+
+
+class StartupTest(unittest.TestCase):
+    def check_startup(self, *args):
+        modules, total_us, wall = run_cli(*args)
+        self.assertFalse(
+            modules & HEAVY_MODULES, f"{args} imported {modules & HEAVY_MODULES}"
+        )
+        self.assertLess(total_us, IMPORT_BUDGET_US)
+        self.assertLess(wall, WALL_BUDGET_S)
+
+    def test_help(self):
+        self.check_startup("--help")
+
+    def test_subcommand_help(self):
+        for command in [
+            "fetch-census",
+            "clean-reuters",
+            "clean-comet",
+            "render-maps",
+            "evaluate",
+        ]:
+            with self.subTest(command=command):
+                self.check_startup(command, "--help")
+
+
+if __name__ == "__main__":
+    unittest.main()
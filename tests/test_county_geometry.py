@@ -0,0 +1,168 @@
+"""
+Tests that the county topologies of src/county_geometry.py decode to a valid tessellation at every zoom level.
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import geopandas as gpd
+import numpy as np
+import shapely
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+)
+
+import county_geometry as cg  # noqa: E402
+
+# Side of the synthetic map, in projection units (meters), about the size of a large state
+SIDE = 800_000
+
+
+def synthetic_counties(n_cells=400, seed=21):
+    """
+    Builds a Voronoi tessellation of a square into counties, with an enclave cut out of one county and one county made
+    of two cells that do not touch.
+    """
+    rng = np.random.default_rng(seed)
+    box = shapely.box(0, 0, SIDE, SIDE)
+    seeds = shapely.multipoints(rng.uniform(0, SIDE, (n_cells, 2)))
+    cells = shapely.get_parts(shapely.voronoi_polygons(seeds, extend_to=box))
+    cells = [cell for cell in shapely.intersection(cells, box) if not cell.is_empty]
+    # Round to whole meters so the cells share their vertices exactly, as counties in a projected shapefile do
+    cells = [shapely.set_precision(cell, 1.0) for cell in cells]
+
+    geoids = [f"{i:05d}" for i in range(len(cells))]
+
+    # The county nearest the center gets an enclave around its center point
+    center = shapely.Point(SIDE / 2, SIDE / 2)
+    host = int(np.argmin(shapely.distance(np.array(cells), center)))
+    enclave = shapely.set_precision(cells[host].centroid.buffer(3_000, 4), 1.0)
+    cells[host] = cells[host].difference(enclave)
+    cells.append(enclave)
+    geoids[host] = "host"
+    geoids.append("enclave")
+
+    # Two cells in opposite corners form one county
+    first = int(np.argmin(shapely.distance(np.array(cells), shapely.Point(0, 0))))
+    last = int(np.argmin(shapely.distance(np.array(cells), shapely.Point(SIDE, SIDE))))
+    cells[first] = shapely.MultiPolygon([cells[first], cells[last]])
+    geoids[first] = "pair"
+    del cells[last], geoids[last]
+
+    geometry = gpd.GeoSeries(cells, crs=cg.CRS)
+    return gpd.GeoDataFrame(
+        {
+            "GEOID": geoids,
+            "NAME": [f"County {i}" for i in range(len(cells))],
+            # Two states split down the middle of the map
+            "STATEFP": np.where(geometry.centroid.x < SIDE / 2, "01", "02"),
+        },
+        geometry=geometry,
+    )
+
+
+def decode_arcs(topology):
+    """Undoes the delta encoding of a topology's arcs."""
+    return [np.cumsum(np.array(arc), axis=0) for arc in topology["arcs"]]
+
+
+def decode_ring(arcs, refs):
+    """Joins the arcs of a ring, dropping the point each arc shares with the previous one."""
+    points = []
+    for ref in refs:
+        arc = arcs[ref] if ref >= 0 else arcs[~ref][::-1]
+        points.extend(arc[1:] if points else arc)
+    return points
+
+
+def decode_geometry(arcs, geometry):
+    """Rebuilds the polygons of one county from its arc references."""
+    polygons = [geometry["arcs"]] if geometry["type"] == "Polygon" else geometry["arcs"]
+    return shapely.MultiPolygon(
+        [
+            shapely.Polygon(
+                decode_ring(arcs, rings[0]),
+                [decode_ring(arcs, ring) for ring in rings[1:]],
+            )
+            for rings in polygons
+        ]
+    )
+
+
+class CountyTopologyTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.counties = synthetic_counties()
+        cls.output_dir = tempfile.mkdtemp()
+        cls.paths = cg.build_county_topology(cls.counties, cls.output_dir)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.output_dir)
+
+    def test_counties_tile_the_map_at_every_zoom(self):
+        self.assertEqual(len(self.paths), len(cg.ZOOM_WIDTHS))
+        for width, path in zip(cg.ZOOM_WIDTHS, self.paths):
+            with self.subTest(width=width):
+                with open(path, encoding="utf-8") as file_obj:
+                    topology = json.load(file_obj)
+                arcs = decode_arcs(topology)
+                geometries = topology["objects"]["counties"]["geometries"]
+                self.assertEqual(
+                    [geometry["id"] for geometry in geometries],
+                    list(self.counties["GEOID"]),
+                )
+                polygons = np.array(
+                    [decode_geometry(arcs, geometry) for geometry in geometries]
+                )
+
+                invalid = np.flatnonzero(~shapely.is_valid(polygons))
+                self.assertEqual(
+                    len(invalid),
+                    0,
+                    [shapely.is_valid_reason(polygons[i]) for i in invalid[:5]],
+                )
+                # No overlaps: the counties' areas add up to the area of their union
+                union = shapely.union_all(polygons)
+                self.assertAlmostEqual(
+                    shapely.area(polygons).sum(), union.area, delta=1e-6
+                )
+                # No gaps: the union is the whole map, without holes
+                self.assertEqual(union.geom_type, "Polygon")
+                self.assertEqual(len(union.interiors), 0)
+                x0, y0, x1, y1 = topology["bbox"]
+                self.assertEqual(union.area, union.envelope.area)
+                self.assertLessEqual(abs(union.bounds[2] - x1), 1)
+                self.assertLessEqual(abs(union.bounds[3] - y1), 1)
+
+    def test_enclave_and_multipolygon_are_kept(self):
+        with open(self.paths[-1], encoding="utf-8") as file_obj:
+            geometries = json.load(file_obj)["objects"]["counties"]["geometries"]
+        by_id = {geometry["id"]: geometry for geometry in geometries}
+        self.assertEqual(
+            [
+                geometry["id"]
+                for geometry in geometries
+                if geometry["type"] != "Polygon"
+            ],
+            ["pair"],
+        )
+        self.assertEqual(len(by_id["pair"]["arcs"]), 2)
+        # The enclave is one closed arc, stored once and used again as the hole of its host
+        host_rings = by_id["host"]["arcs"]
+        enclave_rings = by_id["enclave"]["arcs"]
+        self.assertEqual(len(host_rings), 2)
+        self.assertEqual(len(enclave_rings), 1)
+        self.assertEqual(len(enclave_rings[0]), 1)
+        self.assertEqual(len(host_rings[1]), 1)
+        arc = enclave_rings[0][0]
+        self.assertIn(host_rings[1][0], [arc, ~arc])
+
+
+if __name__ == "__main__":
+    unittest.main()
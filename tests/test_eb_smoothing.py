@@ -0,0 +1,94 @@
+"""
+Tests the empirical-Bayes cell smoothing of src/eb_smoothing.py on simulated beta-binomial cells.
+"""
+
+import os
+import sys
+import unittest
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+)
+
+import eb_smoothing as eb  # noqa: E402
+
+
+def simulate_cells(kappa, cells=4_000, respondents=40, seed=7):
+    """Draws cell shares around known priors from a beta distribution, then binomial votes from each share."""
+    rng = np.random.default_rng(seed)
+    prior = rng.uniform(0.2, 0.8, cells)
+    share = rng.beta(kappa * prior, kappa * (1 - prior))
+    n = rng.integers(1, 2 * respondents, cells).astype(float)
+    return rng.binomial(n.astype(int), share).astype(float), n, prior
+
+
+class FitKappaTest(unittest.TestCase):
+    def test_recovers_rho(self):
+        for kappa in (5.0, 20.0, 100.0):
+            votes, respondents, prior = simulate_cells(kappa)
+            rho = 1 / (eb.fit_kappa(votes, respondents, prior) + 1)
+            self.assertAlmostEqual(rho, 1 / (kappa + 1), delta=0.2 / (kappa + 1))
+
+    def test_no_overdispersion_pools_strongly(self):
+        # Binomial votes straight from the prior leave little beyond sampling noise for the cells to explain
+        rng = np.random.default_rng(11)
+        prior = np.full(4_000, 0.5)
+        respondents = np.full(4_000, 40.0)
+        votes = rng.binomial(40, prior).astype(float)
+        kappa = eb.fit_kappa(votes, respondents, prior)
+        self.assertGreater(kappa, 200)
+
+
+class ShrinkTest(unittest.TestCase):
+    def test_empty_cells_return_prior(self):
+        prior = np.array([0.1, 0.45, 0.9])
+        empty = np.zeros(3)
+        mean, se = eb.shrink(empty, empty, prior, 12.0)
+        np.testing.assert_allclose(mean, prior)
+        np.testing.assert_allclose(se, np.sqrt(prior * (1 - prior) / 13.0))
+
+    def test_large_cells_keep_raw_share(self):
+        mean, _ = eb.shrink(
+            np.array([7_000.0]), np.array([10_000.0]), np.array([0.5]), 10.0
+        )
+        self.assertAlmostEqual(mean[0], 0.7, places=3)
+
+
+class SmoothCellsTest(unittest.TestCase):
+    def setUp(self):
+        grid = pd.MultiIndex.from_product(
+            [[1, 2, 3], [1, 2], [True, False], [1, 3], [6, 36, 48]], names=eb.CELL_DIMS
+        )
+        self.strat = grid.to_frame(index=False)
+        rng = np.random.default_rng(5)
+        self.poll = self.strat.sample(500, replace=True, random_state=5).reset_index(
+            drop=True
+        )
+        self.poll["vote_choice_recoded"] = rng.integers(0, 2, len(self.poll))
+
+    def test_every_cell_gets_an_estimate(self):
+        cells, diagnostics = eb.smooth_cells(
+            self.poll, "vote_choice_recoded", self.strat
+        )
+        self.assertEqual(len(cells), len(self.strat))
+        self.assertEqual(diagnostics["dropped_rows"], 0)
+        self.assertFalse(cells["eb_subgroup_estimate"].isna().any())
+
+    def test_raises_when_poll_misses_the_cells(self):
+        poll = self.poll.copy()
+        poll["STATEFIP"] = 99
+        with self.assertRaises(ValueError):
+            eb.smooth_cells(poll, "vote_choice_recoded", self.strat)
+
+    def test_raises_without_outcomes(self):
+        poll = self.poll.copy()
+        poll["vote_choice_recoded"] = np.nan
+        with self.assertRaises(ValueError):
+            eb.smooth_cells(poll, "vote_choice_recoded", self.strat)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+"""
+Tests backfilling the prediction history from existing CSVs and addressing runs by position.
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC_DIR = os.path.join(REPO_DIR, "src")
+sys.path.insert(0, SRC_DIR)
+
+import history_store as hs  # noqa: E402
+
+PATTERN = os.path.join(REPO_DIR, "data", "final_pred_elec_*2020*.csv")
+
+
+class BackfillTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store_dir = self.tmp.name
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_backfill_skips_runs_already_in_history(self):
+        first = hs.backfill(PATTERN, store_dir=self.store_dir)
+        self.assertEqual(
+            {entry["run_id"] for entry in first},
+            {
+                "backfill-final_pred_elec_2020_MRP",
+                "backfill-final_pred_elec_ML_2020",
+            },
+        )
+        self.assertEqual(hs.backfill(PATTERN, store_dir=self.store_dir), [])
+        self.assertEqual(len(hs.read_index(self.store_dir)), 2)
+
+    def test_since_accepts_index_position(self):
+        hs.backfill(PATTERN, store_dir=self.store_dir)
+        result = subprocess.run(
+            [
+                sys.executable,
+                "history_store.py",
+                "--store",
+                self.store_dir,
+                "--since",
+                "-2",
+            ],
+            cwd=SRC_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        self.assertIn("'flipped':", result.stdout)
+        self.assertEqual(hs.parse_run("-2"), -2)
+        self.assertEqual(
+            hs.parse_run("backfill-final_pred_elec_ML"), "backfill-final_pred_elec_ML"
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+"""
+Tests that the ingest service recognizes Monmouth archives and keeps running when a worker process dies.
+"""
+
+import os
+import sys
+import tempfile
+import time
+import unittest
+import zipfile
+from unittest import mock
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_DIR, "src"))
+
+import ingest_daemon as ind  # noqa: E402
+
+MONMOUTH_FILES = [
+    "national_march_2020/MUP213_NATL_archive.tab",
+    "national_june_2020/MUP218_NATL_archive_full.tab",
+    "national_aug_2020/MUP222_NATL_archive_full.tab",
+]
+
+
+def crash_first_job(job, ingest_dir, shared):
+    """Stands in for run_job: the worker running job 1 dies, other jobs finish."""
+    if job["id"] == 1:
+        os._exit(1)
+    return {"run": f"test/{job['id']}"}
+
+
+class DetectSourceTest(unittest.TestCase):
+    def test_detects_monmouth_waves(self):
+        for name in MONMOUTH_FILES:
+            with self.subTest(name=name):
+                filepath = os.path.join(REPO_DIR, "data", name)
+                self.assertEqual(ind.detect_source(filepath), "monmouth")
+
+    def test_detects_zipped_monmouth_wave(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            filepath = os.path.join(tmp, "poll.zip")
+            with zipfile.ZipFile(filepath, "w") as archive:
+                archive.write(
+                    os.path.join(REPO_DIR, "data", MONMOUTH_FILES[0]), "poll.tab"
+                )
+            self.assertEqual(ind.detect_source(filepath), "monmouth")
+
+
+class ServeTest(unittest.TestCase):
+    def test_restarts_pool_after_worker_dies(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            drop_dir, ingest_dir = os.path.join(tmp, "drop"), os.path.join(
+                tmp, "ingest"
+            )
+            conn = ind.connect(ingest_dir)
+            for job_id in (1, 2):
+                conn.execute(
+                    "INSERT INTO jobs (name, path, sha256, source, state, created, updated) "
+                    "VALUES (?, ?, ?, 'monmouth', 'queued', ?, ?)",
+                    (f"poll{job_id}.tab", "", str(job_id), time.time(), time.time()),
+                )
+            with mock.patch.object(ind, "run_job", crash_first_job):
+                ind.serve(drop_dir, ingest_dir, workers=1, poll_interval=0.1, once=True)
+            jobs = {row["id"]: dict(row) for row in conn.execute("SELECT * FROM jobs")}
+            conn.close()
+        self.assertEqual(jobs[1]["state"], "queued")
+        self.assertIn("BrokenProcessPool", jobs[1]["error"])
+        self.assertEqual(jobs[2]["state"], "done")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+"""
+Tests the streaming column summaries of src/profiler.py on synthetic poll files.
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+)
+
+import profiler as pf  # noqa: E402
+
+ROWS = 5_000
+
+
+class ProfileFileTest(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        self.data = pd.DataFrame(
+            {
+                # Fewer distinct values than the summary has counters
+                "state": rng.integers(1, pf.TOPK_CAPACITY, ROWS),
+                # Every value unique, like a respondent ID
+                "respid": np.arange(ROWS),
+                # One frequent value among unique ones
+                "mixed": np.where(np.arange(ROWS) % 2 == 0, -1, np.arange(ROWS)),
+                # Every third answer missing
+                "skipped": np.where(np.arange(ROWS) % 3 == 0, np.nan, 1.0),
+            }
+        )
+        handle, self.path = tempfile.mkstemp(suffix=".csv")
+        os.close(handle)
+        self.data.to_csv(self.path, index=False)
+        self.report = pf.profile_file(self.path, chunk_rows=700)["columns"]
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_counts_are_exact_below_capacity(self):
+        report = self.report["state"]
+        expected = self.data["state"].astype(str).value_counts()
+        self.assertEqual(report["distinct"], len(expected))
+        self.assertTrue(report["top_exact"])
+        # Ties may be broken either way, so compare counts rather than which values are listed
+        for value, count in report["top"]:
+            self.assertEqual(count, expected[value])
+        self.assertEqual(
+            [count for _, count in report["top"]], list(expected.iloc[: pf.TOP_K])
+        )
+
+    def test_pruned_above_capacity(self):
+        report = self.report["respid"]
+        self.assertFalse(report["top_exact"])
+        self.assertNotIn("distinct", report)
+        self.assertIn("distinct_approx", report)
+        # No value is frequent, so no counter survives and no top values are reported
+        self.assertNotIn("top", report)
+
+    def test_frequent_value_survives_pruning(self):
+        report = self.report["mixed"]
+        self.assertFalse(report["top_exact"])
+        value, count = report["top"][0]
+        self.assertEqual(value, "-1")
+        # Misra-Gries counts are lower bounds
+        self.assertLessEqual(count, ROWS // 2)
+        self.assertGreater(count, ROWS // 2 - ROWS // (pf.TOPK_CAPACITY + 1))
+
+    def test_null_counts(self):
+        report = self.report["skipped"]
+        nulls = int(self.data["skipped"].isna().sum())
+        self.assertEqual(report["rows"], ROWS)
+        self.assertEqual(report["nulls"], nulls)
+        self.assertEqual(report["null_share"], round(nulls / ROWS, 5))
+        self.assertEqual(report["numeric"], ROWS - nulls)
+        self.assertEqual(report["top"], [["1.0", ROWS - nulls]])
+
+
+class HyperLogLogTest(unittest.TestCase):
+    def test_high_cardinality_error(self):
+        profile = pf.new_column_profile()
+        distinct = 200_000
+        values = pd.Series(np.arange(distinct)).astype(str)
+        for start in range(0, distinct, 50_000):
+            pf.update_profile(profile, values[start : start + 50_000])
+        report = pf.finalize_profile(profile)
+        # About 1.6% standard error, so 5% is more than three standard errors
+        self.assertAlmostEqual(report["distinct_approx"] / distinct, 1, delta=0.05)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+"""
+Tests the histogram-based CRPS and prediction intervals of src/scoring.py against closed forms for normal margins.
+"""
+
+import math
+import os
+import sys
+import unittest
+from statistics import NormalDist
+
+import numpy as np
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+)
+
+import scoring as sc  # noqa: E402
+
+MEANS = np.array([-0.3, -0.05, 0.0, 0.12, 0.4])
+SDS = np.array([0.05, 0.1, 0.02, 0.2, 0.08])
+
+
+def normal_accumulator(means, sds):
+    """
+    Builds an accumulator whose histograms hold the exact normal probability of each bin, with the tails in the end
+    bins as update puts them, so the only error left is the binning.
+    """
+    acc = sc.new_accumulator(len(means))
+    cdf = np.array(
+        [
+            [NormalDist(m, s).cdf(edge) for edge in acc["edges"]]
+            for m, s in zip(means, sds)
+        ]
+    )
+    acc["hist"] = np.diff(cdf, axis=1)
+    acc["hist"][:, 0] += cdf[:, 0]
+    acc["hist"][:, -1] += 1 - cdf[:, -1]
+    acc["n"] = 1
+    return acc
+
+
+def normal_crps(mean, sd, actual):
+    """Closed-form CRPS of a normal distribution."""
+    z = (actual - mean) / sd
+    pdf = math.exp(-z * z / 2) / math.sqrt(2 * math.pi)
+    cdf = NormalDist().cdf(z)
+    return sd * (z * (2 * cdf - 1) + 2 * pdf - 1 / math.sqrt(math.pi))
+
+
+class HistogramTest(unittest.TestCase):
+    def setUp(self):
+        self.acc = normal_accumulator(MEANS, SDS)
+        self.bin_width = np.diff(self.acc["edges"])[0]
+
+    def test_crps_matches_normal(self):
+        for actual in (-0.2, 0.0, 0.15):
+            actual_margin = np.full(len(MEANS), actual)
+            expected = [normal_crps(m, s, actual) for m, s in zip(MEANS, SDS)]
+            np.testing.assert_allclose(
+                sc.histogram_crps(self.acc, actual_margin),
+                expected,
+                atol=self.bin_width,
+            )
+
+    def test_interval_bounds_match_normal_quantiles(self):
+        for level in sc.INTERVALS:
+            lower, upper = sc.interval_bounds(self.acc, level)
+            for i, (m, s) in enumerate(zip(MEANS, SDS)):
+                dist = NormalDist(m, s)
+                self.assertAlmostEqual(
+                    lower[i], dist.inv_cdf((1 - level) / 2), delta=self.bin_width
+                )
+                self.assertAlmostEqual(
+                    upper[i], dist.inv_cdf((1 + level) / 2), delta=self.bin_width
+                )
+
+    def test_streamed_draws_fill_the_same_histogram(self):
+        acc = sc.new_accumulator(len(MEANS))
+        for chunk in sc.simulate_draws(MEANS, SDS, 25_000, chunk_rows=7_000):
+            sc.update(acc, chunk)
+        draws = np.vstack(list(sc.simulate_draws(MEANS, SDS, 25_000, chunk_rows=7_000)))
+        self.assertEqual(acc["n"], 25_000)
+        for i in range(len(MEANS)):
+            expected, _ = np.histogram(draws[:, i], bins=acc["edges"])
+            np.testing.assert_array_equal(acc["hist"][i], expected)
+        np.testing.assert_array_equal(acc["trump_wins"], (draws < 0).sum(axis=0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+"""
+Tests the minifiers and compressors the website's static files storage applies when collectstatic runs.
+"""
+
+import gzip
+import os
+import sys
+import unittest
+
+import brotli
+
+SITE_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "website_699"
+)
+sys.path.insert(0, SITE_DIR)
+
+from ppredict import storage  # noqa: E402
+
+
+class MinifySvgTest(unittest.TestCase):
+    def test_drops_whitespace_between_tags(self):
+        svg = '<svg>\n  <!-- a comment -->\n  <g>\n    <path d="M0 0  L1 1"/>\n  </g>\n</svg>\n'
+        self.assertEqual(
+            storage.minify_svg(svg), '<svg><g><path d="M0 0 L1 1"/></g></svg>'
+        )
+
+    def test_keeps_spaces_between_text_children(self):
+        svg = (
+            "<svg>\n  <text x='0'>\n    <tspan>Vote</tspan> <tspan>share</tspan>\n"
+            "  </text>\n  <title>Biden   lead</title>\n</svg>"
+        )
+        self.assertEqual(
+            storage.minify_svg(svg),
+            "<svg><text x='0'> <tspan>Vote</tspan> <tspan>share</tspan> </text>"
+            "<title>Biden lead</title></svg>",
+        )
+
+    def test_keeps_style_content(self):
+        svg = '<svg>\n<style>\n  .a::after { content: "x  y"; }\n</style>\n</svg>'
+        self.assertEqual(
+            storage.minify_svg(svg),
+            '<svg><style>\n  .a::after { content: "x  y"; }\n</style></svg>',
+        )
+
+
+class MinifyCssTest(unittest.TestCase):
+    def test_drops_comments_and_whitespace(self):
+        css = "/* header */\nh1 ,  h2 {\n  color: red;\n  margin: 0 auto;\n}\n"
+        self.assertEqual(storage.minify_css(css), "h1,h2{color:red;margin:0 auto}")
+
+    def test_keeps_quoted_strings(self):
+        css = ".note::before {\n  content: \"a: b ;  {c}\";\n  font-family: 'Open  Sans', serif;\n}"
+        self.assertEqual(
+            storage.minify_css(css),
+            ".note::before{content:\"a: b ;  {c}\";font-family:'Open  Sans',serif}",
+        )
+
+    def test_keeps_comment_markers_in_strings(self):
+        css = 'a { content: "/* not a comment */"; }'
+        self.assertEqual(storage.minify_css(css), 'a{content:"/* not a comment */"}')
+
+
+class CompressorsTest(unittest.TestCase):
+    def test_writes_gzip_and_brotli(self):
+        data = b"body{margin:0}" * 100
+        available = storage.compressors()
+        self.assertEqual(set(available), {".gz", ".br"})
+        self.assertEqual(gzip.decompress(available[".gz"](data)), data)
+        self.assertEqual(brotli.decompress(available[".br"](data)), data)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class PpredictConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'ppredict'
+
+    def ready(self):
+        # Load model comparison data once per worker so requests are served from memory
+        from . import results_cache
+
+        results_cache.warm()
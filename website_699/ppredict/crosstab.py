@@ -0,0 +1,80 @@
+"""
+Demographic breakdowns of the cleaned polls, answered from the precomputed crosstab cube (see src/crosstab_cube.py).
+
+The cube is loaded once per worker and reloaded when the .npz file changes. A breakdown sums the cube over every
+dimension that is not requested, so no respondent-level data is touched per request. The summing is done by
+sum_cube in cube.py, the same code the script's query uses, so the site and the script cannot disagree.
+"""
+
+import threading
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+from . import cube as poll_cube
+from .results_cache import data_dir
+
+# Breakdowns with fewer respondents than this are flagged so charts can grey them out
+MIN_RESPONDENTS = 30
+
+_cube = {}
+_lock = threading.Lock()
+
+
+def cube_path():
+    return Path(getattr(settings, "PPREDICT_CUBE_PATH", data_dir() / "poll_cube.npz"))
+
+
+def load_cube():
+    """Returns the cached cube, reloading it if the file changed."""
+    path = cube_path()
+    mtime = path.stat().st_mtime_ns
+    if _cube.get("mtime") == mtime:
+        return _cube
+    with _lock:
+        if _cube.get("mtime") != mtime:
+            _cube.update(poll_cube.load_cube(path), mtime=mtime)
+        return _cube
+
+
+def parse_level(dim_levels, value):
+    """Matches a query string value to a cube level, which may be an integer code or a label."""
+    for level in dim_levels:
+        if level is not None and str(level) == value:
+            return level
+    raise ValueError(f"Unknown level: {value}")
+
+
+def breakdown(by, filters=None, share_of=None):
+    """
+    Sums the cube into one row per combination of the levels of the by dimensions.
+
+    filters maps dimensions to lists of query string values to keep. When share_of is one of the by dimensions, each
+    row also gets its weighted share within the group formed by the other by dimensions.
+    """
+    cube = load_cube()
+    levels = cube["levels"]
+    if share_of is not None and share_of not in by:
+        raise ValueError("share_of must be one of the by dimensions.")
+
+    filters = filters or {}
+    keep = {
+        dim: [parse_level(levels[dim], value) for value in values]
+        for dim, values in filters.items()
+        if dim in levels
+    }
+    by_levels, weighted, counts = poll_cube.sum_cube(cube, by, keep)
+    if share_of is not None:
+        shares = poll_cube.share_within(weighted, by.index(share_of))
+
+    rows = []
+    for index in zip(*np.nonzero(counts)):
+        row = {dim: dim_levels[i] for dim, dim_levels, i in zip(by, by_levels, index)}
+        row["weight"] = round(float(weighted[index]), 3)
+        row["n"] = int(counts[index])
+        row["small_sample"] = row["n"] < MIN_RESPONDENTS
+        if share_of is not None:
+            row["share"] = round(float(shares[index]), 5)
+        rows.append(row)
+    return {"by": by, "filters": filters, "share_of": share_of, "rows": rows}
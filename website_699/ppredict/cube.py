@@ -0,0 +1,62 @@
+"""
+Reading and summing the crosstab cube of weighted respondent counts written by src/crosstab_cube.py.
+
+This module only needs numpy, so the breakdown view (crosstab.py) and the script's query share the same code without
+the site importing from src/.
+"""
+
+import json
+
+import numpy as np
+
+
+def load_cube(filepath):
+    """
+    Reads a cube written by crosstab_cube.save_cube.
+
+    The file holds arrays weighted and counts with one axis per dimension, and meta, a JSON string with dims (the axis
+    order) and levels (each dimension's levels, the last being None for missing).
+    """
+    with np.load(filepath) as npz:
+        meta = json.loads(str(npz["meta"]))
+        return {**meta, "weighted": npz["weighted"], "counts": npz["counts"]}
+
+
+def sum_cube(cube, by, filters=None, include_missing=False):
+    """
+    Sums the cube over every dimension not in by.
+
+    filters maps dimensions to the levels to keep, e.g. {"wave": ["monmouth_aug_2020"]}. The missing level of the by
+    dimensions is dropped unless include_missing is set. Returns the levels of each by dimension, and the weighted
+    sums and respondent counts with one axis per by dimension in the same order.
+    """
+    dims, levels = cube["dims"], cube["levels"]
+    unknown = (set(by) | set(filters or {})) - set(dims)
+    if unknown or not by or len(set(by)) != len(by):
+        raise ValueError(f"Invalid dimensions: {sorted(unknown) or by}")
+    weighted, counts = cube["weighted"], cube["counts"]
+    for dim, keep in (filters or {}).items():
+        axis = dims.index(dim)
+        index = [levels[dim].index(level) for level in keep if level in levels[dim]]
+        weighted = np.take(weighted, index, axis=axis)
+        counts = np.take(counts, index, axis=axis)
+
+    # Sum out every dimension not in by, then order the remaining axes as in by
+    kept = sorted(dims.index(dim) for dim in by)
+    other = tuple(axis for axis in range(len(dims)) if axis not in kept)
+    order = [kept.index(dims.index(dim)) for dim in by]
+    weighted = weighted.sum(axis=other).transpose(order)
+    counts = counts.sum(axis=other).transpose(order)
+    by_levels = [levels[dim] for dim in by]
+    if not include_missing:
+        # The last level of every dimension holds respondents with missing values
+        by_levels = [dim_levels[:-1] for dim_levels in by_levels]
+        weighted = weighted[tuple(slice(0, -1) for _ in by)]
+        counts = counts[tuple(slice(0, -1) for _ in by)]
+    return by_levels, weighted, counts
+
+
+def share_within(weighted, axis):
+    """Computes each cell's share of the weighted total along one axis, 0 where the total is 0."""
+    totals = weighted.sum(axis=axis, keepdims=True)
+    return np.divide(weighted, totals, out=np.zeros_like(weighted), where=totals > 0)
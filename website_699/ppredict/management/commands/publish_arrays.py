@@ -0,0 +1,82 @@
+from pathlib import Path
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from ppredict import shared_arrays
+from ppredict.results_cache import data_dir
+
+
+def default_sources():
+    return {
+        "post_strat": data_dir() / "post_stratification_data_by_state.csv",
+        "mrp_estimates": data_dir() / "new_prop_scores_include_harvard_FINAL.csv",
+    }
+
+
+def load_source(name, path):
+    """Reads a CSV (numeric and boolean columns only), .npy or .npz file into named arrays and their metadata."""
+    if path.suffix == ".npy":
+        return {name: np.load(path)}, {}
+    if path.suffix == ".npz":
+        with np.load(path) as npz:
+            arrays = {f"{name}.{key}": npz[key] for key in npz.files}
+        return arrays, {}
+    import pandas as pd
+
+    table = pd.read_csv(path).select_dtypes(["number", "bool"])
+    table = table.loc[:, ~table.columns.str.startswith("Unnamed")]
+    return {name: table.to_numpy(dtype=np.float64)}, {
+        name: {"columns": list(table.columns), "source": path.name}
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Publishes prediction arrays for all web workers and swaps them in atomically."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "sources",
+            nargs="*",
+            help="Arrays to publish as name=path (.csv, .npy or .npz). Defaults to the "
+            "post-stratification table and MRP subgroup estimates.",
+        )
+        parser.add_argument(
+            "--run-id", help="Identifier of the run (default: a timestamp)."
+        )
+        parser.add_argument(
+            "--keep",
+            type=int,
+            default=2,
+            help="Number of published runs to keep on disk.",
+        )
+
+    def handle(self, *args, **options):
+        sources = default_sources()
+        if options["sources"]:
+            sources = {}
+            for source in options["sources"]:
+                name, sep, path = source.partition("=")
+                if not sep or not name:
+                    raise CommandError(f"Expected name=path, got {source}")
+                sources[name] = Path(path)
+
+        arrays, meta = {}, {}
+        for name, path in sources.items():
+            if not path.is_file():
+                raise CommandError(f"No such file: {path}")
+            source_arrays, source_meta = load_source(name, path)
+            arrays.update(source_arrays)
+            meta.update(source_meta)
+
+        try:
+            run_id = shared_arrays.publish(
+                arrays, run_id=options["run_id"], meta=meta, keep=options["keep"]
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        for name, array in arrays.items():
+            self.stdout.write(f"{name}: {array.shape} {array.dtype}")
+        self.stdout.write(self.style.SUCCESS(f"Published run {run_id}"))
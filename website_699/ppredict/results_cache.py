@@ -0,0 +1,168 @@
+"""
+In-process cache of the model comparison data served by the ppredict API.
+
+Each dataset is built from the prediction and evaluation CSV files once, serialized to JSON and kept in memory together
+with an ETag and the modification times of its source files. Requests only stat the source files (at most once per
+CHECK_INTERVAL seconds) and rebuild the dataset when one of them has changed, so CSVs are never re-read per request.
+"""
+
+import asyncio
+import csv
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+REPO_DIR = Path(__file__).resolve().parents[2]
+
+# Minimum number of seconds between checks of the source files for changes
+CHECK_INTERVAL = 2.0
+
+_entries = {}
+_lock = threading.Lock()
+
+
+def data_dir():
+    return Path(getattr(settings, "PPREDICT_DATA_DIR", REPO_DIR / "data"))
+
+
+def output_dir():
+    return Path(getattr(settings, "PPREDICT_OUTPUT_DIR", REPO_DIR / "output"))
+
+
+def read_rows(path):
+    with open(path, newline="", encoding="utf-8-sig") as file_obj:
+        return list(csv.DictReader(file_obj))
+
+
+def to_float(value):
+    try:
+        return round(float(value), 5)
+    except (TypeError, ValueError):
+        return None
+
+
+def comparison_sources():
+    return {
+        "actual": data_dir() / "2020_electoral_results.csv",
+        "mrp": data_dir() / "final_pred_elec_2020_MRP.csv",
+        "ml": data_dir() / "final_pred_elec_ML_2020.csv",
+    }
+
+
+def accuracy_sources():
+    return {**comparison_sources(), "model_eval": output_dir() / "model_eval.csv"}
+
+
+def build_comparison(sources):
+    """Builds the state-by-state comparison of MRP and ML calls against the actual 2020 results."""
+    actual = {
+        row["State"]: int(row["trump"]) > int(row["biden"])
+        for row in read_rows(sources["actual"])
+        if row["State"] not in ("total", "notes")
+    }
+    models = {
+        name: {row["State"]: row for row in read_rows(sources[name])}
+        for name in ("mrp", "ml")
+    }
+    states = []
+    for state, trump_won in actual.items():
+        record = {"state": state, "actual_winner": int(trump_won)}
+        for name, rows in models.items():
+            row = rows.get(state)
+            pred = int(row["state_pred"]) if row else None
+            record[f"{name}_pred"] = pred
+            record[f"{name}_margin"] = to_float(row["margin_trump"]) if row else None
+            record[f"{name}_correct"] = pred == int(trump_won) if row else None
+        states.append(record)
+    return {"states": states}
+
+
+def build_accuracy(sources):
+    """Summarizes accuracy of each model, adding margin MSE when the evaluation output exists."""
+    states = build_comparison(sources)["states"]
+    summary = {}
+    for name in ("mrp", "ml"):
+        correct = sum(1 for state in states if state[f"{name}_correct"])
+        summary[name] = {
+            "accuracy": round(correct / len(states), 5) if states else None,
+            "states_correct": correct,
+            "total_states": len(states),
+            "mse": None,
+        }
+    if sources["model_eval"].exists():
+        for row in read_rows(sources["model_eval"])[:1]:
+            for name in summary:
+                summary[name]["mse"] = to_float(row.get(f"{name}_mse"))
+    return {"models": summary}
+
+
+DATASETS = {
+    "comparison": (comparison_sources, build_comparison),
+    "accuracy": (accuracy_sources, build_accuracy),
+}
+
+
+def source_mtimes(sources):
+    mtimes = {}
+    for name, path in sources.items():
+        try:
+            mtimes[name] = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            mtimes[name] = None
+    return mtimes
+
+
+def build_entry(name):
+    sources_func, build_func = DATASETS[name]
+    sources = sources_func()
+    mtimes = source_mtimes(sources)
+    payload = json.dumps(build_func(sources), separators=(",", ":")).encode("utf-8")
+    return {
+        "payload": payload,
+        "etag": f'"{hashlib.sha1(payload).hexdigest()}"',
+        "mtimes": mtimes,
+        "sources": sources,
+        "checked": time.monotonic(),
+    }
+
+
+def is_fresh(entry):
+    if time.monotonic() - entry["checked"] < CHECK_INTERVAL:
+        return True
+    entry["checked"] = time.monotonic()
+    return source_mtimes(entry["sources"]) == entry["mtimes"]
+
+
+def get(name):
+    """Returns the cached entry for a dataset, rebuilding it if its source files changed."""
+    entry = _entries.get(name)
+    if entry is not None and is_fresh(entry):
+        return entry
+    with _lock:
+        entry = _entries.get(name)
+        if entry is None or source_mtimes(entry["sources"]) != entry["mtimes"]:
+            entry = build_entry(name)
+            _entries[name] = entry
+        return entry
+
+
+async def aget(name):
+    """Async variant of get that moves rebuilds off the event loop."""
+    entry = _entries.get(name)
+    if entry is not None and is_fresh(entry):
+        return entry
+    return await asyncio.to_thread(get, name)
+
+
+def warm():
+    """Builds every dataset so the first requests are served from memory."""
+    for name in DATASETS:
+        try:
+            get(name)
+        except (OSError, KeyError, ValueError) as e:
+            print(f"Could not warm {name} results cache: {e}")
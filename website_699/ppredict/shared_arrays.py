@@ -0,0 +1,140 @@
+"""
+Prediction arrays (post-stratification cells, subgroup estimates, simulation draws) shared by every web worker.
+
+Arrays are published once per run as uncompressed .npy files in a run directory, and a CURRENT file names the run
+being served. Workers memory-map the current run read-only, so all workers share the same pages of the operating
+system's file cache and memory stays constant as the number of workers grows. Files rather than a shared memory
+segment are used so that no process has to own the segment and data survives worker restarts.
+
+Publishing writes the new run directory under a temporary name, renames it into place and then replaces CURRENT, so
+workers see either the old run or the new one in full. Workers notice the new run on their next lookup (checking at
+most once per CHECK_INTERVAL seconds) without restarting. Mappings of an old run stay readable after it is pruned, so
+requests that already hold it finish on consistent data.
+"""
+
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+from .results_cache import CHECK_INTERVAL, output_dir
+
+POINTER_NAME = "CURRENT"
+MANIFEST_NAME = "manifest.json"
+
+_current = {}
+_lock = threading.Lock()
+
+
+def array_dir():
+    return Path(getattr(settings, "PPREDICT_ARRAY_DIR", output_dir() / "arrays"))
+
+
+def new_run_id():
+    return f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+
+def write_pointer(root, run_id):
+    tmp_path = root / f".{POINTER_NAME}.{uuid.uuid4().hex}"
+    with open(tmp_path, "w", encoding="utf-8") as file_obj:
+        file_obj.write(run_id)
+        file_obj.flush()
+        os.fsync(file_obj.fileno())
+    os.replace(tmp_path, root / POINTER_NAME)
+
+
+def prune_runs(root, keep):
+    """Removes all but the newest keep runs, which always include the current one."""
+    runs = sorted(
+        (path for path in (root / "runs").iterdir() if not path.name.startswith(".")),
+        key=lambda path: path.stat().st_mtime_ns,
+        reverse=True,
+    )
+    for path in runs[keep:]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def publish(arrays, run_id=None, meta=None, keep=2):
+    """
+    Publishes arrays as a new run and makes it the one served.
+
+    meta maps array names to extra JSON-serializable details, e.g. the column names of a table. Returns the run id.
+    """
+    root = array_dir()
+    run_id = run_id or new_run_id()
+    run_dir = root / "runs" / run_id
+    if run_dir.exists():
+        raise ValueError(f"Run already published: {run_id}")
+    tmp_dir = root / "runs" / f".{run_id}.tmp"
+    tmp_dir.mkdir(parents=True)
+    try:
+        manifest = {"run": run_id, "published": time.time(), "arrays": {}}
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            if array.dtype.hasobject:
+                raise ValueError(f"Array {name} has an object dtype.")
+            np.save(tmp_dir / f"{name}.npy", array)
+            manifest["arrays"][name] = {
+                "shape": list(array.shape),
+                "dtype": array.dtype.str,
+                **(meta or {}).get(name, {}),
+            }
+        with open(tmp_dir / MANIFEST_NAME, "w", encoding="utf-8") as file_obj:
+            json.dump(manifest, file_obj)
+        os.rename(tmp_dir, run_dir)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    write_pointer(root, run_id)
+    prune_runs(root, max(keep, 1))
+    return run_id
+
+
+def read_pointer(root):
+    return (root / POINTER_NAME).read_text(encoding="utf-8").strip()
+
+
+def attach(root, run_id):
+    run_dir = root / "runs" / run_id
+    with open(run_dir / MANIFEST_NAME, encoding="utf-8") as file_obj:
+        manifest = json.load(file_obj)
+    arrays = {
+        name: np.load(run_dir / f"{name}.npy", mmap_mode="r")
+        for name in manifest["arrays"]
+    }
+    return {"run": run_id, "manifest": manifest, "arrays": arrays}
+
+
+def current():
+    """
+    Returns the run being served as a dict with its run id, manifest and read-only memory-mapped arrays.
+
+    Callers should look arrays up from one returned dict for the whole request, so a swap in between cannot mix runs.
+    Raises OSError when nothing has been published.
+    """
+    served = _current.get("served")
+    if served is not None and time.monotonic() - _current["checked"] < CHECK_INTERVAL:
+        return served
+    with _lock:
+        root = array_dir()
+        run_id = read_pointer(root)
+        served = _current.get("served")
+        if served is None or served["run"] != run_id:
+            served = attach(root, run_id)
+            _current["served"] = served
+        _current["checked"] = time.monotonic()
+        return served
+
+
+def get_array(name):
+    """Returns one read-only array of the run being served."""
+    arrays = current()["arrays"]
+    if name not in arrays:
+        raise KeyError(f"No array named {name} in the published run.")
+    return arrays[name]
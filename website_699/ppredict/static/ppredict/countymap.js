@@ -0,0 +1,125 @@
+// Draws county maps in the browser from pre-simplified TopoJSON (see src/county_geometry.py) and a per-run results feed.
+// Usage: <div class="county-map" data-levels="counties_960.json counties_1920.json counties_3840.json"
+//             data-feed="feeds/2024/reuters/counties.json"></div>
+// The smallest level at least as wide as the container (in device pixels) is loaded.
+// Not yet included in any template: the pipeline does not produce county results, so there is no county feed to draw.
+(function () {
+    var SVG_NS = "http://www.w3.org/2000/svg";
+    var COLORS = {1: "#3b4cc0", 0: "#b40426"};
+    var topologyCache = {};
+
+    function getJSON(url) {
+        if (!topologyCache[url]) {
+            topologyCache[url] = fetch(url).then(function (response) {
+                if (!response.ok) {
+                    throw new Error("Failed to load " + url);
+                }
+                return response.json();
+            });
+        }
+        return topologyCache[url];
+    }
+
+    function chooseLevel(container) {
+        var levels = container.getAttribute("data-levels").split(/\s+/);
+        var needed = container.clientWidth * (window.devicePixelRatio || 1);
+        for (var i = 0; i < levels.length; i++) {
+            var width = parseInt(levels[i].match(/_(\d+)\.json/)[1], 10);
+            if (width >= needed) {
+                return levels[i];
+            }
+        }
+        return levels[levels.length - 1];
+    }
+
+    // Arcs are delta-encoded; the transform of these files maps them straight to view box pixels
+    function decodeArcs(topology) {
+        return topology.arcs.map(function (arc) {
+            var x = 0, y = 0;
+            return arc.map(function (delta) {
+                x += delta[0];
+                y += delta[1];
+                return x + "," + y;
+            });
+        });
+    }
+
+    function arcPath(arcs, refs) {
+        var points = [];
+        refs.forEach(function (ref) {
+            var arc = ref >= 0 ? arcs[ref] : arcs[~ref].slice().reverse();
+            points = points.concat(points.length ? arc.slice(1) : arc);
+        });
+        return "M" + points.join("L");
+    }
+
+    function geometryPath(arcs, geometry) {
+        var polygons = geometry.type === "Polygon" ? [geometry.arcs] : geometry.arcs || [];
+        return polygons.map(function (rings) {
+            return rings.map(function (ring) {
+                return arcPath(arcs, ring) + "z";
+            }).join("");
+        }).join("");
+    }
+
+    function drawMap(container, topology, feed) {
+        var arcs = decodeArcs(topology);
+        var svg = document.createElementNS(SVG_NS, "svg");
+        svg.setAttribute("viewBox", topology.bbox.join(" "));
+        svg.setAttribute("role", "img");
+        svg.setAttribute("aria-label", container.getAttribute("data-label") || "County election map");
+        svg.classList.add("responsive-img");
+
+        topology.objects.counties.geometries.forEach(function (county) {
+            var result = feed.counties[county.id];
+            var shape = document.createElementNS(SVG_NS, "path");
+            shape.setAttribute("d", geometryPath(arcs, county));
+            shape.setAttribute("fill", result ? COLORS[result[0]] : "#cccccc");
+            shape.setAttribute("fill-rule", "evenodd");
+
+            var title = document.createElementNS(SVG_NS, "title");
+            title.textContent = county.properties.name;
+            if (result && result[1] !== null) {
+                title.textContent += " (margin " + (result[1] * 100).toFixed(1) + " pts)";
+            }
+            shape.appendChild(title);
+            svg.appendChild(shape);
+        });
+
+        var borders = document.createElementNS(SVG_NS, "path");
+        borders.setAttribute("d", topology.objects.state_borders.arcs.map(function (refs) {
+            return arcPath(arcs, refs);
+        }).join(""));
+        borders.setAttribute("fill", "none");
+        borders.setAttribute("stroke", "#ffffff");
+        svg.appendChild(borders);
+
+        topology.objects.labels.geometries.forEach(function (point) {
+            var label = document.createElementNS(SVG_NS, "text");
+            label.setAttribute("x", point.coordinates[0]);
+            label.setAttribute("y", point.coordinates[1]);
+            label.setAttribute("text-anchor", "middle");
+            label.setAttribute("dominant-baseline", "central");
+            label.setAttribute("font-size", "11");
+            label.textContent = point.properties.name;
+            svg.appendChild(label);
+        });
+
+        container.replaceChildren(svg);
+    }
+
+    document.addEventListener("DOMContentLoaded", function () {
+        document.querySelectorAll(".county-map[data-feed]").forEach(function (container) {
+            Promise.all([
+                getJSON(chooseLevel(container)),
+                fetch(container.getAttribute("data-feed")).then(function (response) {
+                    return response.json();
+                })
+            ]).then(function (data) {
+                drawMap(container, data[0], data[1]);
+            }).catch(function (error) {
+                console.error(error);
+            });
+        });
+    });
+})();
@@ -0,0 +1,69 @@
+// Draws hex maps in the browser from the shared hex geometry and a per-run results feed.
+// Usage: <div class="hex-map" data-geometry="hex_geometry.json" data-feed="feeds/2020/actual.json"></div>
+(function () {
+    var SVG_NS = "http://www.w3.org/2000/svg";
+    var COLORS = {1: "#3b4cc0", 0: "#b40426"};
+    var geometryCache = {};
+
+    function getJSON(url) {
+        if (!geometryCache[url]) {
+            geometryCache[url] = fetch(url).then(function (response) {
+                if (!response.ok) {
+                    throw new Error("Failed to load " + url);
+                }
+                return response.json();
+            });
+        }
+        return geometryCache[url];
+    }
+
+    function drawMap(container, geometry, feed) {
+        var svg = document.createElementNS(SVG_NS, "svg");
+        svg.setAttribute("viewBox", geometry.viewBox.join(" "));
+        svg.setAttribute("role", "img");
+        svg.setAttribute("aria-label", container.getAttribute("data-label") || "Election map");
+        svg.classList.add("responsive-img");
+
+        geometry.states.forEach(function (state) {
+            var result = feed.states[state.name];
+            var tile = document.createElementNS(SVG_NS, "path");
+            tile.setAttribute("d", state.d);
+            tile.setAttribute("fill", result ? COLORS[result[0]] : "#cccccc");
+            tile.setAttribute("stroke", "#ffffff");
+
+            var title = document.createElementNS(SVG_NS, "title");
+            title.textContent = state.id;
+            if (result && result[1] !== null) {
+                title.textContent += " (margin " + (result[1] * 100).toFixed(1) + " pts)";
+            }
+            tile.appendChild(title);
+            svg.appendChild(tile);
+
+            var label = document.createElementNS(SVG_NS, "text");
+            label.setAttribute("x", state.label[0]);
+            label.setAttribute("y", state.label[1]);
+            label.setAttribute("text-anchor", "middle");
+            label.setAttribute("dominant-baseline", "central");
+            label.setAttribute("font-size", "16");
+            label.textContent = state.id;
+            svg.appendChild(label);
+        });
+
+        container.replaceChildren(svg);
+    }
+
+    document.addEventListener("DOMContentLoaded", function () {
+        document.querySelectorAll(".hex-map[data-feed]").forEach(function (container) {
+            Promise.all([
+                getJSON(container.getAttribute("data-geometry")),
+                fetch(container.getAttribute("data-feed")).then(function (response) {
+                    return response.json();
+                })
+            ]).then(function (data) {
+                drawMap(container, data[0], data[1]);
+            }).catch(function (error) {
+                console.error(error);
+            });
+        });
+    });
+})();
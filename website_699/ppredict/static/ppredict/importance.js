@@ -0,0 +1,113 @@
+// Draws permutation importance bar charts in the browser from the importance feed (see src/permutation_importance.py).
+// Usage: <div class="importance-chart" data-feed="feeds/importance.json" data-model="random_forest"
+//             data-wave="monmouth_march_2020" data-top="10"></div>
+// Bars show the mean increase in log loss when a question's answers are shuffled; whiskers show its interval.
+(function () {
+    var SVG_NS = "http://www.w3.org/2000/svg";
+    var BAR_COLOR = "#800080";
+    var ROW_HEIGHT = 28;
+    var LABEL_WIDTH = 280;
+    var PLOT_WIDTH = 400;
+    var feedCache = {};
+
+    function getJSON(url) {
+        if (!feedCache[url]) {
+            feedCache[url] = fetch(url).then(function (response) {
+                if (!response.ok) {
+                    throw new Error("Failed to load " + url);
+                }
+                return response.json();
+            });
+        }
+        return feedCache[url];
+    }
+
+    function svgElement(name, attributes) {
+        var element = document.createElementNS(SVG_NS, name);
+        Object.keys(attributes).forEach(function (key) {
+            element.setAttribute(key, attributes[key]);
+        });
+        return element;
+    }
+
+    function findEntry(container, feed) {
+        var model = container.getAttribute("data-model");
+        var wave = container.getAttribute("data-wave");
+        return feed.models.filter(function (entry) {
+            return (!model || entry.model === model) && (!wave || entry.wave === wave);
+        })[0];
+    }
+
+    function drawChart(container, feed) {
+        var entry = findEntry(container, feed);
+        if (!entry) {
+            throw new Error("No importances for the requested model and wave");
+        }
+        var fields = feed.fields;
+        var rows = entry.features.slice(0, parseInt(container.getAttribute("data-top") || "10", 10)).map(function (row) {
+            var record = {};
+            fields.forEach(function (field, i) {
+                record[field] = row[i];
+            });
+            return record;
+        });
+        var maxValue = Math.max.apply(null, rows.map(function (row) {
+            return row.ci_high;
+        }).concat([1e-9]));
+        var scale = PLOT_WIDTH / maxValue;
+        var height = rows.length * ROW_HEIGHT;
+
+        var svg = svgElement("svg", {
+            viewBox: [0, 0, LABEL_WIDTH + PLOT_WIDTH + 10, height].join(" "),
+            role: "img",
+            "aria-label": container.getAttribute("data-label") || "Feature importance chart"
+        });
+        svg.classList.add("responsive-img");
+
+        rows.forEach(function (row, i) {
+            var y = i * ROW_HEIGHT;
+            var label = svgElement("text", {
+                x: LABEL_WIDTH - 8,
+                y: y + ROW_HEIGHT / 2,
+                "text-anchor": "end",
+                "dominant-baseline": "central",
+                "font-size": "14"
+            });
+            label.textContent = row.label;
+            svg.appendChild(label);
+
+            var bar = svgElement("rect", {
+                x: LABEL_WIDTH,
+                y: y + 4,
+                width: Math.max(row.importance, 0) * scale,
+                height: ROW_HEIGHT - 8,
+                fill: BAR_COLOR
+            });
+            var title = document.createElementNS(SVG_NS, "title");
+            title.textContent = row.label + ": " + row.importance.toFixed(3) + " (" + row.ci_low.toFixed(3) + " to "
+                + row.ci_high.toFixed(3) + ")";
+            bar.appendChild(title);
+            svg.appendChild(bar);
+
+            svg.appendChild(svgElement("line", {
+                x1: LABEL_WIDTH + Math.max(row.ci_low, 0) * scale,
+                x2: LABEL_WIDTH + Math.max(row.ci_high, 0) * scale,
+                y1: y + ROW_HEIGHT / 2,
+                y2: y + ROW_HEIGHT / 2,
+                stroke: "#000000"
+            }));
+        });
+
+        container.replaceChildren(svg);
+    }
+
+    document.addEventListener("DOMContentLoaded", function () {
+        document.querySelectorAll(".importance-chart[data-feed]").forEach(function (container) {
+            getJSON(container.getAttribute("data-feed")).then(function (feed) {
+                drawChart(container, feed);
+            }).catch(function (error) {
+                console.error(error);
+            });
+        });
+    });
+})();
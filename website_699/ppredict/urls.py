@@ -3,5 +3,8 @@ from . import views
 
 urlpatterns = [
     path("index/", views.index, name="index"),
+    path("api/breakdown/", views.poll_breakdown, name="poll_breakdown"),
+    path("api/<slug:dataset>/", views.model_data, name="model_data"),
+    path("feeds/<path:run_id>.json", views.results_feed, name="results_feed"),
     path("", views.home, name="home"),
 ]
@@ -1,5 +1,19 @@
+from pathlib import Path
+
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    HttpResponseNotModified,
+    JsonResponse,
+)
 from django.shortcuts import render
-from django.http import HttpResponse
+from django.views.decorators.http import require_safe
+
+from . import crosstab, results_cache
+
+# Per-run JSON results feeds for the client-side hex maps (see src/map_viz_gen.py)
+FEEDS_DIR = Path(__file__).resolve().parent / "feeds"
 
 
 def index(request):
@@ -8,3 +22,45 @@ def index(request):
 
 def home(request):
     return render(request, "ppredict/home.html")
+
+
+def results_feed(request, run_id):
+    feed_path = (FEEDS_DIR / f"{run_id}.json").resolve()
+    if FEEDS_DIR not in feed_path.parents or not feed_path.is_file():
+        raise Http404("No results feed for this run.")
+    return FileResponse(open(feed_path, "rb"), content_type="application/json")
+
+
+@require_safe
+async def model_data(request, dataset):
+    if dataset not in results_cache.DATASETS:
+        raise Http404("Unknown dataset.")
+    try:
+        entry = await results_cache.aget(dataset)
+    except OSError:
+        return HttpResponse(status=503)
+    if_none_match = request.headers.get("If-None-Match", "")
+    if entry["etag"] in [tag.strip() for tag in if_none_match.split(",")]:
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(entry["payload"], content_type="application/json")
+    response["ETag"] = entry["etag"]
+    response["Cache-Control"] = "public, max-age=30"
+    return response
+
+
+@require_safe
+def poll_breakdown(request):
+    params = request.GET.copy()
+    by = [dim for dim in params.pop("by", [""])[0].split(",") if dim]
+    share_of = params.pop("share_of", [None])[0]
+    filters = {dim: ",".join(values).split(",") for dim, values in params.lists()}
+    try:
+        data = crosstab.breakdown(by, filters, share_of)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    except OSError:
+        return HttpResponse(status=503)
+    response = JsonResponse(data)
+    response["Cache-Control"] = "public, max-age=300"
+    return response